@@ -0,0 +1,456 @@
+"""
+NumPy columnar snapshot of the expenses table for the CLI reports
+
+ColumnarSnapshot loads the expenses once into one NumPy array per column:
+row id, day number (days since 1970-01-01), month number (months since
+1970-01), category and description codes into string dictionaries,
+amount and amount in paise. The reports
+of reports.py are then answered with vectorized grouped reductions
+(bincount over codes, argpartition for the top rows) instead of SQL, and
+return the same rows as the SQL path:
+
+  - totals are added up in integer paise and divided by 100 at the end,
+    like the rollup tables
+  - rows of equal amount come out in descending id order, the order a
+    DESC walk of the amount index returns them in
+
+refresh() compares the database's change counter with the one read at
+the last load or refresh (rollups.change_counts()). If only inserts have
+happened since, it appends the rows with an id above the largest one
+loaded (ids are AUTOINCREMENT); if rows were updated, deleted or the
+rollups rebuilt, the snapshot is loaded again from scratch.
+
+Rows whose date is not a valid YYYY-MM-DD (see reports.VALID_DAY) can't
+be day numbers and are left out; invalid_date_rows() counts them so
+callers can say so.
+
+A snapshot can also be saved next to the database (expenses.db.columns)
+so a new process doesn't have to read the whole table again. The file is
+a fixed header, the category and description dictionaries as JSON, then
+each column as a fixed-width little-endian array:
+
+  header    magic, format version, row count, dictionary length, and
+            the database's change counter when the snapshot was read
+            (the source version, see rollups.change_count())
+  JSON      {"categories": [...], "descriptions": [...]}
+  columns   COLUMNS in order, each starting on a 64-byte boundary
+
+open_snapshot() maps the file with mmap and wraps the columns with
+np.frombuffer, so nothing is copied or parsed beyond the dictionaries.
+Every write to the expenses bumps the change counter, so a snapshot
+whose source version differs from the current counter is stale and is
+rebuilt and saved again. The file's size and modification time would
+miss a same-size commit within the filesystem's timestamp resolution.
+
+The snapshot needs NumPy, which the rest of the CLI doesn't; main.py
+only imports this module for --engine numpy.
+"""
+
+import itertools
+import json
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+
+import reports
+import rollups
+
+# Rows fetched from SQLite per batch while loading
+LOAD_CHUNK_SIZE = 100000
+
+# Rows turned into Python tuples at a time by iter_expenses_over_threshold()
+ROW_CHUNK_SIZE = 10000
+
+SNAPSHOT_SUFFIX = '.columns'
+SNAPSHOT_MAGIC = b'EXPCOLS\0'
+SNAPSHOT_FORMAT = 2
+# magic, format, row count, dictionary bytes, change counter of the database
+SNAPSHOT_HEADER = struct.Struct('<8sIQQQ')
+SNAPSHOT_ALIGNMENT = 64
+
+class ColumnarSnapshot:
+    """The expenses table as NumPy column arrays"""
+
+    COLUMNS = ('ids', 'days', 'months', 'category_codes', 'description_codes', 'amounts', 'paise')
+    DTYPES = ('<i8', '<i4', '<i4', '<i4', '<i4', '<f8', '<i8')
+
+    def __init__(self):
+        self.categories = []
+        self.descriptions = []
+        self._category_codes = {}
+        self._description_codes = {}
+        self.ids = np.empty(0, np.int64)
+        self.days = np.empty(0, np.int32)
+        self.months = np.empty(0, np.int32)
+        self.category_codes = np.empty(0, np.int32)
+        self.description_codes = np.empty(0, np.int32)
+        self.amounts = np.empty(0, np.float64)
+        self.paise = np.empty(0, np.int64)
+        # (changes, rewrites) of the change counter the columns match
+        self.version = None
+        # The mapped snapshot file the columns point into, if any
+        self.mapping = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def last_id(self):
+        return int(self.ids[-1]) if len(self.ids) else 0
+
+    def load(self, conn):
+        """Load every expense, replacing what was loaded before"""
+        self.__init__()
+        # Read before the rows, so a commit in between makes the next refresh look again
+        version = rollups.change_counts(conn)
+        self._append_rows(conn, 0)
+        self.version = version
+
+    def refresh(self, conn):
+        """Bring the snapshot up to date, returning the number of rows added or loaded"""
+        version = rollups.change_counts(conn)
+        if version == self.version:
+            return 0
+        if self.version is None or version[1] != self.version[1]:
+            self.load(conn)
+            return len(self)
+        added = self._append_rows(conn, self.last_id)
+        self.version = version
+        return added
+
+    def _append_rows(self, conn, after_id):
+        """Append the expenses with an id above after_id and a valid date"""
+        cursor = conn.execute(f'''
+            SELECT id, date, category, description, amount, CAST(round(amount * 100) AS INTEGER)
+            FROM expenses
+            WHERE id > ? AND {reports.VALID_DAY}
+            ORDER BY id
+        ''', (after_id,))
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+            if not rows:
+                break
+            ids, dates, categories, descriptions, amounts, paise = zip(*rows)
+            days = np.array(dates, 'datetime64[D]')
+            chunks.append((
+                np.array(ids, np.int64),
+                days.astype(np.int32),
+                days.astype('datetime64[M]').astype(np.int32),
+                self._encode(categories, self.categories, self._category_codes),
+                self._encode(descriptions, self.descriptions, self._description_codes),
+                np.array(amounts, np.float64),
+                np.array(paise, np.int64),
+            ))
+        if chunks:
+            for index, name in enumerate(self.COLUMNS):
+                setattr(self, name, np.concatenate([getattr(self, name)] + [chunk[index] for chunk in chunks]))
+        return sum(len(chunk[0]) for chunk in chunks)
+
+    @staticmethod
+    def _encode(values, dictionary, codes):
+        """Dictionary codes of a batch of strings, adding new strings to the dictionary"""
+        for value in sorted(set(values).difference(codes)):
+            codes[value] = len(dictionary)
+            dictionary.append(value)
+        return np.fromiter(map(codes.__getitem__, values), np.int32, len(values))
+
+    # Reports, returning the rows of the reports.py queries of the same name
+
+    def category_totals(self):
+        """(category, transactions, total, average) per category, largest total first"""
+        counts = np.bincount(self.category_codes, minlength=len(self.categories))
+        paise = self._paise_by(self.category_codes, len(self.categories))
+        rows = [(self.categories[code], int(counts[code]), int(paise[code]) / 100.0)
+                for code in np.nonzero(counts)[0]]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return [(category, count, total, total / count) for category, count, total in rows]
+
+    def monthly_totals(self):
+        """(YYYY-MM, transactions, total) per month, latest month first"""
+        if not len(self):
+            return []
+        first = int(self.months.min())
+        offsets = self.months - first
+        counts = np.bincount(offsets)
+        paise = self._paise_by(offsets, len(counts))
+        present = np.nonzero(counts)[0][::-1]
+        labels = np.datetime_as_string((present + first).astype('datetime64[M]'))
+        return [(label, int(counts[offset]), int(paise[offset]) / 100.0)
+                for label, offset in zip(labels.tolist(), present)]
+
+    def daily_totals(self, date_from=None, date_to=None):
+        """(YYYY-MM-DD, total) per day, optionally between two dates (inclusive)"""
+        days = self.days
+        paise_column = self.paise
+        if date_from and date_to:
+            selected = self._between(date_from, date_to)
+            days = days[selected]
+            paise_column = paise_column[selected]
+        if not len(days):
+            return []
+        first = int(days.min())
+        offsets = days - first
+        counts = np.bincount(offsets)
+        paise = self._paise_by(offsets, len(counts), paise_column)
+        present = np.nonzero(counts)[0]
+        labels = np.datetime_as_string((present + first).astype('datetime64[D]'))
+        return [(label, int(paise[offset]) / 100.0) for label, offset in zip(labels.tolist(), present)]
+
+    def biggest_expenses(self, limit=10):
+        """(date, category, description, amount) of the largest expenses"""
+        if limit <= 0 or not len(self):
+            return []
+        limit = min(limit, len(self))
+        candidates = np.argpartition(-self.amounts, limit - 1)[:limit]
+        # Ties with the smallest amount kept may sit outside the partition
+        candidates = np.nonzero(self.amounts >= self.amounts[candidates].min())[0]
+        return self._rows(self._by_amount(candidates)[:limit])
+
+    def expenses_over_threshold(self, threshold):
+        """(date, category, description, amount) of every expense above an amount, largest first"""
+        return self._rows(self._by_amount(np.nonzero(self.amounts > threshold)[0]))
+
+    def iter_expenses_over_threshold(self, threshold, chunk_size=ROW_CHUNK_SIZE):
+        """expenses_over_threshold() as an iterator, building chunk_size rows at a time
+
+        The matching positions are found and sorted right away; only the
+        rows themselves are built lazily.
+        """
+        positions = self._by_amount(np.nonzero(self.amounts > threshold)[0])
+        return itertools.chain.from_iterable(
+            self._rows(positions[start:start + chunk_size]) for start in range(0, len(positions), chunk_size))
+
+    def amount_stats(self, group='category'):
+        """(category or YYYY-MM, transactions, mean, standard deviation, min, max) per group, in group order"""
+        reports.check_group(group)
+        if not len(self):
+            return []
+        codes, labels = self._groups(group)
+        counts, paise, m2, minimum, maximum = self._group_stats(codes, len(labels))
+        rows = []
+        for code in sorted(np.nonzero(counts)[0].tolist(), key=labels.__getitem__):
+            count = int(counts[code])
+            std_dev = math.sqrt(m2[code] / (count - 1)) / 100.0 if count > 1 else 0.0
+            rows.append((labels[code], count, int(paise[code]) / 100.0 / count, std_dev,
+                         int(minimum[code]) / 100.0, int(maximum[code]) / 100.0))
+        return rows
+
+    def outliers(self, group='category', z_score=2.0, limit=None):
+        """Expenses more than z_score standard deviations from the mean of their group, furthest first
+
+        Rows are (date, category, description, amount, group mean, group
+        standard deviation, z-score).
+        """
+        reports.check_group(group)
+        if not len(self):
+            return []
+        codes, labels = self._groups(group)
+        counts, paise, m2, _, _ = self._group_stats(codes, len(labels))
+        means = paise / 100.0 / np.maximum(counts, 1)
+        std_devs = np.sqrt(m2 / np.maximum(counts - 1, 1)) / 100.0
+        row_means = means[codes]
+        row_std_devs = std_devs[codes]
+        spread = ((counts > 1) & (m2 > 0))[codes]
+        selected = np.nonzero(spread & (np.abs(self.amounts - row_means) > z_score * row_std_devs))[0]
+        scores = (self.amounts[selected] - row_means[selected]) / row_std_devs[selected]
+        order = np.lexsort((-self.ids[selected], -np.abs(scores)))[:limit]
+        positions = selected[order]
+        return [(*row, mean, std_dev, score) for row, mean, std_dev, score in zip(
+            self._rows(positions), row_means[positions].tolist(), row_std_devs[positions].tolist(),
+            scores[order].tolist())]
+
+    def top_per_group(self, group='month', limit=10):
+        """(group, rank, date, category, description, amount) of the limit largest expenses of every group
+
+        One sort by group, amount and id puts every group's rows in rank
+        order; the first limit of each group are kept.
+        """
+        reports.check_group(group, reports.TOP_GROUPS)
+        if limit <= 0 or not len(self):
+            return []
+        if group == 'month_category':
+            month_codes, months = self._groups('month')
+            codes = month_codes.astype(np.int64) * len(self.categories) + self.category_codes
+            labels = [f'{month} {category}' for month in months for category in self.categories]
+        else:
+            codes, labels = self._groups(group)
+        order = np.lexsort((-self.ids, -self.amounts, codes))
+        sorted_codes = codes[order]
+        starts = np.r_[0, np.nonzero(np.diff(sorted_codes))[0] + 1]
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        kept = ranks < limit
+        rows = [(labels[code], rank + 1, *row) for code, rank, row in zip(
+            sorted_codes[kept].tolist(), ranks[kept].tolist(), self._rows(order[kept]))]
+        rows.sort(key=lambda row: (row[0], row[1]))
+        return rows
+
+    def run_reports(self, names, threshold=100.0, limit=10, group='category', z_score=2.0):
+        """The same {name: rows} as reports.run_reports"""
+        unknown = [name for name in names if name not in reports.REPORTS]
+        if unknown:
+            raise ValueError(f"unknown report '{unknown[0]}', expected one of {', '.join(reports.REPORTS)}")
+        report_functions = {
+            'by_category': self.category_totals,
+            'monthly': self.monthly_totals,
+            'biggest': lambda: self.biggest_expenses(limit),
+            'over_threshold': lambda: self.expenses_over_threshold(threshold),
+            'amount_stats': lambda: self.amount_stats(group),
+            'outliers': lambda: self.outliers(group, z_score),
+            'top_per_group': lambda: self.top_per_group(group, limit),
+        }
+        return {name: report_functions[name]() for name in names}
+
+    def _paise_by(self, codes, length, paise=None):
+        """Exact paise totals per code (float64 sums are exact below 2**53 paise)"""
+        paise = self.paise if paise is None else paise
+        return np.bincount(codes, weights=paise, minlength=length).astype(np.int64)
+
+    def _between(self, date_from, date_to):
+        first, last = np.array([date_from, date_to], 'datetime64[D]').astype(np.int32)
+        return (self.days >= first) & (self.days <= last)
+
+    def _groups(self, group):
+        """(code of every row, label of every code) for a group of reports.GROUPS"""
+        if group == 'category':
+            return self.category_codes, self.categories
+        first = int(self.months.min())
+        offsets = self.months - first
+        months = np.arange(first, first + int(offsets.max()) + 1).astype('datetime64[M]')
+        return offsets, np.datetime_as_string(months).tolist()
+
+    def _group_stats(self, codes, length):
+        """Count, total paise, M2 (in paise²), min and max paise per code
+
+        M2 is found in two passes, the deviations from each group's mean
+        being known after the first.
+        """
+        counts = np.bincount(codes, minlength=length)
+        paise = self._paise_by(codes, length)
+        deviations = self.paise - (paise / np.maximum(counts, 1))[codes]
+        m2 = np.bincount(codes, weights=deviations * deviations, minlength=length)
+        minimum = np.full(length, np.iinfo(np.int64).max)
+        maximum = np.full(length, np.iinfo(np.int64).min)
+        np.minimum.at(minimum, codes, self.paise)
+        np.maximum.at(maximum, codes, self.paise)
+        return counts, paise, m2, minimum, maximum
+
+    def _by_amount(self, positions):
+        """Positions ordered by amount, then id, both descending"""
+        return positions[np.lexsort((-self.ids[positions], -self.amounts[positions]))]
+
+    def _rows(self, positions):
+        dates = np.datetime_as_string(self.days[positions].astype('datetime64[D]')).tolist()
+        return [(day, self.categories[category], self.descriptions[description], amount)
+                for day, category, description, amount in zip(
+                    dates, self.category_codes[positions].tolist(),
+                    self.description_codes[positions].tolist(), self.amounts[positions].tolist())]
+
+def invalid_date_rows(conn):
+    """Number of expenses left out of snapshots because their date is not a valid YYYY-MM-DD"""
+    return conn.execute(f'''
+        SELECT IFNULL(SUM(transaction_count), 0)
+        FROM daily_rollup
+        WHERE NOT ({reports.VALID_DAY})
+    ''').fetchone()[0]
+
+def snapshot_path(db_path):
+    """Where the columnar snapshot of a database is saved"""
+    return db_path + SNAPSHOT_SUFFIX
+
+def source_version(conn):
+    """The change counter of a database, which every write to the expenses bumps"""
+    return rollups.change_count(conn)
+
+def _aligned(offset):
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+def save_snapshot(snapshot, path, version):
+    """Write a snapshot to path, replacing any previous file atomically"""
+    dictionaries = json.dumps({'categories': snapshot.categories,
+                               'descriptions': snapshot.descriptions}).encode('utf-8')
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, len(snapshot),
+                                            len(dictionaries), version))
+            file.write(dictionaries)
+            for name, dtype in zip(ColumnarSnapshot.COLUMNS, ColumnarSnapshot.DTYPES):
+                file.write(b'\0' * (_aligned(file.tell()) - file.tell()))
+                file.write(getattr(snapshot, name).astype(dtype, copy=False).tobytes())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def open_snapshot(path):
+    """Map a snapshot file, returning (snapshot, source version), or None if it's missing or unreadable"""
+    try:
+        with open(path, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Missing, or empty (ValueError)
+        return None
+    if len(mapping) < SNAPSHOT_HEADER.size:
+        return None
+    magic, file_format, row_count, dictionary_size, version = SNAPSHOT_HEADER.unpack_from(mapping)
+    if magic != SNAPSHOT_MAGIC or file_format != SNAPSHOT_FORMAT:
+        return None
+
+    snapshot = ColumnarSnapshot()
+    offset = SNAPSHOT_HEADER.size
+    try:
+        dictionaries = json.loads(mapping[offset:offset + dictionary_size].decode('utf-8'))
+        offset += dictionary_size
+        for name, dtype in zip(ColumnarSnapshot.COLUMNS, ColumnarSnapshot.DTYPES):
+            offset = _aligned(offset)
+            column = np.frombuffer(mapping, dtype, row_count, offset)
+            setattr(snapshot, name, column)
+            offset += column.nbytes
+    except ValueError:
+        # Truncated file or damaged dictionaries
+        return None
+    snapshot.categories = dictionaries['categories']
+    snapshot.descriptions = dictionaries['descriptions']
+    snapshot._category_codes = {value: code for code, value in enumerate(snapshot.categories)}
+    snapshot._description_codes = {value: code for code, value in enumerate(snapshot.descriptions)}
+    snapshot.mapping = mapping
+    return snapshot, version
+
+def load_snapshot(conn, db_path):
+    """The snapshot of a database, mapped from its snapshot file, or rebuilt and saved if that is missing or stale
+
+    Returns (snapshot, rebuilt).
+    """
+    path = snapshot_path(db_path)
+    opened = open_snapshot(path)
+    if opened:
+        version = rollups.change_counts(conn)
+        if opened[1] == version[0]:
+            opened[0].version = version
+            return opened[0], False
+    # Unmap a stale file before replacing it
+    opened = None
+
+    snapshot = ColumnarSnapshot()
+    # Hold a read lock while loading, so no commit lands between reading
+    # the rows and recording the version they belong to
+    began = not conn.in_transaction
+    if began:
+        conn.execute('BEGIN')
+    try:
+        conn.execute('SELECT 1 FROM expenses LIMIT 1').fetchall()
+        snapshot.load(conn)
+    finally:
+        if began:
+            conn.execute('COMMIT')
+    try:
+        save_snapshot(snapshot, path, snapshot.version[0])
+    except OSError:
+        # Read-only directory, or the file is mapped by another process on
+        # Windows; the snapshot still serves this process
+        pass
+    return snapshot, True
@@ -0,0 +1,189 @@
+"""
+Background query execution for the Tk GUI
+
+QueryWorker runs database work on a worker thread with its own connection
+(see database.py), so the Tk main loop keeps drawing while SQLite works.
+Finished jobs are handed back on the main thread by polling a queue with
+root.after, since Tk must only be touched from the thread that runs it.
+
+Jobs are submitted on a named channel, e.g. one per chart. Submitting a
+new job on a channel supersedes the previous one: if that one hasn't
+started it is skipped, if it is running it is interrupted, and its result
+is dropped either way. cancel() does the same without a replacement.
+Running statements are stopped with Connection.interrupt() and, between
+SQLite VM steps, by a progress handler that checks the job's cancelled
+flag, so a cancel lands even when it races with the next statement.
+The same handler stops a job that outruns its time limit, and counts the
+VM steps each job takes as a rough measure of the work it did.
+"""
+
+import contextlib
+import queue
+import threading
+import time
+
+# How often the main loop checks for finished jobs
+POLL_INTERVAL_MS = 50
+
+# SQLite VM instructions between checks of the cancelled flag and time limit
+PROGRESS_STEPS = 10000
+
+class Job:
+    """A function of a connection to run on the worker thread"""
+
+    def __init__(self, channel, function, on_done, on_error, time_limit=None):
+        self.channel = channel
+        self.function = function
+        self.on_done = on_done
+        self.on_error = on_error
+        self.time_limit = time_limit
+        self.deadline = None
+        self.cancelled = False
+        self.timed_out = False
+        # VM steps taken, counted in multiples of PROGRESS_STEPS
+        self.steps = 0
+
+class QueryWorker:
+    """Runs jobs on a worker thread and calls back on the Tk main loop
+
+    on_busy(busy) is called on the main thread whenever the worker starts
+    or stops having jobs in flight, e.g. to show a busy indicator.
+    """
+
+    def __init__(self, root, db, on_busy=None):
+        self.root = root
+        self.db = db
+        self.on_busy = on_busy
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._latest = {}
+        self._in_flight = 0
+        self._running = None
+        self._conn = None
+        self._lock = threading.Lock()
+        # Set by set_profiler() while the GUI is profiling
+        self.profiler = None
+
+        self._thread = threading.Thread(target=self._work, name="query-worker", daemon=True)
+        self._thread.start()
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def submit(self, channel, function, on_done, on_error=None, time_limit=None):
+        """Run function(conn) in the background and pass its result to on_done
+
+        Replaces any job still pending or running on the same channel.
+        Exceptions go to on_error(exception) if given. With a time_limit in
+        seconds, a statement still running that long after the job started
+        is interrupted and the job's timed_out flag set.
+        """
+        self.cancel(channel)
+        job = Job(channel, function, on_done, on_error, time_limit)
+        self._latest[channel] = job
+        self._in_flight += 1
+        if self._in_flight == 1 and self.on_busy:
+            self.on_busy(True)
+        self._jobs.put(job)
+        return job
+
+    def submit_query(self, channel, sql, params=(), on_done=None, on_error=None):
+        """Run a query in the background and pass all of its rows to on_done
+
+        The rows come from the database's result cache while the data is
+        unchanged (see database.py), so they must not be modified.
+        """
+        return self.submit(channel, lambda conn: self.db.cached_query(sql, params, conn), on_done, on_error)
+
+    def cancel(self, channel=None):
+        """Cancel the latest job of a channel, or of every channel"""
+        channels = list(self._latest) if channel is None else [channel]
+        for name in channels:
+            job = self._latest.pop(name, None)
+            if job is None:
+                continue
+            job.cancelled = True
+            with self._lock:
+                if self._running is job:
+                    self._conn.interrupt()
+
+    def set_profiler(self, profiler):
+        """Time jobs and their callbacks with a profiling.Profiler, or stop with None
+
+        Jobs count as the query stage and on_done/on_error callbacks as
+        the format stage.
+        """
+        self.profiler = profiler
+        if profiler is not None and self._conn is not None:
+            # The worker's progress handler counts the VM steps for it
+            profiler.attach(self._conn, count_steps=False)
+
+    def is_busy(self):
+        return self._in_flight > 0
+
+    def _check_cancelled(self):
+        """Progress handler: a non-zero return aborts the running statement"""
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.add_steps(PROGRESS_STEPS)
+        job = self._running
+        if job is None:
+            return 0
+        job.steps += PROGRESS_STEPS
+        if job.deadline is not None and time.monotonic() > job.deadline:
+            job.timed_out = True
+            return 1
+        return 1 if job.cancelled else 0
+
+    def _work(self):
+        self._conn = self.db.connection()
+        self._conn.set_progress_handler(self._check_cancelled, PROGRESS_STEPS)
+        if self.profiler is not None:
+            self.profiler.attach(self._conn, count_steps=False)
+        while True:
+            job = self._jobs.get()
+            result = error = None
+            if not job.cancelled:
+                if job.time_limit is not None:
+                    job.deadline = time.monotonic() + job.time_limit
+                with self._lock:
+                    self._running = job
+                profiler = self.profiler
+                try:
+                    if profiler is None:
+                        result = job.function(self._conn)
+                    else:
+                        with profiler.stage("query"):
+                            result = job.function(self._conn)
+                except Exception as e:
+                    error = e
+                finally:
+                    with self._lock:
+                        self._running = None
+                    # Jobs only read; never leave a transaction open
+                    if self._conn.in_transaction:
+                        self._conn.rollback()
+            self._results.put((job, result, error))
+
+    def _poll(self):
+        """Deliver finished jobs on the main thread"""
+        # Reschedule first so an exception from a callback doesn't stop polling
+        self.root.after(POLL_INTERVAL_MS, self._poll)
+        while True:
+            try:
+                job, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._in_flight -= 1
+            if self._in_flight == 0 and self.on_busy:
+                self.on_busy(False)
+
+            # Drop results of cancelled or superseded jobs
+            if job.cancelled or self._latest.get(job.channel) is not job:
+                continue
+            del self._latest[job.channel]
+            with self.profiler.stage("format") if self.profiler else contextlib.nullcontext():
+                if error is None:
+                    job.on_done(result)
+                elif job.on_error:
+                    job.on_error(error)
+                else:
+                    raise error
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Personal Expense Tracker
+Usage examples:
+  python benchmark.py layouts
+  python benchmark.py layouts --rows 1000000
+  python benchmark.py charts --frames 100
+  python benchmark.py analytics --rows 1000000 10000000
+  python benchmark.py suite --scales 10000 1000000 --output baseline.json
+  python benchmark.py compare baseline.json current.json
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is left out there
+    resource = None
+
+import generate_data
+import schema
+from generate_data import generate_fake_expenses
+from main import ExpenseTracker, print_table
+
+# Rows generated per call to generate_fake_expenses
+GENERATE_CHUNK_SIZE = 100000
+
+def write_dataset(csv_path, num_rows):
+    """Write num_rows fake expenses to a CSV file without holding them all in memory"""
+    with open(csv_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['date', 'category', 'description', 'amount'])
+        writer.writeheader()
+        remaining = num_rows
+        while remaining > 0:
+            chunk = min(GENERATE_CHUNK_SIZE, remaining)
+            writer.writerows(generate_fake_expenses(chunk))
+            remaining -= chunk
+
+def database_size(db_path):
+    """Size of a database file in bytes"""
+    conn = sqlite3.connect(db_path)
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    conn.close()
+    return page_count * page_size
+
+def benchmark_layouts(args):
+    """Compare bulk insert throughput and file size of the storage layouts"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_path = os.path.join(work_dir, 'expenses.csv')
+        print(f"Generating {args.rows:,} rows...")
+        write_dataset(csv_path, args.rows)
+
+        results = []
+        for layout in schema.LAYOUTS:
+            db_path = os.path.join(work_dir, f'{layout}.db')
+            tracker = ExpenseTracker(db_path)
+            if layout != tracker.layout:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    tracker.migrate(layout)
+
+            print(f"Importing into the '{layout}' layout...")
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                tracker.import_csv(csv_path, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+
+            tracker.close()
+
+            results.append((layout, f"{elapsed:.2f}s", f"{args.rows / elapsed:,.0f}",
+                            f"{database_size(db_path) / 1e6:,.1f} MB"))
+
+    print_table(['Layout', 'Import time', 'Rows/s', 'File size'], results,
+                f'STORAGE LAYOUTS ({args.rows:,} ROWS)')
+
+def chart_updates(chart, frames):
+    """(labels, values, title) for frames consecutive parameter changes of a GUI chart"""
+    categories = ['Food', 'Transport', 'Shopping', 'Entertainment',
+                  'Utilities', 'Healthcare', 'Education', 'Travel']
+    descriptions = ['Coffee', 'Taxi', 'Electronics', 'Concert', 'Internet', 'Dental', 'Course fee', 'Flight',
+                    'Groceries', 'Hotel', 'Books', 'Train', 'Medicine', 'Gifts', 'Rental car']
+    for frame in range(frames):
+        month = f'{2024 + frame // 12 % 2}-{frame % 12 + 1:02d}'
+        if chart == 'daily_pattern':
+            dates = [f'{month}-{day:02d}' for day in range(1, 29)]
+            yield dates, [random.uniform(100, 50000) for _ in dates], f'Daily Spending Pattern ({month})'
+        elif chart == 'top_10':
+            # Different expenses top every month
+            yield (random.sample(descriptions, 10), sorted(random.uniform(5000, 50000) for _ in range(10)),
+                   f'Top 10 Expenses for {month}')
+        else:
+            yield categories, [random.uniform(1000, 500000) for _ in categories], f'Category Breakdown for {month}'
+
+def benchmark_charts(args):
+    """Compare frame times of redrawing GUI charts from scratch and updating them in place"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    import charts
+
+    results = []
+    for chart in ('category_pie', 'category_bar', 'monthly_category', 'top_10', 'daily_pattern'):
+        frame_times = {}
+        for reuse in (False, True):
+            figure = Figure(figsize=(8, 6))
+            view = charts.ChartView(figure, FigureCanvasAgg(figure), reuse=reuse)
+            # Same parameter changes for both modes
+            random.seed(chart)
+            times = []
+            for labels, values, title in chart_updates(chart, args.frames):
+                start = time.perf_counter()
+                # The Agg canvas draws right away in draw_idle()
+                view.show(chart, labels, values, title)
+                times.append(time.perf_counter() - start)
+            frame_times[reuse] = times
+
+        redraw, update = frame_times[False], frame_times[True]
+        results.append((chart,
+                        f"{statistics.mean(redraw) * 1000:.1f} ms", f"{statistics.mean(update) * 1000:.1f} ms",
+                        f"{statistics.median(update) * 1000:.1f} ms", f"{max(update) * 1000:.1f} ms",
+                        f"{statistics.mean(redraw) / statistics.mean(update):.1f}x"))
+
+    print_table(['Chart', 'Redraw', 'Update', 'Update median', 'Update max', 'Speedup'], results,
+                f'CHART FRAME TIMES ({args.frames} PARAMETER CHANGES)')
+
+# The aggregate reports computed from the expenses rows instead of the
+# rollup tables, the work the NumPy snapshot does
+SCAN_QUERIES = {
+    'by_category': '''
+        SELECT category, COUNT(*), SUM(CAST(round(amount * 100) AS INTEGER)) / 100.0
+        FROM expenses GROUP BY category
+    ''',
+    'monthly': '''
+        SELECT substr(date, 1, 7), COUNT(*), SUM(CAST(round(amount * 100) AS INTEGER)) / 100.0
+        FROM expenses GROUP BY 1
+    ''',
+    'daily': '''
+        SELECT date, SUM(CAST(round(amount * 100) AS INTEGER)) / 100.0
+        FROM expenses GROUP BY date
+    ''',
+    'amount_stats': '''
+        SELECT category, COUNT(*), AVG(amount), AVG(amount * amount) - AVG(amount) * AVG(amount),
+               MIN(amount), MAX(amount)
+        FROM expenses GROUP BY category
+    ''',
+}
+
+def same_rows(a, b):
+    """Whether two report results hold the same rows, floats being equal to within rounding
+
+    The standard deviations of the statistics tables are kept with
+    Welford's method and the snapshot's are found in two passes, so their
+    last bits may differ.
+    """
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same_rows(a[name], b[name]) for name in a)
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_rows(x, y) for x, y in zip(a, b))
+    return a == b
+
+def benchmark_analytics(args):
+    """Compare report latency of SQLite and the NumPy columnar snapshot, checking they agree
+
+    Also times loading the snapshot from SQLite, mapping it from its file
+    and refreshing it after an append.
+    """
+    import analytics
+    import reports
+
+    report_names = list(reports.REPORTS) + ['daily']
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in args.rows:
+            csv_path = os.path.join(work_dir, 'expenses.csv')
+            db_path = os.path.join(work_dir, f'{rows}.db')
+            print(f"Generating and importing {rows:,} rows...")
+            write_dataset(csv_path, rows)
+            tracker = ExpenseTracker(db_path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                tracker.import_csv(csv_path, batch_size=args.batch_size)
+            os.remove(csv_path)
+            conn = tracker.db.connection()
+
+            snapshot = analytics.ColumnarSnapshot()
+            start = time.perf_counter()
+            snapshot.load(conn)
+            load_time = time.perf_counter() - start
+
+            # Cold start from the snapshot file saved next to the database
+            snapshot_path = analytics.snapshot_path(db_path)
+            analytics.save_snapshot(snapshot, snapshot_path, analytics.source_version(conn))
+            start = time.perf_counter()
+            mapped, _ = analytics.open_snapshot(snapshot_path)
+            open_time = time.perf_counter() - start
+            mapped_matches = same_rows(mapped.run_reports(reports.REPORTS, args.threshold),
+                                       snapshot.run_reports(reports.REPORTS, args.threshold))
+            mapped = None
+
+            for name in report_names:
+                if name == 'daily':
+                    sql_report = lambda: conn.execute(*reports.daily_totals()).fetchall()
+                    numpy_report = snapshot.daily_totals
+                else:
+                    sql_report = lambda: reports.run_reports(conn, [name], args.threshold)
+                    numpy_report = lambda: snapshot.run_reports([name], args.threshold)
+                sql_time, sql_rows = timed(sql_report, args.repeat)
+                numpy_time, numpy_rows = timed(numpy_report, args.repeat)
+                scan_time = ''
+                if name in SCAN_QUERIES:
+                    scan_time = f"{timed(conn.execute(SCAN_QUERIES[name]).fetchall, 1)[0] * 1000:,.1f} ms"
+                results.append((f"{rows:,}", name, f"{sql_time * 1000:,.1f} ms", scan_time,
+                                f"{numpy_time * 1000:,.1f} ms",
+                                f"{sql_time / numpy_time:.1f}x", 'yes' if same_rows(sql_rows, numpy_rows) else 'NO'))
+
+            # Incremental refresh after appending a day's worth of rows
+            with tracker.db.transaction() as write_conn:
+                write_conn.executemany(
+                    'INSERT OR IGNORE INTO expenses (date, category, description, amount) VALUES (?, ?, ?, ?)',
+                    [(row['date'], row['category'], row['description'], row['amount'])
+                     for row in generate_fake_expenses(args.append)])
+            start = time.perf_counter()
+            added = snapshot.refresh(conn)
+            refresh_time = time.perf_counter() - start
+            matches = same_rows(snapshot.run_reports(reports.REPORTS, args.threshold),
+                                reports.run_reports(conn, reports.REPORTS, args.threshold))
+            results.append((f"{rows:,}", 'snapshot load', '', '', f"{load_time * 1000:,.1f} ms", '', ''))
+            results.append((f"{rows:,}", 'snapshot file open', '', '', f"{open_time * 1000:,.1f} ms", '',
+                            'yes' if mapped_matches else 'NO'))
+            results.append((f"{rows:,}", f'refresh (+{added:,} rows)', '', '', f"{refresh_time * 1000:,.1f} ms", '',
+                            'yes' if matches else 'NO'))
+            tracker.close()
+
+    print_table(['Rows', 'Report', 'SQLite', 'SQLite scan', 'NumPy', 'Speedup', 'Same rows'], results,
+                f'REPORT LATENCY (BEST OF {args.repeat}, THRESHOLD {args.threshold:,.0f})')
+
+def timed(function, repeat):
+    """Best time of repeat calls of function, and its result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+# Suite datasets are generated with a fixed seed and end date, so every
+# run of a scale benchmarks the same rows
+SUITE_SEED = 20240101
+SUITE_END_DATE = '2025-12-31'
+SUITE_MONTH = '2025-06'
+SUITE_DATE_RANGE = ('2025-03-01', '2025-05-31')
+# The GUI's defaults for its outliers and top N per group analyses
+SUITE_Z_SCORE = 2.0
+SUITE_OUTLIER_LIMIT = 15
+SUITE_TOP_PER_GROUP = 3
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a list of numbers"""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it can't be measured"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1e6 if sys.platform == 'darwin' else 1e3)
+
+def measure(scale, group, name, function, repeat, before=None):
+    """Time repeat calls of function, returning a suite result
+
+    before, if given, runs ahead of every call outside the timing. The
+    result's rows is the number of rows the last call returned.
+    """
+    times = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return {
+        'scale': scale, 'group': group, 'name': name, 'runs': repeat,
+        'rows': len(result) if isinstance(result, (list, tuple, dict)) else result,
+        'min_ms': min(times) * 1000, 'p50_ms': percentile(times, 0.5) * 1000,
+        'p90_ms': percentile(times, 0.9) * 1000, 'p99_ms': percentile(times, 0.99) * 1000,
+        'max_ms': max(times) * 1000, 'mean_ms': statistics.mean(times) * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def sql_file_queries(sql_path):
+    """(title, sql) of each statement of a SQL file, titled by the comment above it"""
+    queries = []
+    title = None
+    statement = []
+    with open(sql_path, encoding='utf-8') as file:
+        for line in file:
+            stripped = line.strip()
+            if stripped.startswith('--'):
+                title = title if statement else stripped.lstrip('- ')
+                continue
+            if stripped:
+                statement.append(line)
+            if stripped.endswith(';'):
+                queries.append((title or f'query {len(queries) + 1}', ''.join(statement)))
+                title = None
+                statement = []
+    return queries
+
+def count_rows(conn, sql, params=()):
+    """Run a query and count its rows without keeping them"""
+    return sum(1 for _ in conn.execute(sql, params))
+
+def suite_scale(work_dir, rows, args):
+    """Benchmark one dataset size, returning its suite results (run in a fresh process)"""
+    import downsampling
+    import paging
+    import reports
+
+    csv_path = os.path.join(work_dir, f'{rows}.csv')
+    db_path = os.path.join(work_dir, f'{rows}.db')
+    generate_data.stream_to_csv(
+        generate_data.chunk_tasks(rows, SUITE_SEED, generate_data.CHUNK_SIZE, SUITE_END_DATE, 0.0, 0.0),
+        csv_path)
+
+    results = []
+    tracker = ExpenseTracker(db_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results.append(measure(rows, 'import', 'import_csv',
+                               lambda: tracker.import_csv(csv_path, batch_size=args.batch_size), 1))
+    results[-1]['rows'] = rows
+    os.remove(csv_path)
+    conn = tracker.db.connection()
+    repeat = args.repeat
+
+    # ExpenseTracker's reports, bypassing the result cache
+    for name, function in [
+        ('get_category_totals', tracker.get_category_totals),
+        ('get_monthly_totals', tracker.get_monthly_totals),
+        ('get_biggest_expenses', tracker.get_biggest_expenses),
+        ('get_expenses_over_threshold', lambda: tracker.get_expenses_over_threshold(args.threshold)),
+        # Every outlier at 2 sigma is thousands of rows at scale, which would
+        # time the output rather than the query; get_outliers takes a limit
+        ('run_reports', lambda: tracker.run_reports([name for name in reports.REPORTS if name != 'outliers'],
+                                                    args.threshold)),
+        ('get_outliers', lambda: tracker.get_outliers('category', SUITE_Z_SCORE, SUITE_OUTLIER_LIMIT)),
+        ('get_top_per_group', lambda: tracker.get_top_per_group('month', SUITE_TOP_PER_GROUP)),
+    ]:
+        results.append(measure(rows, 'report', name, function, repeat, before=tracker.db.changed))
+
+    for title, sql in sql_file_queries(args.queries):
+        results.append(measure(rows, 'queries.sql', title, lambda: count_rows(conn, sql), repeat))
+
+    # The queries behind the GUI's views, without Tk
+    date_from, date_to = SUITE_DATE_RANGE
+    pager = paging.ExpensePager(tracker.db)
+    for name, function in [
+        ('visualizations', lambda: count_rows(conn, *reports.category_spending())),
+        ('monthly_category_analysis', lambda: count_rows(conn, *reports.category_spending(SUITE_MONTH))),
+        ('top_10_analysis', lambda: count_rows(conn, *reports.top_expenses(10))),
+        ('top_10_analysis (month)', lambda: count_rows(conn, *reports.top_expenses(10, SUITE_MONTH))),
+        ('daily_pattern_analysis', lambda: downsampling.daily_series(conn, None, None, 400)[1]),
+        ('daily_pattern_analysis (range)', lambda: downsampling.daily_series(conn, date_from, date_to, 400)[1]),
+        ('threshold_analysis', lambda: count_rows(conn, *reports.threshold_expenses(args.threshold))),
+        ('threshold_analysis (range)',
+         lambda: count_rows(conn, *reports.threshold_expenses(args.threshold, date_from, date_to))),
+        ('outliers_analysis',
+         lambda: count_rows(conn, *reports.outliers('category', SUITE_Z_SCORE, SUITE_OUTLIER_LIMIT))),
+        ('outliers_analysis (month)',
+         lambda: count_rows(conn, *reports.outliers('month', SUITE_Z_SCORE, SUITE_OUTLIER_LIMIT))),
+        ('top_per_group_analysis', lambda: len(reports.top_per_group(conn, 'category', SUITE_TOP_PER_GROUP))),
+        ('top_per_group_analysis (month & category)',
+         lambda: len(reports.top_per_group(conn, 'month_category', SUITE_TOP_PER_GROUP))),
+        ('all_expenses first page', lambda: pager.rows(0, 100)),
+        ('all_expenses middle page', lambda: pager.rows(pager.count() // 2, pager.count() // 2 + 100)),
+    ]:
+        results.append(measure(rows, 'gui', name, function, repeat, before=pager.reset))
+
+    tracker.close()
+    return results
+
+def benchmark_suite(args):
+    """Time the import, the reports, queries.sql and the GUI's queries at several dataset sizes, as JSON"""
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in args.scales:
+            print(f"Benchmarking {rows:,} rows...", file=sys.stderr)
+            # A fresh process per scale, so peak RSS belongs to that scale
+            with Pool(1) as pool:
+                results.extend(pool.apply(suite_scale, (work_dir, rows, args)))
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'scales': args.scales,
+        'repeat': args.repeat,
+        'threshold': args.threshold,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+        print_table(['Rows', 'Group', 'Benchmark', 'p50', 'p90', 'Peak RSS'],
+                    [(f"{result['scale']:,}", result['group'], result['name'], f"{result['p50_ms']:,.1f} ms",
+                      f"{result['p90_ms']:,.1f} ms",
+                      '' if result['peak_rss_mb'] is None else f"{result['peak_rss_mb']:,.0f} MB")
+                     for result in results],
+                    f'BENCHMARK SUITE (saved to {args.output})')
+    else:
+        print(text)
+
+def benchmark_compare(args):
+    """Compare two suite JSON files, exiting with status 1 if the second one regressed"""
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    with open(args.current, encoding='utf-8') as file:
+        current = json.load(file)
+
+    def key(result):
+        return result['scale'], result['group'], result['name']
+
+    baseline_results = {key(result): result for result in baseline['results']}
+    rows = []
+    regressions = 0
+    for result in current['results']:
+        previous = baseline_results.pop(key(result), None)
+        if previous is None:
+            rows.append((f"{result['scale']:,}", result['group'], result['name'], '',
+                         f"{result['p50_ms']:,.1f} ms", '', 'new'))
+            continue
+        before, after = previous['p50_ms'], result['p50_ms']
+        change = (after - before) / before if before else 0.0
+        slower = after - before > args.min_ms and change > args.tolerance
+        before_rss, after_rss = previous.get('peak_rss_mb'), result.get('peak_rss_mb')
+        more_memory = bool(before_rss and after_rss and (after_rss - before_rss) / before_rss > args.tolerance)
+        if slower:
+            status = 'REGRESSION'
+        elif more_memory:
+            status = 'REGRESSION (memory)'
+        elif before - after > args.min_ms and -change > args.tolerance:
+            status = 'faster'
+        else:
+            status = 'ok'
+        regressions += status.startswith('REGRESSION')
+        rows.append((f"{result['scale']:,}", result['group'], result['name'], f"{before:,.1f} ms",
+                     f"{after:,.1f} ms", f"{change:+.0%}", status))
+    for previous in baseline_results.values():
+        rows.append((f"{previous['scale']:,}", previous['group'], previous['name'],
+                     f"{previous['p50_ms']:,.1f} ms", '', '', 'missing'))
+
+    print_table(['Rows', 'Group', 'Benchmark', 'Baseline p50', 'Current p50', 'Change', 'Status'], rows,
+                f'BENCHMARK COMPARISON (TOLERANCE {args.tolerance:.0%}, {args.min_ms:g} MS)')
+    if regressions:
+        print(f"\n{regressions} regression(s)")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Expense tracker benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    layouts = subparsers.add_parser('layouts', help='Compare insert throughput and file size of the storage layouts')
+    layouts.add_argument('--rows', type=int, default=10000000,
+                         help='Number of rows to import (default: 10000000)')
+    layouts.add_argument('--batch_size', type=int, default=50000,
+                         help='Bulk import batch size (default: 50000)')
+    layouts.set_defaults(run=benchmark_layouts)
+
+    chart_parser = subparsers.add_parser('charts', help='Compare redrawing GUI charts with updating them in place')
+    chart_parser.add_argument('--frames', type=int, default=200,
+                              help='Number of parameter changes per chart (default: 200)')
+    chart_parser.set_defaults(run=benchmark_charts)
+
+    analytics_parser = subparsers.add_parser('analytics', help='Compare report latency of SQLite and the NumPy snapshot')
+    analytics_parser.add_argument('--rows', type=int, nargs='+', default=[1000000, 10000000],
+                                  help='Dataset sizes to benchmark (default: 1000000 10000000)')
+    analytics_parser.add_argument('--batch_size', type=int, default=50000,
+                                  help='Import batch size (default: 50000)')
+    analytics_parser.add_argument('--threshold', type=float, default=45000.0,
+                                  help='Threshold of the over_threshold report (default: 45000)')
+    analytics_parser.add_argument('--append', type=int, default=1000,
+                                  help='Rows appended before timing an incremental refresh (default: 1000)')
+    analytics_parser.add_argument('--repeat', type=int, default=3,
+                                  help='Runs per report, the best is reported (default: 3)')
+    analytics_parser.set_defaults(run=benchmark_analytics)
+
+    suite_parser = subparsers.add_parser('suite', help='Time import, reports, queries.sql and GUI queries as JSON')
+    suite_parser.add_argument('--scales', type=int, nargs='+', default=[10000, 1000000, 10000000],
+                              help='Dataset sizes to benchmark (default: 10000 1000000 10000000)')
+    suite_parser.add_argument('--repeat', type=int, default=5,
+                              help='Runs per query, for the percentiles (default: 5)')
+    suite_parser.add_argument('--batch_size', type=int, default=50000,
+                              help='Import batch size (default: 50000)')
+    suite_parser.add_argument('--threshold', type=float, default=45000.0,
+                              help='Threshold of the over threshold queries (default: 45000)')
+    suite_parser.add_argument('--queries', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                'queries.sql'),
+                              help='SQL file whose statements are timed (default: queries.sql)')
+    suite_parser.add_argument('--output',
+                              help='Write the JSON results to this file and print a summary (default: stdout)')
+    suite_parser.set_defaults(run=benchmark_suite)
+
+    compare_parser = subparsers.add_parser('compare', help='Flag regressions of a suite run against a baseline')
+    compare_parser.add_argument('baseline', help='JSON file of the baseline suite run')
+    compare_parser.add_argument('current', help='JSON file of the suite run to check')
+    compare_parser.add_argument('--tolerance', type=float, default=0.2,
+                                help='Relative slowdown or memory growth flagged as a regression (default: 0.2)')
+    compare_parser.add_argument('--min_ms', type=float, default=1.0,
+                                help='Ignore p50 differences smaller than this many ms (default: 1)')
+    compare_parser.set_defaults(run=benchmark_compare)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
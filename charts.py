@@ -0,0 +1,462 @@
+"""
+Charts for the GUI that are updated in place instead of redrawn from scratch
+
+Clearing an Axes and plotting again throws away every bar, wedge, label,
+legend and formatter and builds them anew, then re-runs the layout pass.
+A ChartView keeps one Axes per kind of chart it has shown (e.g. the pie
+and the bar chart of the Visualizations tab) and switches between them
+by toggling visibility. Showing new data on a chart of the same shape
+only moves the existing artists: bar widths or heights, wedge angles,
+line data and the text of labels, titles and legends. A chart is rebuilt
+only when its number of bars or wedges changes.
+
+The layout pass (tight_layout or a fixed subplots_adjust) is re-run only
+when the chart kind or its category labels change; otherwise the subplot
+parameters found last time for that chart are reused. Redraws go through
+canvas.draw_idle(), so a burst of updates paints once. Blitting is not
+used: new data rescales the value axis, which changes the background a
+blit would restore.
+
+CHARTS names the charts of the GUI, each a chart class and the keyword
+arguments styling it, which mirror the matplotlib calls the GUI made when
+it drew them with pyplot.
+"""
+
+import math
+from datetime import date
+
+from matplotlib import dates as mdates
+from matplotlib.ticker import FuncFormatter
+
+class BarChart:
+    """Bars with a value label each, vertical or horizontal
+
+    Labels and values are drawn in the order given, from left to right or
+    from bottom to top.
+    """
+
+    def __init__(self, ax, horizontal=False, colors=None, bar_options=None,
+                 value_format='₹{:.0f}', value_offset=0.01, value_options=None,
+                 title_options=None, xlabel=None, ylabel=None, axis_label_options=None,
+                 tick_options=(), axis_format=None, grid_options=None,
+                 limit_pad=None, open_spines=False):
+        self.ax = ax
+        self.horizontal = horizontal
+        self.colors = colors
+        self.bar_options = bar_options or {}
+        self.value_format = value_format
+        self.value_offset = value_offset
+        self.value_options = value_options or {'fontsize': 9, 'fontweight': 'bold'}
+        self.title_options = title_options or {'fontsize': 14, 'fontweight': 'bold', 'pad': 20}
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.axis_label_options = axis_label_options or {'fontsize': 12}
+        self.tick_options = tick_options
+        self.axis_format = axis_format
+        self.grid_options = grid_options
+        self.limit_pad = limit_pad
+        self.open_spines = open_spines
+        self.bars = []
+        self.value_labels = []
+        self.labels = None
+        self.title = None
+
+    def fits(self, labels, values):
+        return len(labels) == len(self.bars)
+
+    def draw(self, labels, values, title):
+        ax = self.ax
+        positions = range(len(values))
+        colors = self.colors[:len(values)] if isinstance(self.colors, list) else self.colors
+        if self.horizontal:
+            self.bars = list(ax.barh(positions, values, color=colors, **self.bar_options))
+        else:
+            self.bars = list(ax.bar(positions, values, color=colors, **self.bar_options))
+        self.value_labels = [ax.text(0, 0, '', **self._value_alignment(), **self.value_options)
+                             for _ in self.bars]
+
+        self.title = ax.set_title(title, **self.title_options)
+        if self.xlabel:
+            ax.set_xlabel(self.xlabel, **self.axis_label_options)
+        if self.ylabel:
+            ax.set_ylabel(self.ylabel, **self.axis_label_options)
+        for options in self.tick_options:
+            ax.tick_params(**options)
+        if self.axis_format:
+            value_axis = ax.xaxis if self.horizontal else ax.yaxis
+            value_axis.set_major_formatter(FuncFormatter(lambda x, p: self.axis_format.format(x)))
+        if self.grid_options:
+            ax.grid(**self.grid_options)
+            ax.set_axisbelow(True)
+        if self.open_spines:
+            ax.spines['top'].set_visible(False)
+            ax.spines['right'].set_visible(False)
+            ax.spines['left'].set_linewidth(1.2)
+            ax.spines['bottom'].set_linewidth(1.2)
+            ax.margins(y=0.02)
+
+        category_axis = ax.yaxis if self.horizontal else ax.xaxis
+        category_axis.set_ticks(positions)
+        self._set_labels(labels)
+        self._set_values(values)
+
+    def update(self, labels, values, title):
+        """Move the bars and labels to new values; True if the category labels changed"""
+        self.title.set_text(title)
+        changed = list(labels) != self.labels
+        if changed:
+            self._set_labels(labels)
+        self._set_values(values)
+        return changed
+
+    def _value_alignment(self):
+        if self.horizontal:
+            return {'ha': 'left', 'va': 'center'}
+        return {'ha': 'center', 'va': 'bottom'}
+
+    def _set_labels(self, labels):
+        self.labels = list(labels)
+        category_axis = self.ax.yaxis if self.horizontal else self.ax.xaxis
+        category_axis.set_ticklabels(self.labels)
+
+    def _set_values(self, values):
+        for bar, label, value in zip(self.bars, self.value_labels, values):
+            if self.horizontal:
+                bar.set_width(value)
+                label.set_position((value + value * self.value_offset, bar.get_y() + bar.get_height() / 2.))
+            else:
+                bar.set_height(value)
+                label.set_position((bar.get_x() + bar.get_width() / 2., value + value * self.value_offset))
+            label.set_text(self.value_format.format(value))
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+        if self.limit_pad and values:
+            if self.horizontal:
+                self.ax.set_xlim(0, max(values) * self.limit_pad)
+            else:
+                self.ax.set_ylim(0, max(values) * self.limit_pad)
+
+class PieChart:
+    """Pie with percentage labels and a legend of amounts"""
+
+    START_ANGLE = 90
+    LABEL_DISTANCE = 1.1
+    PCT_DISTANCE = 0.6
+
+    def __init__(self, ax, autopct='%1.1f%%', textprops=None, title_options=None,
+                 legend_format='{}: ₹{:.0f}', legend_options=None):
+        self.ax = ax
+        self.autopct = autopct
+        self.textprops = textprops or {'fontsize': 10}
+        self.title_options = title_options or {'fontsize': 14, 'fontweight': 'bold', 'pad': 20}
+        self.legend_format = legend_format
+        self.legend_options = legend_options or {}
+        self.wedges = []
+        self.texts = []
+        self.autotexts = []
+        self.legend = None
+        self.labels = None
+        self.title = None
+
+    def fits(self, labels, values):
+        return len(labels) == len(self.wedges)
+
+    def draw(self, labels, values, title):
+        self.wedges, self.texts, self.autotexts = self.ax.pie(
+            values, labels=labels, autopct=self.autopct, startangle=self.START_ANGLE,
+            labeldistance=self.LABEL_DISTANCE, pctdistance=self.PCT_DISTANCE, textprops=self.textprops)
+        for autotext in self.autotexts:
+            autotext.set_color('white')
+            autotext.set_fontweight('bold')
+        self.title = self.ax.set_title(title, **self.title_options)
+        self.legend = self.ax.legend(self.wedges, self._legend_labels(labels, values), **self.legend_options)
+        self.labels = list(labels)
+
+    def update(self, labels, values, title):
+        """Turn the wedges to new values the way Axes.pie lays them out; True if the labels changed"""
+        self.title.set_text(title)
+        total = sum(values)
+        theta1 = self.START_ANGLE / 360
+        for wedge, text, autotext, label, value in zip(self.wedges, self.texts, self.autotexts, labels, values):
+            fraction = value / total if total else 0
+            theta2 = theta1 + fraction
+            wedge.set_theta1(360 * theta1)
+            wedge.set_theta2(360 * theta2)
+            middle = math.pi * (theta1 + theta2)
+            x, y = wedge.center
+            label_x = x + self.LABEL_DISTANCE * wedge.r * math.cos(middle)
+            text.set_position((label_x, y + self.LABEL_DISTANCE * wedge.r * math.sin(middle)))
+            text.set_horizontalalignment('left' if label_x > 0 else 'right')
+            text.set_text(label)
+            autotext.set_position((x + self.PCT_DISTANCE * wedge.r * math.cos(middle),
+                                   y + self.PCT_DISTANCE * wedge.r * math.sin(middle)))
+            autotext.set_text(self.autopct % (100 * fraction))
+            theta1 = theta2
+
+        for legend_text, legend_label in zip(self.legend.get_texts(), self._legend_labels(labels, values)):
+            legend_text.set_text(legend_label)
+
+        changed = list(labels) != self.labels
+        self.labels = list(labels)
+        return changed
+
+    def _legend_labels(self, labels, values):
+        return [self.legend_format.format(label, value) for label, value in zip(labels, values)]
+
+class TimeSeriesChart:
+    """A line over (YYYY-MM-DD date, value) points on a date axis
+
+    The dates are positions on the x axis rather than tick labels, so the
+    chart can be zoomed and panned and new points for the visible window
+    dropped in without moving the view (see set_points).
+    """
+
+    def __init__(self, ax, line_options=None, title_options=None, ylabel=None,
+                 axis_label_options=None, tick_options=(), axis_format=None,
+                 grid_options=None, max_ticks=15):
+        self.ax = ax
+        self.line_options = line_options or {}
+        self.title_options = title_options or {'fontsize': 14, 'fontweight': 'bold', 'pad': 20}
+        self.ylabel = ylabel
+        self.axis_label_options = axis_label_options or {'fontsize': 12}
+        self.tick_options = tick_options
+        self.axis_format = axis_format
+        self.grid_options = grid_options
+        self.max_ticks = max_ticks
+        self.line = None
+        # No category labels: tick labels depend on the view, not the data
+        self.labels = []
+        self.title = None
+
+    def fits(self, labels, values):
+        return True
+
+    def draw(self, labels, values, title):
+        ax = self.ax
+        self.line, = ax.plot(self._dates(labels), values, **self.line_options)
+        self.title = ax.set_title(title, **self.title_options)
+        if self.ylabel:
+            ax.set_ylabel(self.ylabel, **self.axis_label_options)
+        for options in self.tick_options:
+            ax.tick_params(**options)
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator(maxticks=self.max_ticks))
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+        if self.axis_format:
+            ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: self.axis_format.format(x)))
+        if self.grid_options:
+            ax.grid(**self.grid_options)
+            ax.set_axisbelow(True)
+        # Settle the limits now rather than at the next draw
+        ax.autoscale_view()
+
+    def update(self, labels, values, title):
+        """Replace the line's points and fit the view to them"""
+        self.set_points(labels, values, title)
+        self.ax.autoscale_view()
+        return False
+
+    def set_points(self, labels, values, title):
+        """Replace the line's points, rescaling only the value axis"""
+        self.title.set_text(title)
+        self.line.set_data(self._dates(labels), values)
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+
+    def _dates(self, labels):
+        return mdates.date2num([date.fromisoformat(label) for label in labels])
+
+def visible_dates(ax):
+    """First and last YYYY-MM-DD date in view on a TimeSeriesChart's Axes"""
+    return tuple(mdates.num2date(limit).date().isoformat() for limit in ax.get_xlim())
+
+class MessageChart:
+    """A line of text in place of a chart"""
+
+    def __init__(self, ax, text_options=None):
+        self.ax = ax
+        self.text_options = text_options or {'fontsize': 12}
+        self.text = None
+        self.labels = None
+
+    def fits(self, labels, values):
+        return True
+
+    def draw(self, labels, values, title):
+        self.ax.set_axis_off()
+        self.text = self.ax.text(0.5, 0.5, title, ha='center', va='center',
+                                 transform=self.ax.transAxes, **self.text_options)
+        self.labels = []
+
+    def update(self, labels, values, title):
+        self.text.set_text(title)
+        return False
+
+BAR_COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3', '#54A0FF', '#5F27CD']
+
+CHARTS = {
+    'category_pie': (PieChart, {
+        'legend_options': {'title': "Categories", 'loc': "center left",
+                           'bbox_to_anchor': (1, 0, 0.5, 1), 'fontsize': 9},
+    }),
+    'category_bar': (BarChart, {
+        'horizontal': True,
+        'colors': BAR_COLORS,
+        'bar_options': {'height': 0.6, 'edgecolor': 'white', 'linewidth': 1.2},
+        'value_format': '₹{:,.0f}',
+        'value_offset': 0.02,
+        'value_options': {'fontsize': 11, 'fontweight': 'bold', 'color': 'black'},
+        'title_options': {'fontsize': 16, 'fontweight': 'bold', 'pad': 25},
+        'xlabel': 'Amount (₹)',
+        'ylabel': 'Categories',
+        'axis_label_options': {'fontsize': 14, 'fontweight': 'bold'},
+        'tick_options': [{'axis': 'y', 'labelsize': 12}, {'axis': 'x', 'labelsize': 11}],
+        'axis_format': '₹{:,.0f}',
+        'grid_options': {'axis': 'x', 'alpha': 0.3, 'linestyle': '--', 'linewidth': 0.8},
+        'limit_pad': 1.15,
+        'open_spines': True,
+    }),
+    'monthly_category': (BarChart, {
+        'colors': BAR_COLORS[:6],
+        'xlabel': 'Categories',
+        'ylabel': 'Amount (₹)',
+        'tick_options': [{'axis': 'x', 'rotation': 45, 'labelsize': 10}],
+        'axis_format': '₹{:.0f}',
+        'grid_options': {'axis': 'y', 'alpha': 0.3, 'linestyle': '--'},
+    }),
+    'top_10': (BarChart, {
+        'horizontal': True,
+        'colors': 'orange',
+        'bar_options': {'alpha': 0.8},
+        'xlabel': 'Amount (₹)',
+        'tick_options': [{'axis': 'both', 'labelsize': 10}],
+        'grid_options': {'axis': 'x', 'alpha': 0.3, 'linestyle': '--'},
+    }),
+    'daily_pattern': (TimeSeriesChart, {
+        'line_options': {'marker': 'o', 'linewidth': 2, 'markersize': 6, 'color': '#4ECDC4',
+                         'markerfacecolor': '#FF6B6B', 'markeredgecolor': 'white', 'markeredgewidth': 2},
+        'ylabel': 'Amount (₹)',
+        'tick_options': [{'axis': 'x', 'rotation': 45, 'labelsize': 9}, {'axis': 'y', 'labelsize': 10}],
+        'axis_format': '₹{:.0f}',
+        'grid_options': {'visible': True, 'alpha': 0.3, 'linestyle': '--'},
+    }),
+    'threshold': (BarChart, {
+        'horizontal': True,
+        'colors': 'red',
+        'bar_options': {'alpha': 0.7},
+        'xlabel': 'Amount (₹)',
+        'tick_options': [{'axis': 'both', 'labelsize': 10}],
+        'grid_options': {'axis': 'x', 'alpha': 0.3, 'linestyle': '--'},
+    }),
+    'outliers': (BarChart, {
+        'horizontal': True,
+        'colors': 'purple',
+        'bar_options': {'alpha': 0.7},
+        'value_format': '{:+.2f}σ',
+        'xlabel': 'Standard deviations from the group mean',
+        'tick_options': [{'axis': 'both', 'labelsize': 10}],
+        'grid_options': {'axis': 'x', 'alpha': 0.3, 'linestyle': '--'},
+    }),
+    'top_per_group': (BarChart, {
+        'horizontal': True,
+        'colors': 'teal',
+        'bar_options': {'alpha': 0.7},
+        'xlabel': 'Amount (₹)',
+        'tick_options': [{'axis': 'y', 'labelsize': 8}],
+        'grid_options': {'axis': 'x', 'alpha': 0.3, 'linestyle': '--'},
+    }),
+}
+
+class ChartView:
+    """The charts of one figure, each on its own Axes, updated in place
+
+    layout(figure) is the layout pass, tight_layout by default. With reuse
+    off every show() clears the chart and lays it out again, as plotting
+    with pyplot did; the benchmark uses that as its baseline.
+    """
+
+    MESSAGE = 'message'
+
+    def __init__(self, figure, canvas, layout=None, charts=CHARTS, reuse=True):
+        self.figure = figure
+        self.canvas = canvas
+        self.layout = layout or (lambda figure: figure.tight_layout())
+        self.charts = charts
+        self.reuse = reuse
+        self._charts = {}
+        self._layouts = {}
+        self._shown = None
+        self._callbacks = []
+        self._updating = False
+
+    def show(self, key, labels, values, title):
+        """Show labels and values as the chart named key in charts"""
+        ax, chart = self._charts.get(key, (None, None))
+        if ax is None:
+            ax = self.figure.add_subplot(111)
+        self._updating = True
+        try:
+            if chart is not None and self.reuse and chart.fits(labels, values):
+                labels_changed = chart.update(labels, values, title)
+            else:
+                # Clearing the Axes drops its callbacks too
+                ax.clear()
+                self._connect(key, ax)
+                chart_class, style = (MessageChart, {}) if key == self.MESSAGE else self.charts[key]
+                chart = chart_class(ax, **style)
+                chart.draw(labels, values, title)
+                labels_changed = True
+        finally:
+            self._updating = False
+        self._charts[key] = (ax, chart)
+
+        for other_key, (other_ax, _) in self._charts.items():
+            other_ax.set_visible(other_key == key)
+
+        # Lay out again only if what surrounds the plot may have changed size
+        layout_key = (key, tuple(chart.labels))
+        saved = self._layouts.get(key)
+        if not self.reuse or labels_changed or saved is None or saved[0] != layout_key:
+            self.layout(self.figure)
+            self._layouts[key] = (layout_key, self._subplot_params())
+        elif key != self._shown:
+            self.figure.subplots_adjust(**saved[1])
+        self._shown = key
+
+        if self.reuse:
+            self.canvas.draw_idle()
+        else:
+            self.canvas.draw()
+
+    def set_points(self, key, labels, values, title):
+        """Replace the points of a shown time series without moving its view, e.g. after a zoom"""
+        ax, chart = self._charts[key]
+        self._updating = True
+        try:
+            chart.set_points(labels, values, title)
+        finally:
+            self._updating = False
+        self.canvas.draw_idle()
+
+    def connect(self, key, signal, callback):
+        """Call callback(ax) on an Axes signal of chart key, e.g. 'xlim_changed' after a zoom
+
+        Changes made by show() itself don't count.
+        """
+        self._callbacks.append((key, signal, callback))
+        ax, _ = self._charts.get(key, (None, None))
+        if ax is not None:
+            self._connect(key, ax, [(key, signal, callback)])
+
+    def _connect(self, key, ax, callbacks=None):
+        for callback_key, signal, callback in callbacks or self._callbacks:
+            if callback_key == key:
+                ax.callbacks.connect(signal, lambda ax, callback=callback: None if self._updating else callback(ax))
+
+    def show_message(self, message):
+        """Show a line of text in place of the chart"""
+        self.show(self.MESSAGE, [], [], message)
+
+    def _subplot_params(self):
+        params = self.figure.subplotpars
+        return {name: getattr(params, name) for name in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')}
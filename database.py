@@ -0,0 +1,310 @@
+"""
+Shared SQLite access for the Personal Expense Tracker
+
+main.py and gui_app.py both go through a Database instead of opening a
+connection per query. Each thread gets one long-lived connection, opened
+on first use with a larger statement cache, a bigger page cache and
+memory-mapped I/O, so the pages and prepared statements of one query are
+still there for the next. It also has the SQL functions of
+schema.register_functions(), which the fingerprint layout's generated
+column calls on every write. transaction() wraps writes in BEGIN ... COMMIT
+and rolls back on error.
+
+cached_query() and cached() keep the results of read-only queries in a
+ResultCache shared by all threads, so re-running a report or redrawing a
+chart on unchanged data costs a dictionary lookup. Every entry is tagged
+with the database's change counter, and anything that may have changed
+the data bumps it:
+
+  - changed(), called by transaction() on commit and by the importer
+  - a new PRAGMA data_version on the connection, i.e. a commit by any
+    other connection, in this process or another
+  - a new total_changes on the connection, i.e. a write on the
+    connection itself that didn't go through transaction()
+
+stats() reports how many connections were opened, how often a statement
+was found in the statement cache and how the result cache fared. Python's
+sqlite3 doesn't expose its statement cache, so every connection keeps an
+LRU of the same size over the SQL text it runs and counts hits against
+that.
+"""
+
+import contextlib
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+
+import schema
+
+# Prepared statements kept per connection (sqlite3's default is 128)
+CACHED_STATEMENTS = 256
+
+# Memory the result cache may hold, estimated with sys.getsizeof
+RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# PRAGMAs set on every new connection
+CONNECTION_PRAGMAS = {
+    'cache_size': -65536,  # 64 MiB
+    'mmap_size': 268435456,  # 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+class TrackedCursor(sqlite3.Cursor):
+    """Cursor that reports the SQL it runs to its connection"""
+
+    def execute(self, sql, parameters=()):
+        self.connection.statement_used(sql)
+        super().execute(sql, parameters)
+        if self.description is None and self.connection.statement_finished:
+            self.connection.statement_finished()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.connection.statement_used(sql)
+        super().executemany(sql, seq_of_parameters)
+        if self.connection.statement_finished:
+            self.connection.statement_finished()
+        return self
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self.connection.statement_finished:
+            self.connection.statement_finished()
+        return rows
+
+class TrackedConnection(sqlite3.Connection):
+    """Connection that counts statement cache hits and misses"""
+
+    def __init__(self, *args, cached_statements=CACHED_STATEMENTS, **kwargs):
+        super().__init__(*args, cached_statements=cached_statements, **kwargs)
+        self.cached_statements = cached_statements
+        self.recent_statements = OrderedDict()
+        self.statement_hits = 0
+        self.statement_misses = 0
+        # (data_version, total_changes) when the result cache last checked
+        self.change_signature = None
+        # Called when a statement is known to be done: it returned no rows
+        # or they were all fetched (set by profiling.Profiler)
+        self.statement_finished = None
+
+    def cursor(self, factory=TrackedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def statement_used(self, sql):
+        """Record a statement, counting a hit if it is still in the cache"""
+        if sql in self.recent_statements:
+            self.recent_statements.move_to_end(sql)
+            self.statement_hits += 1
+            return
+        self.statement_misses += 1
+        self.recent_statements[sql] = True
+        if len(self.recent_statements) > self.cached_statements:
+            self.recent_statements.popitem(last=False)
+
+def result_size(value):
+    """Rough size in bytes of a result: rows, lists and dicts of them, and their values"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return size
+    return size + sum(result_size(item) for item in value)
+
+class ResultCache:
+    """LRU of query results limited by their estimated size in bytes
+
+    Entries are stored with the change counter they were computed under.
+    Looking one up under a newer counter drops every entry, since all of
+    them are at least that old.
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """Return the cached result for key, or None"""
+        with self._lock:
+            self._expire(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, version):
+        """Cache a result computed under a change counter, unless it's already out of date"""
+        size = result_size(result)
+        with self._lock:
+            self._expire(version)
+            if version != self._version or size > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _expire(self, version):
+        """Drop every entry if the data changed since they were cached"""
+        if self._version is None or version > self._version:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'result_cache_entries': len(self._entries),
+                'result_cache_bytes': self._bytes,
+                'result_cache_hits': self.hits,
+                'result_cache_misses': self.misses,
+                'result_cache_hit_rate': self.hits / lookups if lookups else 0.0,
+                'result_cache_evictions': self.evictions,
+                'result_cache_invalidations': self.invalidations,
+            }
+
+class Database:
+    """Long-lived, per-thread connections to one SQLite database"""
+
+    def __init__(self, db_path, cached_statements=CACHED_STATEMENTS, pragmas=None,
+                 result_cache_bytes=RESULT_CACHE_BYTES):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.pragmas = CONNECTION_PRAGMAS if pragmas is None else pragmas
+        self.result_cache = ResultCache(result_cache_bytes)
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._connections_opened = 0
+        self._closed_counts = (0, 0)
+        self._change_count = 0
+
+    def connection(self):
+        """Return the calling thread's connection, opening it on first use"""
+        thread_id = threading.get_ident()
+        conn = self._connections.get(thread_id)
+        if conn is None:
+            # check_same_thread is off so close() can close every thread's
+            # connection; otherwise each one is only used by its own thread
+            conn = sqlite3.connect(self.db_path, factory=TrackedConnection,
+                                   cached_statements=self.cached_statements,
+                                   check_same_thread=False)
+            for name, value in self.pragmas.items():
+                conn.execute(f'PRAGMA {name} = {value}')
+            schema.register_functions(conn)
+            with self._lock:
+                self._connections[thread_id] = conn
+                self._connections_opened += 1
+        return conn
+
+    def execute(self, sql, params=()):
+        """Run a statement on the calling thread's connection and return the cursor"""
+        return self.connection().execute(sql, params)
+
+    def query(self, sql, params=()):
+        """Run a query and return all of its rows"""
+        return self.execute(sql, params).fetchall()
+
+    def cached_query(self, sql, params=(), conn=None):
+        """Like query(), but served from the result cache while the data is unchanged
+
+        The rows are shared with later callers and must not be modified.
+        conn defaults to the calling thread's connection.
+        """
+        key = (' '.join(sql.split()), tuple(params))
+        return self.cached(key, lambda conn: conn.execute(sql, params).fetchall(), conn)
+
+    def cached(self, key, compute, conn=None):
+        """Return compute(conn), reusing the result cached under key while the data is unchanged"""
+        conn = conn or self.connection()
+        version = self.change_count(conn)
+        result = self.result_cache.get(key, version)
+        if result is None:
+            result = compute(conn)
+            self.result_cache.put(key, result, version)
+        return result
+
+    def change_count(self, conn=None):
+        """The change counter, first bumped if conn saw a change since it was last asked"""
+        conn = conn or self.connection()
+        signature = (conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes)
+        # A connection seen for the first time may be looking at data
+        # newer than the cache, so that counts as a change too
+        if signature != conn.change_signature:
+            self.changed()
+            conn.change_signature = signature
+        return self._change_count
+
+    def changed(self):
+        """Note that the data may have changed, invalidating cached results"""
+        with self._lock:
+            self._change_count += 1
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Run the with block in a transaction, committing on success and rolling back on error
+
+        An implicit transaction already opened by an earlier write on the
+        same connection is carried on rather than nested.
+        """
+        conn = self.connection()
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        self.changed()
+
+    def stats(self):
+        """Connection, statement cache and result cache counters"""
+        with self._lock:
+            connections = list(self._connections.values())
+            opened = self._connections_opened
+            hits, misses = self._closed_counts
+        hits += sum(conn.statement_hits for conn in connections)
+        misses += sum(conn.statement_misses for conn in connections)
+        return {
+            'connections_opened': opened,
+            'connections_open': len(connections),
+            'statements': hits + misses,
+            'statement_cache_hits': hits,
+            'statement_cache_misses': misses,
+            'statement_cache_hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            **self.result_cache.stats(),
+        }
+
+    def close(self):
+        """Close every connection; the next query opens a new one"""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+            hits, misses = self._closed_counts
+            self._closed_counts = (hits + sum(conn.statement_hits for conn in connections),
+                                   misses + sum(conn.statement_misses for conn in connections))
+        for conn in connections:
+            conn.close()
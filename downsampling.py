@@ -0,0 +1,85 @@
+"""
+Downsampling of the GUI's Daily Spending Pattern to what the chart can show
+
+A multi-year range has thousands of days, far more points than the chart
+has pixels for, and every one of them costs a marker. daily_series()
+picks the finest period (day, week or month) whose points fit a budget,
+normally the plot's width in pixels divided by a few pixels per point,
+and adds up the daily rollup in SQL at that period. If even months don't
+fit, the monthly series is thinned to the budget with
+Largest-Triangle-Three-Buckets, which keeps the points that shape the
+line: spikes survive where averaging or striding would drop them.
+
+The GUI calls daily_series() again for the visible window when the user
+zooms or pans, so zooming in brings back full daily resolution for just
+that window.
+"""
+
+from datetime import date
+
+import reports
+
+# Rough number of days per period, for estimating point counts
+PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 30.44}
+
+def choose_period(first_day, last_day, max_points):
+    """The finest of day, week and month with at most max_points points between two dates"""
+    days = (date.fromisoformat(last_day) - date.fromisoformat(first_day)).days + 1
+    for period, period_days in PERIOD_DAYS.items():
+        if days / period_days <= max_points:
+            return period
+    return 'month'
+
+def lttb(rows, max_points):
+    """Largest-Triangle-Three-Buckets: max_points of the (date, total) rows that best keep the line's shape
+
+    The first and last rows are always kept. Between them the rows are
+    split into max_points - 2 buckets, and from each bucket the row forming
+    the largest triangle with the row kept before it and the average of the
+    next bucket is kept.
+    """
+    if max_points >= len(rows) or max_points < 3:
+        return list(rows)
+
+    xs = [date.fromisoformat(row[0]).toordinal() for row in rows]
+    ys = [row[1] for row in rows]
+    bucket_size = (len(rows) - 2) / (max_points - 2)
+
+    kept = [rows[0]]
+    previous = 0
+    for bucket in range(max_points - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        # Average of the next bucket (the last row for the final bucket)
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, len(rows))
+        if next_start >= next_end:
+            next_start, next_end = len(rows) - 1, len(rows)
+        average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best = start
+        best_area = -1.0
+        for index in range(start, end):
+            area = abs((xs[previous] - average_x) * (ys[index] - ys[previous])
+                       - (xs[previous] - xs[index]) * (average_y - ys[previous]))
+            if area > best_area:
+                best = index
+                best_area = area
+        kept.append(rows[best])
+        previous = best
+
+    kept.append(rows[-1])
+    return kept
+
+def daily_series(conn, date_from=None, date_to=None, max_points=500):
+    """Return (period, rows) of spending over time with at most max_points (date, total) rows
+
+    Without both dates the whole ledger is covered.
+    """
+    first_day, last_day = conn.execute(*reports.date_span(date_from, date_to)).fetchone()
+    if first_day is None:
+        return 'day', []
+    period = choose_period(first_day, last_day, max_points)
+    rows = conn.execute(*reports.daily_totals(first_day, last_day, period)).fetchall()
+    return period, lttb(rows, max_points)
@@ -1,33 +1,71 @@
 #!/usr/bin/env python3
+"""
+Fake expense data for trying out and load testing the tracker
+Usage examples:
+  python generate_data.py 200
+  python generate_data.py 50000000 --stream --seed 42 --workers 8 --output big.csv.gz
+  python generate_data.py 1000000 --stream --duplicate_rate 0.01 --invalid_rate 0.001
+  python generate_data.py 10000000 --stream --db expenses.db
+
+The default mode builds a list of rows with the random module. --stream
+generates rows with NumPy in chunks of --chunk_size and writes each chunk
+before generating the next, so memory stays constant whatever the number
+of rows. Chunk i draws from its own generator, seeded from --seed and i,
+so the output for a seed and --end_date is the same for any number of
+workers; chunks are generated by --workers processes and written in order.
+
+--duplicate_rate rows repeat an earlier row of their chunk and
+--invalid_rate rows are damaged the ways the importer rejects (bad date,
+non-numeric or NaN amount, missing field). With --db the rows are
+validated by the importer and bulk-loaded straight into the database
+instead of written to a CSV file.
+"""
+
 import csv
+import gzip
 import random
 import argparse
-from datetime import datetime, timedelta
+import time
+from datetime import date, datetime, timedelta
+
+import importer
+
+CATEGORIES = {
+    'Food': ['Coffee', 'Lunch', 'Dinner', 'Groceries', 'Breakfast', 'Snacks', 'Fast Food'],
+    'Transport': ['Bus ticket', 'Taxi', 'Gas', 'Parking', 'Train', 'Uber', 'Metro'],
+    'Shopping': ['Clothes', 'Electronics', 'Books', 'Shoes', 'Home goods', 'Gifts'],
+    'Entertainment': ['Movie', 'Concert', 'Games', 'Streaming', 'Sports event', 'Theater'],
+    'Utilities': ['Electricity', 'Water', 'Internet', 'Phone', 'Gas bill', 'Cable'],
+    'Healthcare': ['Medicine', 'Doctor visit', 'Dental', 'Insurance', 'Vitamins', 'Pharmacy'],
+    'Education': ['Books', 'Course fee', 'Supplies', 'Software', 'Training'],
+    'Travel': ['Hotel', 'Flight', 'Rental car', 'Tourism', 'Accommodation']
+}
+
+# Amount ranges by category (min, max) in Indian Rupees
+AMOUNT_RANGES = {
+    'Food': (50.0, 2000.0),
+    'Transport': (25.0, 1200.0),
+    'Shopping': (500.0, 15000.0),
+    'Entertainment': (200.0, 4000.0),
+    'Utilities': (800.0, 8000.0),
+    'Healthcare': (300.0, 20000.0),
+    'Education': (1000.0, 35000.0),
+    'Travel': (2000.0, 50000.0)
+}
+
+FIELDNAMES = ['date', 'category', 'description', 'amount']
+
+# Rows generated and written at a time in --stream mode
+CHUNK_SIZE = 100000
+
+# gzip level of --stream output; level 9, gzip's default, is several times
+# slower for a few percent smaller files
+GZIP_LEVEL = 6
 
 def generate_fake_expenses(num_records=100):
     """Generate fake expense data"""
-    categories = {
-        'Food': ['Coffee', 'Lunch', 'Dinner', 'Groceries', 'Breakfast', 'Snacks', 'Fast Food'],
-        'Transport': ['Bus ticket', 'Taxi', 'Gas', 'Parking', 'Train', 'Uber', 'Metro'],
-        'Shopping': ['Clothes', 'Electronics', 'Books', 'Shoes', 'Home goods', 'Gifts'],
-        'Entertainment': ['Movie', 'Concert', 'Games', 'Streaming', 'Sports event', 'Theater'],
-        'Utilities': ['Electricity', 'Water', 'Internet', 'Phone', 'Gas bill', 'Cable'],
-        'Healthcare': ['Medicine', 'Doctor visit', 'Dental', 'Insurance', 'Vitamins', 'Pharmacy'],
-        'Education': ['Books', 'Course fee', 'Supplies', 'Software', 'Training'],
-        'Travel': ['Hotel', 'Flight', 'Rental car', 'Tourism', 'Accommodation']
-    }
-    
-    # Amount ranges by category (min, max) in Indian Rupees
-    amount_ranges = {
-        'Food': (50.0, 2000.0),
-        'Transport': (25.0, 1200.0),
-        'Shopping': (500.0, 15000.0),
-        'Entertainment': (200.0, 4000.0),
-        'Utilities': (800.0, 8000.0),
-        'Healthcare': (300.0, 20000.0),
-        'Education': (1000.0, 35000.0),
-        'Travel': (2000.0, 50000.0)
-    }
+    categories = CATEGORIES
+    amount_ranges = AMOUNT_RANGES
     
     expenses = []
     start_date = datetime.now() - timedelta(days=365)
@@ -62,20 +100,168 @@ def write_to_csv(expenses, filename='expenses.csv'):
         writer.writeheader()
         writer.writerows(expenses)
 
+def generate_chunk(seed, chunk_index, num_records, end_date, duplicate_rate=0.0, invalid_rate=0.0):
+    """CSV lines (without header) of one chunk of fake expenses, drawn with NumPy
+
+    The chunk's generator is seeded from (seed, chunk_index), so a chunk
+    is the same whichever process generates it. Dates fall in the 366
+    days up to end_date.
+    """
+    import numpy as np
+    
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk_index,)))
+    names = list(CATEGORIES)
+    
+    category_codes = rng.integers(0, len(names), num_records)
+    description_counts = np.array([len(CATEGORIES[name]) for name in names])
+    description_offsets = np.concatenate(([0], np.cumsum(description_counts)[:-1]))
+    all_descriptions = np.array([description for name in names for description in CATEGORIES[name]])
+    description_codes = description_offsets[category_codes] + (
+        rng.random(num_records) * description_counts[category_codes]).astype(np.int64)
+    
+    minimums = np.array([AMOUNT_RANGES[name][0] for name in names])
+    maximums = np.array([AMOUNT_RANGES[name][1] for name in names])
+    amounts = np.round(minimums[category_codes] + rng.random(num_records)
+                       * (maximums - minimums)[category_codes], 2)
+    
+    days = np.datetime64(end_date, 'D') - rng.integers(0, 366, num_records)
+    
+    lines = list(map(','.join, zip(np.datetime_as_string(days).tolist(),
+                                   np.array(names)[category_codes].tolist(),
+                                   all_descriptions[description_codes].tolist(),
+                                   map('{:.2f}'.format, amounts.tolist()))))
+    
+    # One draw decides whether a row is a duplicate, invalid or left alone
+    kinds = rng.random(num_records)
+    invalid = np.nonzero((kinds >= duplicate_rate) & (kinds < duplicate_rate + invalid_rate))[0]
+    
+    # Duplicates repeat an earlier row that stays valid, so neither rate
+    # eats into the other
+    duplicates = np.nonzero(kinds < duplicate_rate)[0]
+    valid = np.nonzero((kinds < duplicate_rate) | (kinds >= duplicate_rate + invalid_rate))[0]
+    earlier = np.searchsorted(valid, duplicates)
+    duplicates, earlier = duplicates[earlier > 0], earlier[earlier > 0]
+    for target, source in zip(duplicates.tolist(),
+                              valid[(rng.random(len(duplicates)) * earlier).astype(np.int64)].tolist()):
+        lines[target] = lines[source]
+    
+    for index, damage in zip(invalid.tolist(), rng.integers(0, 4, len(invalid)).tolist()):
+        expense_date, category, description, amount = lines[index].split(',')
+        if damage == 0:
+            lines[index] = f"{expense_date[:8]}32,{category},{description},{amount}"
+        elif damage == 1:
+            lines[index] = f"{expense_date},{category},{description},n/a"
+        elif damage == 2:
+            lines[index] = f"{expense_date},{category},{description},nan"
+        else:
+            lines[index] = f"{expense_date},{category},{description}"
+    
+    lines.append('')
+    return '\n'.join(lines)
+
+def parse_chunk(*args):
+    """generate_chunk() parsed and validated by the importer, as (rows, warnings)"""
+    return importer.parse_lines(FIELDNAMES, generate_chunk(*args).splitlines(True))
+
+def chunk_tasks(num_records, seed, chunk_size, end_date, duplicate_rate, invalid_rate):
+    """Arguments of generate_chunk() for each chunk of num_records rows"""
+    for chunk_index, start in enumerate(range(0, num_records, chunk_size)):
+        yield (seed, chunk_index, min(chunk_size, num_records - start), end_date,
+               duplicate_rate, invalid_rate)
+
+def stream_to_csv(tasks, filename, workers=1, compress=False):
+    """Generate chunks on workers processes and write them in order to a CSV file, gzipped if compress"""
+    if compress:
+        file = gzip.open(filename, 'wt', encoding='utf-8', newline='', compresslevel=GZIP_LEVEL)
+    else:
+        file = open(filename, 'w', encoding='utf-8', newline='')
+    with file:
+        file.write(','.join(FIELDNAMES) + '\n')
+        for text in importer.ordered_map(generate_chunk, tasks, workers):
+            file.write(text)
+
+def stream_to_db(tasks, db_path, workers=1):
+    """Generate chunks and bulk-load the valid rows into a database
+
+    Returns (imported, duplicates, invalid) row counts.
+    """
+    from main import ExpenseTracker
+    
+    invalid_count = 0
+    
+    def batches():
+        nonlocal invalid_count
+        for rows, warnings in importer.ordered_map(parse_chunk, tasks, workers):
+            invalid_count += len(warnings)
+            yield rows, []
+    
+    tracker = ExpenseTracker(db_path)
+    try:
+        imported_count, duplicate_count = tracker.import_batches(batches())
+    finally:
+        tracker.close()
+    return imported_count, duplicate_count, invalid_count
+
 def main():
     parser = argparse.ArgumentParser(description='Generate fake expense data')
     parser.add_argument('num_records', type=int, nargs='?', default=100,
                         help='Number of expense records to generate (default: 100)')
     parser.add_argument('--output', default='expenses.csv',
                         help='Output CSV filename (default: expenses.csv)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Generate with NumPy in chunks and stream them out, in constant memory')
+    parser.add_argument('--seed', type=int,
+                        help='Seed for reproducible --stream output (default: random, printed)')
+    parser.add_argument('--end_date', type=date.fromisoformat, default=date.today(),
+                        help='Last date of the year of --stream expenses, YYYY-MM-DD (default: today)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Generate --stream chunks with this many processes (default: 1)')
+    parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE,
+                        help=f'Rows per --stream chunk (default: {CHUNK_SIZE})')
+    parser.add_argument('--duplicate_rate', type=float, default=0.0,
+                        help='Fraction of --stream rows repeating an earlier row (default: 0)')
+    parser.add_argument('--invalid_rate', type=float, default=0.0,
+                        help='Fraction of --stream rows the importer rejects (default: 0)')
+    parser.add_argument('--gzip', action='store_true',
+                        help='Gzip the --stream CSV (implied by an --output ending in .gz)')
+    parser.add_argument('--db',
+                        help='Bulk-load the --stream rows into this database instead of writing a CSV')
     
     args = parser.parse_args()
     
-    print(f"Generating {args.num_records} fake expense records...")
-    expenses = generate_fake_expenses(args.num_records)
+    if not args.stream:
+        print(f"Generating {args.num_records} fake expense records...")
+        expenses = generate_fake_expenses(args.num_records)
+        
+        write_to_csv(expenses, args.output)
+        print(f"✓ Generated {len(expenses)} records and saved to {args.output}")
+        return
+    
+    if not 0 <= args.duplicate_rate + args.invalid_rate <= 1 or min(args.duplicate_rate, args.invalid_rate) < 0:
+        parser.error('--duplicate_rate and --invalid_rate must be fractions adding up to at most 1')
+    if args.chunk_size < 1:
+        parser.error('--chunk_size must be at least 1')
+    
+    if args.seed is None:
+        import numpy as np
+        args.seed = int(np.random.SeedSequence().entropy % 2 ** 63)
+    tasks = chunk_tasks(args.num_records, args.seed, args.chunk_size, args.end_date.isoformat(),
+                        args.duplicate_rate, args.invalid_rate)
     
-    write_to_csv(expenses, args.output)
-    print(f"✓ Generated {len(expenses)} records and saved to {args.output}")
+    print(f"Generating {args.num_records:,} fake expense records (seed {args.seed})...")
+    start_time = time.perf_counter()
+    if args.db:
+        imported_count, duplicate_count, invalid_count = stream_to_db(tasks, args.db, args.workers)
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        print(f"✓ Loaded {imported_count:,} records into {args.db} in {elapsed:.2f}s "
+              f"({args.num_records / elapsed:,.0f} rows/s); "
+              f"{duplicate_count:,} duplicates and {invalid_count:,} invalid rows skipped")
+    else:
+        compress = args.gzip or args.output.endswith('.gz')
+        stream_to_csv(tasks, args.output, args.workers, compress)
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        print(f"✓ Generated {args.num_records:,} records and saved to {args.output} in {elapsed:.2f}s "
+              f"({args.num_records / elapsed:,.0f} rows/s)")
 
 if __name__ == "__main__":
     main()
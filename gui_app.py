@@ -1,37 +1,192 @@
+import time
+
+# Taken before the other imports so --profile_startup can time them
+IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from datetime import datetime
 
+import background
+import database
+import downsampling
+import paging
+import profiling
+import reports
+import schema
+import sql_runner
+
+# matplotlib and charts.py are imported when the first chart tab is built
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+class VirtualTable:
+    """A Treeview that only holds the rows currently in view
+
+    source provides count() and rows(start, stop). The tree keeps one item
+    per visible line and the scrollbar is driven by hand, so the widget
+    costs the same whether the source has a hundred rows or ten million.
+    columns is a list of (name, heading, width); clicking a heading calls
+    on_sort(name) if given.
+    """
+
+    # Height of the heading row in pixels, not available for rows
+    HEADING_HEIGHT = 25
+
+    def __init__(self, parent, columns, source, format_row, on_sort=None):
+        self.source = source
+        self.format_row = format_row
+        self.top = 0
+        self.visible_rows = 1
+
+        self.tree = ttk.Treeview(parent, show="headings")
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.set_columns(columns, on_sort)
+
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Prior>", lambda event: self.scroll(-self.visible_rows) or "break")
+        self.tree.bind("<Next>", lambda event: self.scroll(self.visible_rows) or "break")
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0) or "break")
+        self.tree.bind("<End>", lambda event: self.scroll_to(self.source.count()) or "break")
+        self.tree.bind("<Up>", self.on_arrow)
+        self.tree.bind("<Down>", self.on_arrow)
+
+    def set_columns(self, columns, on_sort=None):
+        """Replace the tree's columns"""
+        self.tree["columns"] = [name for name, _, _ in columns]
+        for name, heading, width in columns:
+            self.tree.heading(name, text=heading)
+            if on_sort:
+                self.tree.heading(name, command=lambda name=name: on_sort(name))
+            self.tree.column(name, width=width)
+            
+    def set_source(self, source):
+        """Show the rows of another source from the top"""
+        self.source = source
+        self.scroll_to(0)
+        
+    def set_heading(self, name, text):
+        self.tree.heading(name, text=text)
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', count, 'units' or 'pages')"""
+        if args[0] == "moveto":
+            self.scroll_to(int(float(args[1]) * self.source.count()))
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.scroll(int(args[1]) * step)
+
+    def scroll(self, rows):
+        self.scroll_to(self.top + rows)
+
+    def scroll_to(self, top):
+        """Show the rows starting at position top"""
+        self.top = max(0, min(top, self.source.count() - self.visible_rows))
+        self.render()
+
+    def render(self):
+        """Fill the tree's items with the visible rows, reusing existing items"""
+        rows = self.source.rows(self.top, self.top + self.visible_rows)
+        items = self.tree.get_children()
+        self.tree.selection_remove(self.tree.selection())
+        for index, row in enumerate(rows):
+            if index < len(items):
+                self.tree.item(items[index], values=self.format_row(row))
+            else:
+                self.tree.insert("", "end", values=self.format_row(row))
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        count = self.source.count()
+        if count:
+            self.scrollbar.set(self.top / count, (self.top + len(rows)) / count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible_rows = max(1, (event.height - self.HEADING_HEIGHT) // row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.scroll_to(self.top)
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        notches = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll(-notches * 3)
+
+    def on_arrow(self, event):
+        """Scroll by one row when the arrow keys move past the first or last item"""
+        items = self.tree.get_children()
+        if not items:
+            return None
+        focus = self.tree.focus()
+        if event.keysym == "Up" and focus == items[0] and self.top > 0:
+            self.scroll(-1)
+            return "break"
+        if event.keysym == "Down" and focus == items[-1]:
+            self.scroll(1)
+            return "break"
+        return None
+
+# Plot width in pixels per point of the Daily Spending Pattern (see downsampling.py)
+DAILY_PATTERN_PIXELS_PER_POINT = 3
+
+# Wait for zooming or panning to pause before fetching the visible window
+ZOOM_DELAY_MS = 200
+
+DAILY_PATTERN_PERIODS = {"day": "", "week": " - weekly totals", "month": " - monthly totals"}
+
+# Bars of the Amount Outliers analysis
+OUTLIER_BARS = 15
+
+# Bars of the Top N per Group analysis; groups past them are left out
+TOP_PER_GROUP_BARS = 60
+
 class ExpenseTrackerGUI:
     def __init__(self, root):
+        started = time.perf_counter()
         self.root = root
         self.root.title("Personal Expense Tracker")
         self.root.geometry("1400x900")
         
+        # Seconds taken by each startup step, printed by --profile_startup
+        self.startup_times = {"imports": IMPORT_SECONDS}
+        self.started = started
+        self.root.bind("<Map>", lambda event: self.startup_times.setdefault(
+            "first paint", time.perf_counter() - self.started))
+        
         self.db_path = "expenses.db"
+        self.db = database.Database(self.db_path)
+        # Set while the Profile toggle is on (see profiling.py)
+        self.profiler = None
+        self.profile_output = None
         self.create_database()
         
         self.setup_gui()
+        self.startup_times["window"] = time.perf_counter() - started
+        
+    def on_busy(self, busy):
+        """Show or hide the busy indicator while background queries run"""
+        if busy:
+            self.status_label.config(text="Running query...")
+            self.busy_bar.start(10)
+            self.cancel_button.state(["!disabled"])
+        else:
+            self.status_label.config(text="Ready")
+            self.busy_bar.stop()
+            self.cancel_button.state(["disabled"])
         
     def create_database(self):
         """Create database and table if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                category TEXT NOT NULL,
-                description TEXT NOT NULL,
-                amount REAL NOT NULL,
-                UNIQUE(date, category, description, amount)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as conn:
+            schema.create_schema(conn)
         
     def setup_gui(self):
         """Setup the main GUI with tabs"""
@@ -39,64 +194,146 @@ class ExpenseTrackerGUI:
         title_label = ttk.Label(self.root, text="Personal Expense Tracker", font=("Arial", 18, "bold"))
         title_label.pack(pady=10)
         
-        # Create notebook for tabs
+        # Status bar with a busy indicator for background queries
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+        self.status_label = ttk.Label(status_frame, text="Ready")
+        self.status_label.pack(side=tk.LEFT)
+        self.cancel_button = ttk.Button(status_frame, text="Cancel", command=lambda: self.query_worker.cancel())
+        self.cancel_button.pack(side=tk.RIGHT)
+        self.cancel_button.state(["disabled"])
+        self.busy_bar = ttk.Progressbar(status_frame, mode="indeterminate", length=150)
+        self.busy_bar.pack(side=tk.RIGHT, padx=10)
+        self.profile_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(status_frame, text="Profile", variable=self.profile_var,
+                        command=self.toggle_profiling).pack(side=tk.RIGHT)
+        
+        # Charts and the SQL Runner query on a worker thread (see background.py)
+        self.query_worker = background.QueryWorker(self.root, self.db, on_busy=self.on_busy)
+        
+        # Create notebook for tabs. Each tab is built, and its data loaded,
+        # the first time it is selected, so the window shows up at once
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-        
-        # Tab 1: All Expenses
-        self.create_all_expenses_tab()
-        
-        # Tab 2: Visualizations
-        self.create_visualizations_tab()
-        
-        # Tab 3: Analysis
-        self.create_analysis_tab()
-        
-        # Tab 4: SQL Runner
-        self.create_sql_runner_tab()
-        
-    def create_all_expenses_tab(self):
+        self.tab_builders = {}
+        for text, builder in (("All Expenses", self.create_all_expenses_tab),
+                              ("Visualizations", self.create_visualizations_tab),
+                              ("Analysis", self.create_analysis_tab),
+                              ("SQL Runner", self.create_sql_runner_tab)):
+            frame = ttk.Frame(self.notebook)
+            self.notebook.add(frame, text=text)
+            self.tab_builders[str(frame)] = builder
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+        # In case the first tab's selection event came before the binding
+        self.root.after_idle(self.on_tab_changed)
+        
+    def on_tab_changed(self, event=None):
+        """Build the selected tab if this is the first time it is shown"""
+        tab = self.notebook.select()
+        builder = self.tab_builders.pop(tab, None)
+        if builder is None:
+            return
+        started = time.perf_counter()
+        builder(self.notebook.nametowidget(tab))
+        self.startup_times[f"build {self.notebook.tab(tab, 'text')} tab"] = time.perf_counter() - started
+        
+    def import_matplotlib(self):
+        """Import pyplot and the Tk backend, timing the first import"""
+        started = time.perf_counter()
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        self.startup_times.setdefault("import matplotlib", time.perf_counter() - started)
+        return plt, FigureCanvasTkAgg, NavigationToolbar2Tk
+        
+    def profile_startup(self):
+        """Select every tab once, wait for its data, then print how long each step took and quit"""
+        while "first paint" not in self.startup_times:
+            self.root.update()
+        for tab in self.notebook.tabs():
+            started = time.perf_counter()
+            self.notebook.select(tab)
+            self.root.update()
+            while self.query_worker.is_busy():
+                time.sleep(0.005)
+                self.root.update()
+            self.startup_times[f"{self.notebook.tab(tab, 'text')} tab ready"] = time.perf_counter() - started
+        
+        print("\nSTARTUP TIMES\n=============")
+        for step, seconds in self.startup_times.items():
+            print(f"{step:<28} {seconds * 1000:>9.1f} ms")
+        self.root.destroy()
+        self.db.close()
+        
+    def toggle_profiling(self):
+        """Start or stop profiling as the Profile toggle says"""
+        if self.profile_var.get():
+            self.start_profiling()
+        else:
+            self.stop_profiling()
+        
+    def start_profiling(self):
+        """Time stages and SQL statements on both threads (see profiling.py)"""
+        self.profiler = profiling.Profiler(self.profile_output)
+        self.profiler.start()
+        self.profiler.attach(self.db.connection())
+        self.query_worker.set_profiler(self.profiler)
+        
+    def stop_profiling(self):
+        """Stop profiling and print where the time went, as main.py --profile does"""
+        if self.profiler is None:
+            return
+        from main import print_profile
+        profiler = self.profiler
+        self.profiler = None
+        self.query_worker.set_profiler(None)
+        print_profile(profiler, self.db.connection())
+        
+    def profile_canvas(self, canvas):
+        """Time the canvas's draws as the render stage while profiling"""
+        draw = canvas.draw
+        
+        def timed_draw(*args, **kwargs):
+            if self.profiler is None:
+                return draw(*args, **kwargs)
+            with self.profiler.stage("render"):
+                return draw(*args, **kwargs)
+        
+        # draw_idle() calls self.draw(), which now finds this wrapper
+        canvas.draw = timed_draw
+        
+    def create_all_expenses_tab(self, frame):
         """Create tab showing all expenses in a data table"""
-        frame = ttk.Frame(self.notebook)
-        self.notebook.add(frame, text="All Expenses")
         
         # Control panel
         control_frame = ttk.Frame(frame)
         control_frame.pack(fill=tk.X, padx=10, pady=5)
         
         ttk.Button(control_frame, text="Refresh Data", command=self.refresh_all_expenses).pack(side=tk.LEFT)
+        self.all_expenses_count = ttk.Label(control_frame)
+        self.all_expenses_count.pack(side=tk.LEFT, padx=10)
         
         # Data table
         table_frame = ttk.Frame(frame)
         table_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        # Treeview
-        self.all_expenses_tree = ttk.Treeview(table_frame, columns=("Date", "Category", "Description", "Amount"), show="headings")
-        self.all_expenses_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Configure columns
-        self.all_expenses_tree.heading("Date", text="Date")
-        self.all_expenses_tree.heading("Category", text="Category")
-        self.all_expenses_tree.heading("Description", text="Description")
-        self.all_expenses_tree.heading("Amount", text="Amount (₹)")
-        
-        self.all_expenses_tree.column("Date", width=100)
-        self.all_expenses_tree.column("Category", width=120)
-        self.all_expenses_tree.column("Description", width=200)
-        self.all_expenses_tree.column("Amount", width=120)
-        
-        # Scrollbar
-        scrollbar1 = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=self.all_expenses_tree.yview)
-        scrollbar1.pack(side=tk.RIGHT, fill=tk.Y)
-        self.all_expenses_tree.configure(yscrollcommand=scrollbar1.set)
+        # Only the visible rows are loaded, a block at a time (see paging.py)
+        self.expense_pager = paging.ExpensePager(self.db)
+        self.all_expenses_table = VirtualTable(
+            table_frame,
+            [("date", "Date", 100), ("category", "Category", 120),
+             ("description", "Description", 200), ("amount", "Amount (₹)", 120)],
+            self.expense_pager,
+            lambda row: (row[1], row[2], row[3], f"₹{row[4]:.2f}"),
+            on_sort=self.sort_all_expenses)
+        self.update_sort_headings()
         
         # Load initial data
         self.refresh_all_expenses()
         
-    def create_visualizations_tab(self):
+    def create_visualizations_tab(self, frame):
         """Create tab with category-based visualizations"""
-        frame = ttk.Frame(self.notebook)
-        self.notebook.add(frame, text="Visualizations")
+        plt, FigureCanvasTkAgg, _ = self.import_matplotlib()
+        import charts
         
         # Control panel
         control_frame = ttk.Frame(frame)
@@ -108,18 +345,22 @@ class ExpenseTrackerGUI:
         ttk.Radiobutton(control_frame, text="Pie Chart", variable=self.viz_chart_type, value="pie", command=self.update_visualizations).pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(control_frame, text="Bar Chart", variable=self.viz_chart_type, value="bar", command=self.update_visualizations).pack(side=tk.LEFT, padx=5)
         
-        # Chart area
-        self.viz_fig, self.viz_ax = plt.subplots(figsize=(10, 6))
+        # Chart area, updated in place (see charts.py)
+        self.viz_fig = plt.figure(figsize=(10, 6))
         self.viz_canvas = FigureCanvasTkAgg(self.viz_fig, master=frame)
+        self.profile_canvas(self.viz_canvas)
         self.viz_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.viz_chart = charts.ChartView(
+            self.viz_fig, self.viz_canvas,
+            layout=lambda figure: figure.subplots_adjust(left=0.25, bottom=0.1, right=0.85, top=0.9))
         
         # Load initial chart
         self.update_visualizations()
         
-    def create_analysis_tab(self):
+    def create_analysis_tab(self, frame):
         """Create tab with analysis options"""
-        frame = ttk.Frame(self.notebook)
-        self.notebook.add(frame, text="Analysis")
+        plt, FigureCanvasTkAgg, NavigationToolbar2Tk = self.import_matplotlib()
+        import charts
         
         # Left panel - Controls
         left_frame = ttk.Frame(frame)
@@ -134,6 +375,8 @@ class ExpenseTrackerGUI:
         ttk.Radiobutton(left_frame, text="Top 10 Expenses", variable=self.analysis_type, value="top_10", command=self.update_analysis).pack(anchor=tk.W, pady=2)
         ttk.Radiobutton(left_frame, text="Daily Spending Pattern", variable=self.analysis_type, value="daily_pattern", command=self.update_analysis).pack(anchor=tk.W, pady=2)
         ttk.Radiobutton(left_frame, text="Expenses Above Threshold", variable=self.analysis_type, value="threshold", command=self.update_analysis).pack(anchor=tk.W, pady=2)
+        ttk.Radiobutton(left_frame, text="Amount Outliers", variable=self.analysis_type, value="outliers", command=self.update_analysis).pack(anchor=tk.W, pady=2)
+        ttk.Radiobutton(left_frame, text="Top N per Group", variable=self.analysis_type, value="top_per_group", command=self.update_analysis).pack(anchor=tk.W, pady=2)
         
         # Parameters frame
         params_frame = ttk.LabelFrame(left_frame, text="Parameters", padding=10)
@@ -164,24 +407,41 @@ class ExpenseTrackerGUI:
         self.date_to_var = tk.StringVar(value="2025-12-31")
         ttk.Entry(params_frame, textvariable=self.date_to_var, width=15).pack(anchor=tk.W, pady=(0, 10))
         
+        # Outliers and top N per group: group, z-score and N
+        ttk.Label(params_frame, text="Group By:").pack(anchor=tk.W)
+        self.group_var = tk.StringVar(value="category")
+        ttk.Radiobutton(params_frame, text="Category", variable=self.group_var, value="category").pack(anchor=tk.W)
+        ttk.Radiobutton(params_frame, text="Month", variable=self.group_var, value="month").pack(anchor=tk.W)
+        ttk.Radiobutton(params_frame, text="Month & Category", variable=self.group_var, value="month_category").pack(anchor=tk.W, pady=(0, 10))
+        ttk.Label(params_frame, text="Z-Score:").pack(anchor=tk.W)
+        self.z_score_var = tk.StringVar(value="2")
+        ttk.Entry(params_frame, textvariable=self.z_score_var, width=15).pack(anchor=tk.W, pady=(0, 10))
+        ttk.Label(params_frame, text="Top N:").pack(anchor=tk.W)
+        self.top_n_var = tk.StringVar(value="3")
+        ttk.Entry(params_frame, textvariable=self.top_n_var, width=15).pack(anchor=tk.W, pady=(0, 10))
+        
         ttk.Button(params_frame, text="Update Analysis", command=self.update_analysis).pack(fill=tk.X)
         
         # Right panel - Results
         right_frame = ttk.Frame(frame)
         right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        # Analysis chart
-        self.analysis_fig, self.analysis_ax = plt.subplots(figsize=(8, 6))
+        # Analysis chart, updated in place (see charts.py), with a toolbar to zoom and pan
+        self.analysis_fig = plt.figure(figsize=(8, 6))
         self.analysis_canvas = FigureCanvasTkAgg(self.analysis_fig, master=right_frame)
+        self.profile_canvas(self.analysis_canvas)
+        self.analysis_toolbar = NavigationToolbar2Tk(self.analysis_canvas, right_frame, pack_toolbar=False)
+        self.analysis_toolbar.pack(side=tk.BOTTOM, fill=tk.X)
         self.analysis_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.analysis_chart = charts.ChartView(self.analysis_fig, self.analysis_canvas)
+        self.analysis_chart.connect("daily_pattern", "xlim_changed", self.on_daily_pattern_zoom)
+        self.daily_pattern_zoom = None
         
         # Load initial analysis
         self.update_analysis()
         
-    def create_sql_runner_tab(self):
+    def create_sql_runner_tab(self, frame):
         """Create tab for custom SQL queries"""
-        frame = ttk.Frame(self.notebook)
-        self.notebook.add(frame, text="SQL Runner")
         
         # Top frame - Query input
         top_frame = ttk.Frame(frame)
@@ -197,8 +457,27 @@ class ExpenseTrackerGUI:
         default_query = "SELECT date, category, description, amount FROM expenses ORDER BY date DESC LIMIT 20;"
         self.sql_query_text.insert("1.0", default_query)
         
-        # Execute button
-        ttk.Button(top_frame, text="Execute Query", command=self.execute_custom_query).pack(pady=5)
+        # Execute button and the budget of each fetch
+        button_frame = ttk.Frame(top_frame)
+        button_frame.pack(fill=tk.X, pady=5)
+        ttk.Button(button_frame, text="Execute Query", command=self.execute_custom_query).pack(side=tk.LEFT)
+        self.sql_fetch_more_button = ttk.Button(button_frame, text="Fetch More", command=self.fetch_more_custom_query)
+        self.sql_fetch_more_button.pack(side=tk.LEFT, padx=5)
+        self.sql_fetch_more_button.state(["disabled"])
+        ttk.Label(button_frame, text="Row limit:").pack(side=tk.LEFT, padx=(15, 5))
+        self.sql_row_limit_var = tk.StringVar(value=str(sql_runner.DEFAULT_ROW_LIMIT))
+        ttk.Entry(button_frame, textvariable=self.sql_row_limit_var, width=8).pack(side=tk.LEFT)
+        ttk.Label(button_frame, text="Time limit (s):").pack(side=tk.LEFT, padx=(15, 5))
+        self.sql_time_limit_var = tk.StringVar(value=f"{sql_runner.DEFAULT_TIME_LIMIT:g}")
+        ttk.Entry(button_frame, textvariable=self.sql_time_limit_var, width=6).pack(side=tk.LEFT)
+        self.sql_info_label = ttk.Label(button_frame)
+        self.sql_info_label.pack(side=tk.LEFT, padx=15)
+        
+        # Query plan
+        plan_frame = ttk.LabelFrame(frame, text="Query Plan", padding=5)
+        plan_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.sql_plan_tree = ttk.Treeview(plan_frame, show="tree", height=4)
+        self.sql_plan_tree.pack(fill=tk.X)
         
         # Bottom frame - Results
         bottom_frame = ttk.Frame(frame)
@@ -206,128 +485,63 @@ class ExpenseTrackerGUI:
         
         ttk.Label(bottom_frame, text="Query Results:", font=("Arial", 12, "bold")).pack(anchor=tk.W)
         
-        # Results table
-        self.sql_results_tree = ttk.Treeview(bottom_frame, show="headings")
-        self.sql_results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Scrollbar for SQL results
-        scrollbar2 = ttk.Scrollbar(bottom_frame, orient=tk.VERTICAL, command=self.sql_results_tree.yview)
-        scrollbar2.pack(side=tk.RIGHT, fill=tk.Y)
-        self.sql_results_tree.configure(yscrollcommand=scrollbar2.set)
+        # Results table, filled a chunk at a time as rows are fetched (see sql_runner.py)
+        self.sql_run = sql_runner.QueryRun("")
+        self.sql_results_table = VirtualTable(bottom_frame, [], self.sql_run, self.format_custom_query_row)
         
     def refresh_all_expenses(self):
         """Refresh the all expenses table"""
-        # Clear existing data
-        for item in self.all_expenses_tree.get_children():
-            self.all_expenses_tree.delete(item)
-        
-        # Fetch and display data
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT date, category, description, amount FROM expenses ORDER BY date DESC")
-        results = cursor.fetchall()
-        conn.close()
-        
-        for row in results:
-            formatted_row = (row[0], row[1], row[2], f"₹{row[3]:.2f}")
-            self.all_expenses_tree.insert("", "end", values=formatted_row)
+        self.expense_pager.reset()
+        self.all_expenses_count.config(text=f"{self.expense_pager.count():,} expenses")
+        self.all_expenses_table.scroll_to(0)
+        
+    def sort_all_expenses(self, column):
+        """Sort the all expenses table by a column, flipping the order on a second click"""
+        if column == self.expense_pager.sort_column:
+            descending = not self.expense_pager.descending
+        else:
+            descending = column in ("date", "amount")
+        self.expense_pager.set_sort(column, descending)
+        self.update_sort_headings()
+        self.all_expenses_table.scroll_to(0)
+        
+    def update_sort_headings(self):
+        """Mark the sorted column's heading with the sort direction"""
+        headings = {"date": "Date", "category": "Category", "description": "Description", "amount": "Amount (₹)"}
+        for column, text in headings.items():
+            if column == self.expense_pager.sort_column:
+                text += " ▼" if self.expense_pager.descending else " ▲"
+            self.all_expenses_table.set_heading(column, text)
             
     def update_visualizations(self):
         """Update category visualization"""
-        self.viz_ax.clear()
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT category, SUM(amount) as total
-            FROM expenses
-            GROUP BY category
-            ORDER BY total DESC
-        ''')
-        results = cursor.fetchall()
-        conn.close()
+        self.query_worker.submit_query("visualizations", *reports.category_spending(),
+                                       on_done=self.draw_visualizations)
         
+    def draw_visualizations(self, results):
+        """Draw the category chart from (category, total) rows"""
         if not results:
-            self.viz_ax.text(0.5, 0.5, 'No data available', ha='center', va='center', transform=self.viz_ax.transAxes)
-            self.viz_canvas.draw()
+            self.viz_chart.show_message('No data available')
             return
             
         categories = [row[0] for row in results]
         amounts = [row[1] for row in results]
         
         if self.viz_chart_type.get() == "pie":
-            # Create pie chart with better formatting
-            wedges, texts, autotexts = self.viz_ax.pie(amounts, labels=categories, autopct='%1.1f%%', 
-                                                     startangle=90, textprops={'fontsize': 10})
-            
-            # Improve text positioning
-            for autotext in autotexts:
-                autotext.set_color('white')
-                autotext.set_fontweight('bold')
-            
-            self.viz_ax.set_title('Expenses by Category (Share %)', fontsize=14, fontweight='bold', pad=20)
-            
-            # Add legend with amounts
-            legend_labels = [f'{cat}: ₹{amt:.0f}' for cat, amt in zip(categories, amounts)]
-            self.viz_ax.legend(wedges, legend_labels, title="Categories", loc="center left", 
-                             bbox_to_anchor=(1, 0, 0.5, 1), fontsize=9)
+            self.viz_chart.show("category_pie", categories, amounts, 'Expenses by Category (Share %)')
         else:
-            # Create HORIZONTAL bar chart to avoid label overlapping issues
-            colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3', '#54A0FF', '#5F27CD']
-            
-            # Reverse data so highest amounts appear at the top
-            categories_reversed = categories[::-1]
-            amounts_reversed = amounts[::-1]
-            
-            # Create horizontal bars
-            y_positions = range(len(categories_reversed))
-            bars = self.viz_ax.barh(y_positions, amounts_reversed, color=colors[:len(categories_reversed)], 
-                                  height=0.6, edgecolor='white', linewidth=1.2)
-            
-            # Set title and labels
-            self.viz_ax.set_title('Total Amount per Category', fontsize=16, fontweight='bold', pad=25)
-            self.viz_ax.set_xlabel('Amount (₹)', fontsize=14, fontweight='bold')
-            self.viz_ax.set_ylabel('Categories', fontsize=14, fontweight='bold')
-            
-            # Set y-axis labels (categories) - no rotation needed for horizontal bars
-            self.viz_ax.set_yticks(y_positions)
-            self.viz_ax.set_yticklabels(categories_reversed, fontsize=12)
-            
-            # Format x-axis (amounts)
-            self.viz_ax.tick_params(axis='x', labelsize=11)
-            self.viz_ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'₹{x:,.0f}'))
-            
-            # Add value labels at the end of bars
-            for i, bar in enumerate(bars):
-                width = bar.get_width()
-                self.viz_ax.text(width + width*0.02, bar.get_y() + bar.get_height()/2.,
-                               f'₹{width:,.0f}', ha='left', va='center', 
-                               fontsize=11, fontweight='bold', color='black')
-            
-            # Add grid for better readability
-            self.viz_ax.grid(axis='x', alpha=0.3, linestyle='--', linewidth=0.8)
-            self.viz_ax.set_axisbelow(True)
-            
-            # Set proper margins and limits
-            self.viz_ax.set_xlim(0, max(amounts) * 1.15)
-            self.viz_ax.margins(y=0.02)
-            
-            # Improve overall appearance
-            self.viz_ax.spines['top'].set_visible(False)
-            self.viz_ax.spines['right'].set_visible(False)
-            self.viz_ax.spines['left'].set_linewidth(1.2)
-            self.viz_ax.spines['bottom'].set_linewidth(1.2)
-        
-        # Adjust layout with proper spacing
-        self.viz_fig.subplots_adjust(left=0.25, bottom=0.1, right=0.85, top=0.9)
-        self.viz_canvas.draw()
+            # Horizontal bars, highest amounts at the top
+            self.viz_chart.show("category_bar", categories[::-1], amounts[::-1], 'Total Amount per Category')
         
     def update_analysis(self):
         """Update analysis based on selected type"""
-        self.analysis_ax.clear()
-        
         analysis_type = self.analysis_type.get()
         
+        # A zoom of the previous chart shouldn't refetch over the new one
+        if self.daily_pattern_zoom is not None:
+            self.root.after_cancel(self.daily_pattern_zoom)
+            self.daily_pattern_zoom = None
+        
         if analysis_type == "monthly_category":
             self.monthly_category_analysis()
         elif analysis_type == "top_10":
@@ -336,123 +550,81 @@ class ExpenseTrackerGUI:
             self.daily_pattern_analysis()
         elif analysis_type == "threshold":
             self.threshold_analysis()
-            
-        self.analysis_fig.tight_layout()
-        self.analysis_canvas.draw()
+        elif analysis_type == "outliers":
+            self.outliers_analysis()
+        elif analysis_type == "top_per_group":
+            self.top_per_group_analysis()
+        
+    def run_analysis(self, query, draw):
+        """Run an analysis query in the background, then draw(results) on the analysis chart
+        
+        A newer analysis request replaces one that is still running.
+        """
+        self.query_worker.submit_query("analysis", *query, on_done=lambda results: self.show_analysis(draw, results))
+        
+    def show_analysis(self, draw, *args):
+        """Draw a new analysis and make its view the toolbar's home view"""
+        draw(*args)
+        self.analysis_toolbar.update()
+        
+    def show_analysis_message(self, message):
+        """Show a message in place of the analysis chart"""
+        self.query_worker.cancel("analysis")
+        self.analysis_chart.show_message(message)
         
     def monthly_category_analysis(self):
         """Monthly category breakdown"""
         month = self.month_var.get().strip()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        try:
+            query = reports.category_spending(month or None)
+        except ValueError:
+            self.show_analysis_message('Invalid month, use YYYY-MM')
+            return
         
-        if month:
-            cursor.execute('''
-                SELECT category, SUM(amount) as total
-                FROM expenses
-                WHERE strftime('%Y-%m', date) = ?
-                GROUP BY category
-                ORDER BY total DESC
-            ''', (month,))
-            title = f'Category Breakdown for {month}'
-        else:
-            cursor.execute('''
-                SELECT category, SUM(amount) as total
-                FROM expenses
-                GROUP BY category
-                ORDER BY total DESC
-            ''')
-            title = 'Category Breakdown (All Data)'
-            
-        results = cursor.fetchall()
-        conn.close()
+        title = f'Category Breakdown for {month}' if month else 'Category Breakdown (All Data)'
+        self.run_analysis(query, lambda results: self.draw_monthly_category(results, title))
         
+    def draw_monthly_category(self, results, title):
+        """Bar chart of (category, total) rows"""
         if not results:
-            self.analysis_ax.text(0.5, 0.5, f'No data available', ha='center', va='center', 
-                                transform=self.analysis_ax.transAxes, fontsize=12)
+            self.analysis_chart.show_message('No data available')
             return
             
         categories = [row[0] for row in results]
         amounts = [row[1] for row in results]
-        
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FECA57', '#FF9FF3']
-        bars = self.analysis_ax.bar(categories, amounts, color=colors[:len(categories)])
-        
-        self.analysis_ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-        self.analysis_ax.set_ylabel('Amount (₹)', fontsize=12)
-        self.analysis_ax.set_xlabel('Categories', fontsize=12)
-        self.analysis_ax.tick_params(axis='x', rotation=45, labelsize=10)
-        self.analysis_ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'₹{x:.0f}'))
-        
-        for bar in bars:
-            height = bar.get_height()
-            self.analysis_ax.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                                f'₹{height:.0f}', ha='center', va='bottom', fontsize=9, fontweight='bold')
-        
-        self.analysis_ax.grid(axis='y', alpha=0.3, linestyle='--')
-        self.analysis_ax.set_axisbelow(True)
+        self.analysis_chart.show("monthly_category", categories, amounts, title)
                                 
     def top_10_analysis(self):
         """Top 10 expenses analysis"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if self.top10_scope.get() == "monthly":
-            month = self.month_var.get().strip()
-            if month:
-                cursor.execute('''
-                    SELECT date, category, description, amount
-                    FROM expenses
-                    WHERE strftime('%Y-%m', date) = ?
-                    ORDER BY amount DESC
-                    LIMIT 10
-                ''', (month,))
-                title = f'Top 10 Expenses for {month}'
-            else:
-                cursor.execute('''
-                    SELECT date, category, description, amount
-                    FROM expenses
-                    ORDER BY amount DESC
-                    LIMIT 10
-                ''')
-                title = 'Top 10 Expenses (All Data)'
+        month = self.month_var.get().strip() if self.top10_scope.get() == "monthly" else ''
+        
+        try:
+            query = reports.top_expenses(10, month or None)
+        except ValueError:
+            self.show_analysis_message('Invalid month, use YYYY-MM')
+            return
+        
+        if month:
+            title = f'Top 10 Expenses for {month}'
+        elif self.top10_scope.get() == "monthly":
+            title = 'Top 10 Expenses (All Data)'
         else:
-            cursor.execute('''
-                SELECT date, category, description, amount
-                FROM expenses
-                ORDER BY amount DESC
-                LIMIT 10
-            ''')
             title = 'Top 10 Expenses (Overall)'
-            
-        results = cursor.fetchall()
-        conn.close()
         
+        self.run_analysis(query, lambda results: self.draw_top_10(results, title))
+        
+    def draw_top_10(self, results, title):
+        """Horizontal bar chart of (date, category, description, amount) rows"""
         if not results:
-            self.analysis_ax.text(0.5, 0.5, 'No data available', ha='center', va='center', 
-                                transform=self.analysis_ax.transAxes, fontsize=12)
+            self.analysis_chart.show_message('No data available')
             return
             
         descriptions = [f"{row[2][:20]}..." if len(row[2]) > 20 else row[2] for row in results]
         amounts = [row[3] for row in results]
         
         # Reverse order for better display (highest at top)
-        descriptions.reverse()
-        amounts.reverse()
-        
-        bars = self.analysis_ax.barh(descriptions, amounts, color='orange', alpha=0.8)
-        self.analysis_ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-        self.analysis_ax.set_xlabel('Amount (₹)', fontsize=12)
-        self.analysis_ax.tick_params(axis='both', labelsize=10)
-        
-        for bar in bars:
-            width = bar.get_width()
-            self.analysis_ax.text(width + width*0.01, bar.get_y() + bar.get_height()/2.,
-                                f'₹{width:.0f}', ha='left', va='center', fontsize=9, fontweight='bold')
-        
-        self.analysis_ax.grid(axis='x', alpha=0.3, linestyle='--')
-        self.analysis_ax.set_axisbelow(True)
+        self.analysis_chart.show("top_10", descriptions[::-1], amounts[::-1], title)
                                 
     def daily_pattern_analysis(self):
         """Daily spending pattern"""
@@ -460,55 +632,55 @@ class ExpenseTrackerGUI:
         date_from = self.date_from_var.get().strip()
         date_to = self.date_to_var.get().strip()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         if date_from and date_to:
-            cursor.execute('''
-                SELECT date, SUM(amount) as total
-                FROM expenses
-                WHERE date >= ? AND date <= ?
-                GROUP BY date
-                ORDER BY date
-            ''', (date_from, date_to))
             title = f'Daily Spending Pattern ({date_from} to {date_to})'
         else:
-            cursor.execute('''
-                SELECT date, SUM(amount) as total
-                FROM expenses
-                GROUP BY date
-                ORDER BY date
-            ''')
             title = 'Daily Spending Pattern (All Data)'
-            
-        results = cursor.fetchall()
-        conn.close()
         
+        # Long ranges are added up by week or month to fit the plot's width
+        self.submit_daily_series(date_from, date_to,
+                                 lambda series: self.show_analysis(self.draw_daily_pattern, series, title))
+        
+    def submit_daily_series(self, date_from, date_to, on_done):
+        """Fetch (period, rows) of the daily pattern, downsampled to the plot's width, on the analysis channel"""
+        max_points = max(int(self.analysis_fig.bbox.width) // DAILY_PATTERN_PIXELS_PER_POINT, 10)
+        self.query_worker.submit(
+            "analysis",
+            lambda conn: self.db.cached(
+                ('daily_series', date_from, date_to, max_points),
+                lambda conn: downsampling.daily_series(conn, date_from, date_to, max_points), conn),
+            on_done=on_done,
+            on_error=lambda error: self.analysis_chart.show_message(f'Could not load the daily pattern: {error}'))
+        
+    def draw_daily_pattern(self, series, title):
+        """Line chart of a (period, (date, total) rows) series"""
+        period, results = series
+        self.daily_pattern_title = title
         if not results:
-            self.analysis_ax.text(0.5, 0.5, 'No data available', ha='center', va='center', 
-                                transform=self.analysis_ax.transAxes, fontsize=12)
+            self.analysis_chart.show_message('No data available')
             return
             
         dates = [row[0] for row in results]
         amounts = [row[1] for row in results]
-        
-        self.analysis_ax.plot(dates, amounts, marker='o', linewidth=2, markersize=6, 
-                            color='#4ECDC4', markerfacecolor='#FF6B6B', markeredgecolor='white', markeredgewidth=2)
-        self.analysis_ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-        self.analysis_ax.set_ylabel('Amount (₹)', fontsize=12)
-        self.analysis_ax.tick_params(axis='x', rotation=45, labelsize=9)
-        self.analysis_ax.tick_params(axis='y', labelsize=10)
-        self.analysis_ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'₹{x:.0f}'))
-        
-        # Show only every nth date label to avoid crowding
-        if len(dates) > 15:
-            step = max(1, len(dates) // 15)
-            tick_positions = range(0, len(dates), step)
-            self.analysis_ax.set_xticks(tick_positions)
-            self.analysis_ax.set_xticklabels([dates[i] for i in tick_positions])
-        
-        self.analysis_ax.grid(True, alpha=0.3, linestyle='--')
-        self.analysis_ax.set_axisbelow(True)
+        self.analysis_chart.show("daily_pattern", dates, amounts, title + DAILY_PATTERN_PERIODS[period])
+        
+    def on_daily_pattern_zoom(self, ax):
+        """Refetch the daily pattern for the visible window once zooming or panning pauses"""
+        if self.daily_pattern_zoom is not None:
+            self.root.after_cancel(self.daily_pattern_zoom)
+        self.daily_pattern_zoom = self.root.after(ZOOM_DELAY_MS, lambda: self.refine_daily_pattern(ax))
+        
+    def refine_daily_pattern(self, ax):
+        """Replace the daily pattern's points with the visible window at the finest period that fits"""
+        self.daily_pattern_zoom = None
+        import charts
+        date_from, date_to = charts.visible_dates(ax)
+        self.submit_daily_series(date_from, date_to, self.show_daily_pattern_window)
+        
+    def show_daily_pattern_window(self, series):
+        period, results = series
+        self.analysis_chart.set_points("daily_pattern", [row[0] for row in results], [row[1] for row in results],
+                                       self.daily_pattern_title + DAILY_PATTERN_PERIODS[period])
             
     def threshold_analysis(self):
         """Expenses above threshold"""
@@ -519,76 +691,94 @@ class ExpenseTrackerGUI:
         # If no threshold specified, use 0 (show all expenses)
         threshold = float(threshold_str) if threshold_str else 0
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         # Build query based on what parameters are provided
+        query = reports.threshold_expenses(threshold if threshold > 0 else None, date_from, date_to)
         if date_from and date_to:
             if threshold > 0:
-                cursor.execute('''
-                    SELECT date, category, description, amount
-                    FROM expenses
-                    WHERE amount > ? AND date >= ? AND date <= ?
-                    ORDER BY amount DESC
-                    LIMIT 15
-                ''', (threshold, date_from, date_to))
                 title = f'Expenses Above ₹{threshold} ({date_from} to {date_to})'
             else:
-                cursor.execute('''
-                    SELECT date, category, description, amount
-                    FROM expenses
-                    WHERE date >= ? AND date <= ?
-                    ORDER BY amount DESC
-                    LIMIT 15
-                ''', (date_from, date_to))
                 title = f'Top Expenses ({date_from} to {date_to})'
         else:
             if threshold > 0:
-                cursor.execute('''
-                    SELECT date, category, description, amount
-                    FROM expenses
-                    WHERE amount > ?
-                    ORDER BY amount DESC
-                    LIMIT 15
-                ''', (threshold,))
                 title = f'Expenses Above ₹{threshold} (All Data)'
             else:
-                cursor.execute('''
-                    SELECT date, category, description, amount
-                    FROM expenses
-                    ORDER BY amount DESC
-                    LIMIT 15
-                ''')
                 title = 'Top 15 Expenses (All Data)'
-                
-        results = cursor.fetchall()
-        conn.close()
         
+        self.run_analysis(query, lambda results: self.draw_threshold(results, title, threshold))
+        
+    def draw_threshold(self, results, title, threshold):
+        """Horizontal bar chart of (date, category, description, amount) rows above a threshold"""
         if not results:
             message = f'No expenses above ₹{threshold}' if threshold > 0 else 'No data available'
-            self.analysis_ax.text(0.5, 0.5, message, ha='center', va='center', 
-                                transform=self.analysis_ax.transAxes, fontsize=12)
+            self.analysis_chart.show_message(message)
             return
             
         descriptions = [f"{row[2][:15]}..." if len(row[2]) > 15 else row[2] for row in results]
         amounts = [row[3] for row in results]
         
         # Reverse for better display
-        descriptions.reverse()
-        amounts.reverse()
+        self.analysis_chart.show("threshold", descriptions[::-1], amounts[::-1], title)
+                                
+    def outliers_analysis(self):
+        """Expenses furthest from the mean of their category or month"""
+        group = self.group_var.get()
+        if group not in reports.GROUPS:
+            self.show_analysis_message('Outliers are grouped by category or by month')
+            return
+        try:
+            z_score = float(self.z_score_var.get().strip())
+        except ValueError:
+            self.show_analysis_message('Invalid z-score, use a number such as 2')
+            return
+        
+        query = reports.outliers(group, z_score, OUTLIER_BARS)
+        title = f'Top {OUTLIER_BARS} Outliers Beyond {z_score:g}σ of Their {group.capitalize()} Mean'
+        self.run_analysis(query, lambda results: self.draw_outliers(results, title, z_score))
+        
+    def draw_outliers(self, results, title, z_score):
+        """Horizontal bar chart of the z-scores of outlier rows (see reports.outliers)"""
+        if not results:
+            self.analysis_chart.show_message(f'No expenses more than {z_score:g} standard deviations from the mean')
+            return
+            
+        labels = [f"{row[0]} {row[2][:15]}..." if len(row[2]) > 15 else f"{row[0]} {row[2]}" for row in results]
+        scores = [row[6] for row in results]
+        
+        # Reverse for better display
+        self.analysis_chart.show("outliers", labels[::-1], scores[::-1], title)
+                                
+    def top_per_group_analysis(self):
+        """The N biggest expenses of every category, month, or month and category"""
+        group = self.group_var.get()
+        try:
+            limit = int(self.top_n_var.get().strip())
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            self.show_analysis_message('Invalid N, use a whole number such as 3')
+            return
+        
+        title = f'Top {limit} Expenses of Every {group.replace("_", " & ").title()}'
+        self.query_worker.submit(
+            "analysis",
+            lambda conn: self.db.cached(('top_per_group', group, limit),
+                                        lambda conn: reports.top_per_group(conn, group, limit), conn),
+            on_done=lambda results: self.show_analysis(self.draw_top_per_group, results, title))
         
-        bars = self.analysis_ax.barh(descriptions, amounts, color='red', alpha=0.7)
-        self.analysis_ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
-        self.analysis_ax.set_xlabel('Amount (₹)', fontsize=12)
-        self.analysis_ax.tick_params(axis='both', labelsize=10)
+    def draw_top_per_group(self, results, title):
+        """Horizontal bar chart of (group, rank, date, category, description, amount) rows"""
+        if not results:
+            self.analysis_chart.show_message('No data available')
+            return
         
-        for bar in bars:
-            width = bar.get_width()
-            self.analysis_ax.text(width + width*0.01, bar.get_y() + bar.get_height()/2.,
-                                f'₹{width:.0f}', ha='left', va='center', fontsize=9, fontweight='bold')
+        if len(results) > TOP_PER_GROUP_BARS:
+            title = f'{title} (first {TOP_PER_GROUP_BARS} of {len(results)})'
+            results = results[:TOP_PER_GROUP_BARS]
+        labels = [f"{row[0]} #{row[1]} {row[4][:15]}" for row in results]
+        amounts = [row[5] for row in results]
         
-        self.analysis_ax.grid(axis='x', alpha=0.3, linestyle='--')
-        self.analysis_ax.set_axisbelow(True)
+        # Reverse for better display
+        self.analysis_chart.show("top_per_group", labels[::-1], amounts[::-1], title)
                                 
     def execute_custom_query(self):
         """Execute custom SQL query"""
@@ -597,55 +787,117 @@ class ExpenseTrackerGUI:
         if not query:
             messagebox.showwarning("Warning", "Please enter a SQL query")
             return
+        limits = self.custom_query_limits()
+        if limits is None:
+            return
             
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute(query)
-            
-            # Get column names
-            columns = [description[0] for description in cursor.description] if cursor.description else []
-            results = cursor.fetchall()
-            conn.close()
-            
-            # Clear existing results
-            for item in self.sql_results_tree.get_children():
-                self.sql_results_tree.delete(item)
+        # The previous query's statement is closed on the worker thread,
+        # which is the only one that uses it
+        previous = self.sql_run
+        run = self.sql_run = sql_runner.QueryRun(query)
+        run.extend(*limits)
+        self.sql_fetch_more_button.state(["disabled"])
+        self.sql_info_label.config(text="Running...")
+        
+        def start(conn):
+            previous.close()
+            return run.start(conn, run.next_fetch_size())
             
-            # Configure columns
-            self.sql_results_tree["columns"] = columns
-            self.sql_results_tree["show"] = "headings"
+        self.submit_custom_query(run, start, first=True)
+        
+    def fetch_more_custom_query(self):
+        """Fetch another row and time budget's worth of the current query"""
+        limits = self.custom_query_limits()
+        if limits is None or self.sql_run.done:
+            return
+        self.sql_run.extend(*limits)
+        self.sql_fetch_more_button.state(["disabled"])
+        self.fetch_custom_query(self.sql_run)
+        
+    def custom_query_limits(self):
+        """(row limit, time limit) from the SQL Runner's entries, or None after a warning"""
+        try:
+            row_limit = int(self.sql_row_limit_var.get())
+            time_limit = float(self.sql_time_limit_var.get())
+        except ValueError:
+            messagebox.showwarning("Warning", "Row and time limits must be numbers")
+            return None
+        if row_limit <= 0 or time_limit <= 0:
+            messagebox.showwarning("Warning", "Row and time limits must be positive")
+            return None
+        return row_limit, time_limit
+        
+    def fetch_custom_query(self, run):
+        """Fetch the next chunk of rows of a SQL Runner query"""
+        self.submit_custom_query(run, lambda conn: run.fetch(run.next_fetch_size()), first=False)
+        
+    def submit_custom_query(self, run, function, first):
+        """Run start() or fetch() of a query on the worker, stopped once it outruns the time budget"""
+        job = self.query_worker.submit(
+            "sql_runner", function,
+            on_done=lambda rows: self.add_custom_query_rows(run, job, rows, first),
+            on_error=lambda e: self.show_custom_query_error(run, job, e, first),
+            time_limit=run.time_left())
             
-            for col in columns:
-                self.sql_results_tree.heading(col, text=col)
-                self.sql_results_tree.column(col, width=120, anchor="center")
+    def add_custom_query_rows(self, run, job, rows, first):
+        """Show a chunk of rows of a SQL Runner query and fetch the next if the budget allows"""
+        run.add(rows, job.steps)
+        if first:
+            self.show_query_plan(run.plan)
+            self.sql_results_table.set_columns(
+                [(f"column{index}", name, 120) for index, name in enumerate(run.columns)])
+            self.sql_results_table.set_source(run)
+        else:
+            self.sql_results_table.render()
             
-            # Insert results
-            for row in results:
-                formatted_row = []
-                for item in row:
-                    if isinstance(item, float):
-                        formatted_row.append(f"₹{item:.2f}")
-                    else:
-                        formatted_row.append(str(item))
-                self.sql_results_tree.insert("", "end", values=formatted_row)
-                
-            messagebox.showinfo("Success", f"Query executed successfully. {len(results)} rows returned.")
+        if run.wants_more():
+            self.fetch_custom_query(run)
+        elif not run.done:
+            self.sql_fetch_more_button.state(["!disabled"])
+        self.sql_info_label.config(text=run.summary())
+        
+    def show_custom_query_error(self, run, job, error, first):
+        """Report a failed SQL Runner query, or one stopped by its time limit"""
+        if not job.timed_out:
+            messagebox.showerror("SQL Error", f"Error executing query:\n{str(error)}")
+            self.sql_info_label.config(text="")
+            return
+        # An interrupted statement can't be resumed, so this ends the query
+        run.done = True
+        self.add_custom_query_rows(run, job, [], first)
+        self.sql_info_label.config(text=f"Stopped at the time limit: {run.summary()}")
+        
+    def show_query_plan(self, plan):
+        """Show EXPLAIN QUERY PLAN rows (id, parent, detail) as a tree"""
+        self.sql_plan_tree.delete(*self.sql_plan_tree.get_children())
+        for node_id, parent, detail in plan:
+            parent_item = str(parent) if parent and self.sql_plan_tree.exists(str(parent)) else ""
+            self.sql_plan_tree.insert(parent_item, "end", iid=str(node_id), text=detail, open=True)
             
-        except Exception as e:
-            messagebox.showerror("SQL Error", f"Error executing query:\n{str(e)}")
+    def format_custom_query_row(self, row):
+        return [f"₹{item:.2f}" if isinstance(item, float) else str(item) for item in row]
 
 def main():
+    parser = argparse.ArgumentParser(description='Personal Expense Tracker GUI')
+    parser.add_argument('--profile_startup', action='store_true',
+                        help='Open every tab once, print how long startup took and quit')
+    parser.add_argument('--profile', action='store_true',
+                        help='Start with the Profile toggle on; its summary is printed when it is turned off or on exit')
+    parser.add_argument('--profile_output',
+                        help='While profiling, also save cProfile stats of the main loop to this file')
+    args = parser.parse_args()
+    
     root = tk.Tk()
     app = ExpenseTrackerGUI(root)
-    root.mainloop()
-
-if __name__ == "__main__":
-    main()
-def main():
-    root = tk.Tk()
-    app = ExpenseTrackerGUI(root)
-    root.mainloop()
+    app.profile_output = args.profile_output
+    if args.profile:
+        app.profile_var.set(True)
+        app.start_profiling()
+    if args.profile_startup:
+        app.profile_startup()
+    else:
+        root.mainloop()
+    app.stop_profiling()
 
 if __name__ == "__main__":
     main()
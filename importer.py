@@ -0,0 +1,256 @@
+"""
+CSV import pipeline for the Personal Expense Tracker
+
+The input file is split into byte ranges that end on line boundaries and
+each range is parsed and validated by a worker process. The caller stays
+the only writer and receives the parsed batches in file order, so the
+imported rows and counts are the same whatever the number of workers.
+parse_row() is the one validator of every import path, with or without
+workers, so they all accept and reject the same rows.
+
+Ranges are split on raw newlines, so quoted fields containing line breaks
+are not supported by this pipeline; use the regular import for such files.
+
+Sources can also be stdin ('-') or gzip/bz2/xz compressed files, which are
+detected from their magic bytes and decompressed while streaming. Those are
+not seekable, so the pipeline hands workers blocks of lines instead.
+
+For append-only files, parse_file can start at a byte offset and stop at
+the last complete line, which is what incremental imports use together
+with a hash of the already-imported prefix.
+"""
+
+import bz2
+import csv
+import gzip
+import hashlib
+import io
+import lzma
+import math
+import os
+import stat
+import sys
+from collections import deque
+from datetime import date
+from multiprocessing import Pool
+
+REQUIRED_FIELDS = ('date', 'category', 'description', 'amount')
+
+# Bytes of CSV handed to a worker at a time
+RANGE_SIZE = 4 * 1024 * 1024
+
+# Read buffer for streamed sources and prefix hashing
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+COMPRESSION_FORMATS = [
+    (b'\x1f\x8b', 'gzip', lambda stream: gzip.GzipFile(fileobj=stream)),
+    (b'BZh', 'bz2', bz2.BZ2File),
+    (b'\xfd7zXZ\x00', 'xz', lzma.LZMAFile),
+]
+
+class CountingReader(io.RawIOBase):
+    """Raw stream wrapper that counts the bytes read from the source"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.stream.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+class CsvSource:
+    """A CSV input opened for streaming: a file path, '-' for stdin, or a compressed file
+
+    text is a text stream over the decompressed CSV. path is set only for
+    plain files on disk, which the parallel pipeline can split into ranges.
+    """
+
+    def __init__(self, csv_path):
+        if csv_path == '-':
+            self.name = 'stdin'
+            raw = sys.stdin.buffer
+            self.is_regular_file = False
+        else:
+            self.name = csv_path
+            raw = open(csv_path, 'rb')
+            self.is_regular_file = stat.S_ISREG(os.fstat(raw.fileno()).st_mode)
+
+        self.counter = CountingReader(raw)
+        buffered = io.BufferedReader(self.counter, STREAM_BUFFER_SIZE)
+
+        self.compression = None
+        binary = buffered
+        head = buffered.peek(6)
+        for magic, name, decompressor in COMPRESSION_FORMATS:
+            if head.startswith(magic):
+                self.compression = name
+                binary = decompressor(buffered)
+                break
+
+        self.path = csv_path if self.is_regular_file and not self.compression else None
+        self.text = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+        self._raw = raw
+
+    def input_bytes(self):
+        """Bytes of input consumed so far (the whole file for files on disk)"""
+        if self.is_regular_file:
+            return os.fstat(self._raw.fileno()).st_size
+        return self.counter.bytes_read
+
+    def close(self):
+        self.text.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def parse_row(row):
+    """Validate a CSV row and convert it to a (date, category, description, amount) tuple"""
+    for field in REQUIRED_FIELDS:
+        if row.get(field) is None:
+            raise KeyError(field)
+
+    expense_date = row['date']
+    # fromisoformat also takes week dates such as 2024-W01-1
+    if len(expense_date) != 10 or expense_date[4] != '-' or expense_date[7] != '-':
+        raise ValueError(f"invalid date '{expense_date}', expected YYYY-MM-DD")
+    date.fromisoformat(expense_date)
+
+    amount = float(row['amount'])
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid amount '{row['amount']}'")
+
+    return (expense_date, row['category'], row['description'], amount)
+
+def parse_rows(reader):
+    """Parse rows from a DictReader, returning (valid rows, warning messages)"""
+    rows = []
+    warnings = []
+    for row in reader:
+        try:
+            rows.append(parse_row(row))
+        except (ValueError, KeyError) as e:
+            warnings.append(f"Warning: Skipping invalid row: {row} - {e}")
+    return rows, warnings
+
+def read_header(csv_path):
+    """Return the column names and the byte offset where the data starts"""
+    with open(csv_path, 'rb') as file:
+        header = file.readline()
+        fieldnames = next(csv.reader([header.decode('utf-8')]), [])
+        return fieldnames, file.tell()
+
+def complete_lines_end(csv_path):
+    """Return the offset just past the last newline, ignoring a partially written line"""
+    with open(csv_path, 'rb') as file:
+        position = os.fstat(file.fileno()).st_size
+        while position > 0:
+            block_start = max(0, position - STREAM_BUFFER_SIZE)
+            file.seek(block_start)
+            newline = file.read(position - block_start).rfind(b'\n')
+            if newline != -1:
+                return block_start + newline + 1
+            position = block_start
+        return 0
+
+def hash_range(digest, csv_path, start, end):
+    """Feed the bytes between two offsets of a file into a hashlib object"""
+    with open(csv_path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = file.read(min(STREAM_BUFFER_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+def prefix_digest(csv_path, length):
+    """Return a sha256 object over the first length bytes of a file"""
+    return hash_range(hashlib.sha256(), csv_path, 0, length)
+
+def split_ranges(csv_path, start, range_size=RANGE_SIZE, end=None):
+    """Yield (start, end) byte ranges from start to end (default EOF) that end on line boundaries"""
+    with open(csv_path, 'rb') as file:
+        stop = os.fstat(file.fileno()).st_size if end is None else end
+        while start < stop:
+            range_end = start + range_size
+            if range_end < stop:
+                file.seek(range_end)
+                file.readline()
+                range_end = file.tell()
+            else:
+                range_end = stop
+            yield start, range_end
+            start = range_end
+
+def parse_range(csv_path, fieldnames, start, end):
+    """Parse and validate the CSV rows between two byte offsets"""
+    with open(csv_path, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    text = io.StringIO(data.decode('utf-8'), newline='')
+    return parse_rows(csv.DictReader(text, fieldnames=fieldnames))
+
+def parse_lines(fieldnames, lines):
+    """Parse and validate a block of CSV lines"""
+    return parse_rows(csv.DictReader(lines, fieldnames=fieldnames))
+
+def ordered_map(function, tasks, workers):
+    """Yield function(*task) for each task in order, using a pool when workers > 1
+
+    At most two tasks per worker are in flight so memory stays bounded.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield function(*task)
+        return
+
+    with Pool(workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(function, task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def parse_file(csv_path, workers, range_size=RANGE_SIZE, start=None, end=None):
+    """Yield (rows, warnings) batches for a CSV file in file order
+
+    start and end restrict parsing to part of the file; start must be on a
+    line boundary past the header, which is always read from the top.
+    """
+    fieldnames, data_start = read_header(csv_path)
+    tasks = ((csv_path, fieldnames, range_start, range_end)
+             for range_start, range_end in split_ranges(csv_path, max(start or 0, data_start),
+                                                        range_size, end))
+    yield from ordered_map(parse_range, tasks, workers)
+
+def parse_stream(text, workers, block_size=RANGE_SIZE):
+    """Yield (rows, warnings) batches for a CSV text stream in stream order"""
+    fieldnames = next(csv.reader(text), [])
+
+    def blocks():
+        while True:
+            lines = text.readlines(block_size)
+            if not lines:
+                return
+            yield fieldnames, lines
+
+    yield from ordered_map(parse_lines, blocks(), workers)
+
+def parse_source(source, workers):
+    """Yield (rows, warnings) batches for a CsvSource, by byte range when possible"""
+    if source.path:
+        return parse_file(source.path, workers)
+    return parse_stream(source.text, workers)
@@ -5,56 +5,192 @@ Usage examples:
   python main.py --import_csv expenses.csv
   python main.py --report all
   python main.py --import_csv expenses.csv --report by_category
+  python main.py --report over_threshold --threshold 50 --format csv > expenses.csv
 """
 
 import sqlite3
+import contextlib
 import csv
+import hashlib
 import argparse
+import os
 import sys
+import time
 from datetime import datetime
 
+import database
+import importer
+import output
+import profiling
+import reports
+import rollups
+import schema
+
+# PRAGMAs applied for the duration of a bulk import and restored afterwards.
+# The rollback journal is kept in memory and fsyncs are skipped, so a crash
+# mid-import can leave the database needing a restore from backup.
+IMPORT_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'cache_size': -262144,  # 256 MiB
+}
+
+def apply_pragmas(conn, pragmas):
+    """Set PRAGMAs on a connection and return their previous values"""
+    previous = {}
+    for name, value in pragmas.items():
+        previous[name] = conn.execute(f'PRAGMA {name}').fetchone()[0]
+        conn.execute(f'PRAGMA {name} = {value}')
+    return previous
+
 class ExpenseTracker:
-    def __init__(self, db_path='expenses.db'):
+    def __init__(self, db_path='expenses.db', engine='sqlite'):
         self.db_path = db_path
+        self.db = database.Database(db_path)
+        self.engine = engine
+        self.snapshot = None
         self.create_table()
     
     def create_table(self):
         """Create expenses table if it doesn't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.db.transaction() as conn:
+            schema.create_schema(conn)
+            self.layout = schema.get_layout(conn)
+    
+    def close(self):
+        """Close the database connections"""
+        self.db.close()
+    
+    def db_stats(self):
+        """Connection, statement cache and result cache counters of the database layer"""
+        return self.db.stats()
+    
+    def migrate(self, layout):
+        """Rebuild the expenses table in another storage layout (see schema.py)"""
+        conn = self.db.connection()
+        kept_rows, dropped_rows = schema.migrate(conn, layout)
+        self.layout = schema.get_layout(conn)
+        self.db.changed()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                category TEXT NOT NULL,
-                description TEXT NOT NULL,
-                amount REAL NOT NULL,
-                UNIQUE(date, category, description, amount)
-            )
-        ''')
+        print(f"✓ Migrated expenses table to the '{layout}' layout:")
+        print(f"  - {kept_rows} records kept")
+        print(f"  - {dropped_rows} duplicates dropped")
+    
+    def rebuild_rollups(self):
+        """Recompute the category, month and day rollup and amount statistics tables from the stored rows"""
+        with self.db.transaction() as conn:
+            counts = rollups.rebuild(conn, schema.storage_table(self.layout))
         
-        conn.commit()
-        conn.close()
+        print(f"✓ Rebuilt rollup tables:")
+        for rollup, row_count in counts.items():
+            print(f"  - {rollup}: {row_count} rows")
     
-    def import_csv(self, csv_path):
-        """Import CSV data into SQLite, avoiding duplicates"""
+    def import_csv(self, csv_path, batch_size=None, workers=None, incremental=False):
+        """Import CSV data into SQLite, avoiding duplicates
+
+        csv_path may be '-' to read from stdin, and gzip/bz2/xz compressed
+        files are decompressed on the fly; either way the input is streamed.
+        Every path validates rows with importer.parse_row(), so they all
+        import the same rows. With batch_size set, rows are bulk-loaded batch_size at a time
+        through executemany instead of one INSERT per row. With workers
+        set, parsing and validation are spread over that many processes
+        (see importer.py) while this process does all the writing. With
+        incremental set, only rows appended since the previous incremental
+        import of the same file are read.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            conn = self.db.connection()
+            start_time = time.perf_counter()
             
-            imported_count = 0
-            duplicate_count = 0
+            with importer.CsvSource(csv_path) as source:
+                input_bytes = None
+                
+                if incremental and not source.path:
+                    print("Note: incremental import needs an uncompressed file on disk, importing everything")
+                
+                if incremental and source.path:
+                    imported_count, duplicate_count, input_bytes = self._incremental_insert(
+                        conn, source.path, workers or 1)
+                elif workers:
+                    imported_count, duplicate_count = self._parallel_insert(
+                        conn, importer.parse_source(source, workers))
+                else:
+                    reader = csv.DictReader(source.text)
+                    
+                    if batch_size:
+                        imported_count, duplicate_count = self._bulk_insert(conn, reader, batch_size)
+                    else:
+                        imported_count, duplicate_count = self._insert_rows(conn, reader)
+                
+                if input_bytes is None:
+                    input_bytes = source.input_bytes()
             
-            with open(csv_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
+            # Cached report results no longer match the data
+            self.db.changed()
+            
+            elapsed = max(time.perf_counter() - start_time, 1e-9)
+            
+            print(f"✓ Import completed:")
+            print(f"  - {imported_count} new records imported")
+            print(f"  - {duplicate_count} duplicates skipped")
+            print(f"  - {imported_count + duplicate_count} rows in {elapsed:.2f}s "
+                  f"({(imported_count + duplicate_count) / elapsed:,.0f} rows/s, "
+                  f"{input_bytes / elapsed / 1e6:.1f} MB/s)")
+            
+        except FileNotFoundError:
+            print(f"Error: CSV file '{csv_path}' not found")
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error importing CSV: {e}")
+            sys.exit(1)
+    
+    def import_batches(self, batches):
+        """Bulk-load (rows, warnings) batches of validated (date, category, description, amount) rows
+
+        This is the writer of the parallel CSV import for rows that don't
+        come from a CSV file, such as generate_data.py --db. Returns
+        (imported, duplicates).
+        """
+        counts = self._parallel_insert(self.db.connection(), batches)
+        self.db.changed()
+        return counts
+    
+    def watch_csv(self, csv_path, interval=5.0, workers=None):
+        """Poll an append-only CSV file and incrementally import new rows until interrupted"""
+        print(f"Watching '{csv_path}' every {interval:g}s (Ctrl+C to stop)")
+        last_seen = None
+        try:
+            while True:
+                try:
+                    file_stat = os.stat(csv_path)
+                    current = (file_stat.st_size, file_stat.st_mtime_ns)
+                except FileNotFoundError:
+                    current = None
                 
+                if current is not None and current != last_seen:
+                    self.import_csv(csv_path, workers=workers, incremental=True)
+                last_seen = current
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+    
+    def _insert_rows(self, conn, reader):
+        """Insert rows one at a time, counting rejected rows as duplicates
+
+        The rollup tables are updated once at the end instead of by the
+        triggers on every row, and the indexes of an empty table are built
+        once at the end (schema.deferred_indexes).
+        """
+        writer = schema.RowWriter(conn, self.layout)
+        
+        imported_count = 0
+        duplicate_count = 0
+        
+        try:
+            with rollups.deferred(conn, schema.storage_table(self.layout)), schema.deferred_indexes(conn):
                 for row in reader:
                     try:
-                        cursor.execute('''
-                            INSERT INTO expenses (date, category, description, amount)
-                            VALUES (?, ?, ?, ?)
-                        ''', (row['date'], row['category'], row['description'], float(row['amount'])))
+                        writer.insert([writer.encode(importer.parse_row(row))])
                         imported_count += 1
                     except sqlite3.IntegrityError:
                         # Duplicate record
@@ -63,167 +199,438 @@ class ExpenseTracker:
                         print(f"Warning: Skipping invalid row: {row} - {e}")
             
             conn.commit()
-            conn.close()
+        except BaseException:
+            conn.rollback()
+            raise
+        return imported_count, duplicate_count
+    
+    def _bulk_insert(self, conn, reader, batch_size):
+        """Insert rows in batches inside a single transaction
+        
+        INSERT OR IGNORE drops exactly the rows the per-row path would have
+        rejected with an IntegrityError, so duplicates are counted as the
+        rows of each batch that changes() did not report as inserted. The
+        rollup tables are updated once at the end instead of per row, and
+        so are the indexes of an empty table (schema.deferred_indexes).
+        """
+        previous_pragmas = apply_pragmas(conn, IMPORT_PRAGMAS)
+        try:
+            writer = schema.RowWriter(conn, self.layout)
             
-            print(f"✓ Import completed:")
-            print(f"  - {imported_count} new records imported")
-            print(f"  - {duplicate_count} duplicates skipped")
+            imported_count = 0
+            duplicate_count = 0
+            batch = []
             
-        except FileNotFoundError:
-            print(f"Error: CSV file '{csv_path}' not found")
-            sys.exit(1)
-        except Exception as e:
-            print(f"Error importing CSV: {e}")
-            sys.exit(1)
+            with rollups.deferred(conn, schema.storage_table(self.layout)), schema.deferred_indexes(conn):
+                for row in reader:
+                    try:
+                        batch.append(writer.encode(importer.parse_row(row)))
+                    except (ValueError, KeyError) as e:
+                        print(f"Warning: Skipping invalid row: {row} - {e}")
+                        continue
+                    
+                    if len(batch) >= batch_size:
+                        inserted = writer.insert(batch, or_ignore=True)
+                        imported_count += inserted
+                        duplicate_count += len(batch) - inserted
+                        batch = []
+                
+                if batch:
+                    inserted = writer.insert(batch, or_ignore=True)
+                    imported_count += inserted
+                    duplicate_count += len(batch) - inserted
+            
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            apply_pragmas(conn, previous_pragmas)
+        
+        return imported_count, duplicate_count
     
-    def get_category_totals(self):
-        """Get total expenses by category"""
-        conn = sqlite3.connect(self.db_path)
+    def _parallel_insert(self, conn, batches):
+        """Write batches parsed by the import pipeline, committing each in file order
+
+        The indexes of an empty table are built after the last batch
+        (schema.deferred_indexes).
+        """
+        previous_pragmas = apply_pragmas(conn, IMPORT_PRAGMAS)
+        try:
+            writer = schema.RowWriter(conn, self.layout)
+            
+            imported_count = 0
+            duplicate_count = 0
+            
+            with schema.deferred_indexes(conn):
+                for batch, warnings in batches:
+                    for warning in warnings:
+                        print(warning)
+                    
+                    with rollups.deferred(conn, schema.storage_table(self.layout)):
+                        inserted = writer.insert([writer.encode(row) for row in batch], or_ignore=True)
+                    conn.commit()
+                    imported_count += inserted
+                    duplicate_count += len(batch) - inserted
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            apply_pragmas(conn, previous_pragmas)
+        
+        return imported_count, duplicate_count
+    
+    def _incremental_insert(self, conn, csv_path, workers):
+        """Import only the complete lines appended since the last recorded offset
+
+        The stored offset is trusted only if the file still starts with the
+        bytes that were hashed last time; otherwise the whole file is read
+        again and the UNIQUE constraint filters out what is already there.
+        Rows are validated by importer.parse_row(), like every other import
+        path, so a rescan accepts exactly the rows a regular import stored.
+        """
+        source_path = os.path.realpath(csv_path)
         cursor = conn.cursor()
+        cursor.execute('''
+            SELECT byte_offset, row_count, prefix_hash
+            FROM import_state
+            WHERE source_path = ?
+        ''', (source_path,))
+        state = cursor.fetchone()
+        
+        end = importer.complete_lines_end(csv_path)
+        start = 0
+        row_count = 0
+        digest = hashlib.sha256()
+        
+        if state:
+            byte_offset, previous_rows, prefix_hash = state
+            prefix = importer.prefix_digest(csv_path, byte_offset) if byte_offset <= end else None
+            if prefix and prefix.hexdigest() == prefix_hash:
+                start = byte_offset
+                row_count = previous_rows
+                digest = prefix
+                print(f"Resuming import of '{csv_path}' at byte {start:,} ({row_count} rows already imported)")
+            else:
+                print(f"'{csv_path}' changed since the last import, rescanning the whole file")
+        
+        imported_count, duplicate_count = self._parallel_insert(
+            conn, importer.parse_file(csv_path, workers, start=start, end=end))
+        row_count += imported_count + duplicate_count
         
+        importer.hash_range(digest, csv_path, start, end)
         cursor.execute('''
-            SELECT 
-                category,
-                COUNT(*) as transaction_count,
-                SUM(amount) as total_amount,
-                AVG(amount) as avg_amount
-            FROM expenses
-            GROUP BY category
-            ORDER BY total_amount DESC
-        ''')
+            INSERT OR REPLACE INTO import_state (source_path, byte_offset, row_count, prefix_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (source_path, end, row_count, digest.hexdigest(), datetime.now().isoformat(timespec='seconds')))
+        conn.commit()
         
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        return imported_count, duplicate_count, end - start
+    
+    def get_category_totals(self):
+        """Get total expenses by category"""
+        return self._fetch_all(*reports.category_totals())
     
     def get_monthly_totals(self):
         """Get monthly spending totals"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                strftime('%Y-%m', date) as month,
-                COUNT(*) as transactions,
-                SUM(amount) as total_spent
-            FROM expenses
-            GROUP BY strftime('%Y-%m', date)
-            ORDER BY month DESC
-        ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        return self._fetch_all(*reports.monthly_totals())
     
     def get_biggest_expenses(self, limit=10):
         """Get biggest expenses"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT date, category, description, amount
-            FROM expenses
-            ORDER BY amount DESC
-            LIMIT ?
-        ''', (limit,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        return self._fetch_all(*reports.biggest_expenses(limit))
     
     def get_expenses_over_threshold(self, threshold):
         """Get expenses over a threshold amount"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT date, category, description, amount
-            FROM expenses
-            WHERE amount > ?
-            ORDER BY amount DESC
-        ''', (threshold,))
+        return self._fetch_all(*reports.expenses_over_threshold(threshold))
+    
+    def get_amount_stats(self, group='category'):
+        """Get the transactions, mean, standard deviation, min and max amount per category or month
+
+        The figures are kept up to date by the rollup triggers and imports
+        (see rollups.py), so this never reads the expenses themselves.
+        """
+        return self._fetch_all(*reports.amount_stats(group))
+    
+    def get_outliers(self, group='category', z_score=2.0, limit=None):
+        """Get the expenses more than z_score standard deviations from the mean of their category or month"""
+        return self._fetch_all(*reports.outliers(group, z_score, limit))
+    
+    def get_top_per_group(self, group='month', limit=10):
+        """Get the limit biggest expenses of every month, category, or month and category"""
+        return self.db.cached(('top_per_group', group, limit),
+                              lambda conn: reports.top_per_group(conn, group, limit))
+    
+    def iter_expenses_over_threshold(self, threshold):
+        """Iterate over the expenses over a threshold amount, largest first, without holding them in memory
+
+        With the sqlite engine the rows come straight from the cursor of the
+        query, which only runs once iteration starts, and are not cached.
+        """
+        if self.engine == 'numpy':
+            return self.columnar_snapshot().iter_expenses_over_threshold(threshold)
+        return self._iter_query(*reports.expenses_over_threshold(threshold))
+    
+    def run_reports(self, names, threshold=100.0, limit=10, stream=False, group='category', z_score=2.0):
+        """Compute several reports (see reports.REPORTS) over one connection, returning {name: rows}
+
+        Results are cached until the data changes (see database.py). With
+        the numpy engine they are computed from a columnar snapshot of the
+        expenses instead (see analytics.py). With stream, over_threshold,
+        the one report whose size has no bound, is returned as an iterator
+        from iter_expenses_over_threshold() and must be consumed before
+        the next query on this thread. group is the one of amount_stats,
+        outliers and top_per_group, and z_score the one of outliers.
+        """
+        if stream and 'over_threshold' in names:
+            others = [name for name in names if name != 'over_threshold']
+            results = self.run_reports(others, threshold, limit, group=group, z_score=z_score) if others else {}
+            results['over_threshold'] = self.iter_expenses_over_threshold(threshold)
+            return {name: results[name] for name in names}
+        if self.engine == 'numpy':
+            return self.columnar_snapshot().run_reports(names, threshold, limit, group, z_score)
+        return self.db.cached(('reports', tuple(names), threshold, limit, group, z_score),
+                              lambda conn: reports.run_reports(conn, names, threshold, limit, group, z_score))
+    
+    def columnar_snapshot(self):
+        """The expenses as NumPy columns, refreshed with new rows on every call
+
+        The first call maps the snapshot file saved next to the database,
+        rebuilding it if it is missing or stale (see analytics.py).
+        """
+        conn = self.db.connection()
+        if self.snapshot is None:
+            import analytics
+            
+            self.snapshot, _ = self.export_snapshot()
+            invalid_count = analytics.invalid_date_rows(conn)
+            if invalid_count:
+                print(f"Warning: {invalid_count} expenses with an invalid date are left out of --engine numpy",
+                      file=sys.stderr)
+        else:
+            self.snapshot.refresh(conn)
+        return self.snapshot
+    
+    def export_snapshot(self):
+        """Map the columnar snapshot file of the database, writing it first if it is missing or stale
+
+        Returns (snapshot, rebuilt). An in-memory database gets a snapshot
+        that is never saved.
+        """
+        import analytics
         
-        results = cursor.fetchall()
-        conn.close()
-        return results
+        conn = self.db.connection()
+        if self.db_path == ':memory:':
+            snapshot = analytics.ColumnarSnapshot()
+            snapshot.load(conn)
+            return snapshot, True
+        return analytics.load_snapshot(conn, self.db_path)
+    
+    def check_query_plans(self):
+        """Return (report, plan, full scans) for every built-in report query"""
+        return reports.check_query_plans(self.db.connection())
+    
+    def _iter_query(self, sql, params=()):
+        yield from self.db.execute(sql, params)
+    
+    def _fetch_all(self, sql, params=()):
+        """Run a query and return all of its rows, cached until the data changes"""
+        return self.db.cached_query(sql, params)
 
 def print_table(headers, rows, title=None):
     """Print data in a formatted table"""
-    if title:
-        print(f"\n{title}")
-        print("=" * len(title))
-    
-    if not rows:
-        print("No data found.")
-        return
-    
-    # Calculate column widths
-    widths = [len(str(header)) for header in headers]
-    for row in rows:
-        for i, cell in enumerate(row):
-            widths[i] = max(widths[i], len(str(cell)))
-    
-    # Print header
-    header_row = " | ".join(str(header).ljust(widths[i]) for i, header in enumerate(headers))
-    print(f"\n{header_row}")
-    print("-" * len(header_row))
-    
-    # Print rows
-    for row in rows:
-        formatted_row = []
-        for i, cell in enumerate(row):
-            if isinstance(cell, float):
-                formatted_cell = f"₹{cell:.2f}".ljust(widths[i])
+    output.write_table(sys.stdout, headers, rows, title)
+
+# Column headers and table title of each report
+REPORT_LAYOUTS = {
+    'by_category': (['Category', 'Transactions', 'Total', 'Average'], 'SPENDING BY CATEGORY'),
+    'monthly': (['Month', 'Transactions', 'Total Spent'], 'MONTHLY SPENDING'),
+    'biggest': (['Date', 'Category', 'Description', 'Amount'], 'TOP {limit} BIGGEST EXPENSES'),
+    'over_threshold': (['Date', 'Category', 'Description', 'Amount'], 'EXPENSES OVER ₹{threshold:.2f}'),
+    'amount_stats': (['{group}', 'Transactions', 'Mean', 'Std Dev', 'Min', 'Max'], 'AMOUNT STATISTICS BY {GROUP}'),
+    'outliers': (['Date', 'Category', 'Description', 'Amount', '{group} Mean', 'Std Dev', 'Z Score'],
+                 'EXPENSES MORE THAN {z_score:g} STANDARD DEVIATIONS FROM THEIR {GROUP} MEAN'),
+    'top_per_group': (['{group}', 'Rank', 'Date', 'Category', 'Description', 'Amount'],
+                      'TOP {limit} EXPENSES OF EVERY {GROUP}'),
+}
+
+# Table cells that aren't amounts in rupees
+COLUMN_FORMATS = {
+    'Z Score': '{:+.2f}'.format,
+}
+
+def print_reports(results, threshold, output_format='table', known_widths=None, group='category', z_score=2.0,
+                  limit=10):
+    """Write run_reports() results to standard output as tables, CSV or JSON Lines (see output.py)
+
+    Rows are written as they are iterated, so a report streamed from a
+    cursor goes out without being held in memory. known_widths maps
+    headers to the widest value their column can hold, for tables whose
+    first rows may not include it.
+    """
+    known_widths = known_widths or {}
+    group = group.replace('_', ' and ')
+    labels = {'threshold': threshold, 'z_score': z_score, 'limit': limit,
+              'group': group.capitalize(), 'GROUP': group.upper()}
+    with output.open_stdout() as out:
+        for name, rows in results.items():
+            headers, title = REPORT_LAYOUTS[name]
+            headers = [header.format(**labels) for header in headers]
+            if output_format == 'csv':
+                output.write_csv(out, headers, rows)
+            elif output_format == 'jsonl':
+                output.write_jsonl(out, headers, rows, report=name)
             else:
-                formatted_cell = str(cell).ljust(widths[i])
-            formatted_row.append(formatted_cell)
-        print(" | ".join(formatted_row))
+                output.write_table(out, headers, rows, title.format(**labels),
+                                   [known_widths.get(header, 0) for header in headers],
+                                   [COLUMN_FORMATS.get(header, output.format_cell) for header in headers])
+
+def print_profile(profiler, conn):
+    """Stop a profiler and print where the time went"""
+    profiler.stop()
+    print_table(['Stage', 'Calls', 'Wall', 'CPU'], profiler.stage_rows(), 'PROFILE: STAGES')
+    print_table(['Statement', 'Runs', 'Total', 'Slowest', 'VM Steps', 'Query Plan'],
+                profiler.statement_rows(conn), 'PROFILE: SLOWEST STATEMENTS')
+    if profiler.output:
+        print(f"\ncProfile stats saved to {profiler.output} (python -m pstats {profiler.output})")
 
 def main():
     parser = argparse.ArgumentParser(description='Personal Expense Tracker')
     parser.add_argument('--db', default='expenses.db',
                         help='Database path (default: expenses.db)')
     parser.add_argument('--import_csv',
-                        help='CSV file path to import')
+                        help='CSV file path to import (- for stdin, gzip/bz2/xz detected automatically)')
+    parser.add_argument('--batch_size', type=int,
+                        help='Bulk-load the CSV in batches of this many rows')
+    parser.add_argument('--workers', type=int,
+                        help='Parse and validate the CSV with this many worker processes')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only import rows appended to the CSV since the last incremental import')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep polling the CSV and incrementally import new rows (implies --incremental)')
+    parser.add_argument('--watch_interval', type=float, default=5.0,
+                        help='Seconds between polls in --watch mode (default: 5)')
+    parser.add_argument('--migrate', choices=schema.LAYOUTS,
+                        help='Rebuild the expenses table in another storage layout')
+    parser.add_argument('--rebuild_rollups', action='store_true',
+                        help='Recompute the category, month and day rollup tables and the amount statistics')
     parser.add_argument('--report', 
-                        choices=['by_category', 'monthly', 'biggest', 'over_threshold', 'all'],
+                        choices=list(reports.REPORTS) + ['all'],
                         help='Report type to generate')
+    parser.add_argument('--format', choices=output.FORMATS, default='table',
+                        help='Write --report as aligned tables, CSV or JSON Lines (default: table)')
+    parser.add_argument('--check_plans', action='store_true',
+                        help='Check that no built-in report query needs a full table scan')
+    parser.add_argument('--db_stats', action='store_true',
+                        help='Print connection, statement cache and result cache counters when done')
     parser.add_argument('--threshold', type=float, default=100.0,
                         help='Threshold amount for filtering expenses (default: 100)')
+    parser.add_argument('--group_by', choices=list(reports.TOP_GROUPS), default='category',
+                        help='Group amount_stats and outliers per category or per month, and rank '
+                             'top_per_group within each category, month, or month and category (default: category)')
+    parser.add_argument('--top_n', type=int, default=10,
+                        help='Expenses listed by biggest, and per group by top_per_group (default: 10)')
+    parser.add_argument('--z_score', type=float, default=2.0,
+                        help='Standard deviations from the mean beyond which an expense is an outlier (default: 2)')
+    parser.add_argument('--export_snapshot', action='store_true',
+                        help='Write the columnar snapshot file used by --engine numpy if it is missing or stale')
+    parser.add_argument('--engine', choices=['sqlite', 'numpy'], default='sqlite',
+                        help='Compute --report in SQLite or from a NumPy snapshot of the expenses (default: sqlite)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent per stage and the slowest SQL statements with their plans')
+    parser.add_argument('--profile_output',
+                        help='With --profile, also save cProfile stats to this file (view with python -m pstats)')
     
     args = parser.parse_args()
+    if args.report in ('amount_stats', 'outliers') and args.group_by not in reports.GROUPS:
+        parser.error(f"--group_by {args.group_by} only applies to --report top_per_group; "
+                     f"amount_stats and outliers are grouped by {' or '.join(reports.GROUPS)}")
+    if args.format == 'csv' and args.report == 'all':
+        parser.error('--format csv writes a single report; choose one with --report or use --format jsonl')
     
     # Initialize tracker
-    tracker = ExpenseTracker(args.db)
+    tracker = ExpenseTracker(args.db, engine=args.engine)
+    
+    profiler = None
+    stage = lambda name: contextlib.nullcontext()
+    if args.profile:
+        profiler = profiling.Profiler(args.profile_output)
+        profiler.start()
+        profiler.attach(tracker.db.connection())
+        stage = profiler.stage
+    
+    if args.migrate:
+        with stage('migrate'):
+            tracker.migrate(args.migrate)
+    
+    if args.rebuild_rollups:
+        with stage('rebuild rollups'):
+            tracker.rebuild_rollups()
     
     # Import CSV if specified
-    if args.import_csv:
-        tracker.import_csv(args.import_csv)
+    if args.import_csv and args.watch:
+        tracker.watch_csv(args.import_csv, args.watch_interval, workers=args.workers)
+    elif args.import_csv:
+        with stage('import'):
+            tracker.import_csv(args.import_csv, batch_size=args.batch_size,
+                               workers=args.workers, incremental=args.incremental)
+    
+    if args.export_snapshot:
+        start = time.perf_counter()
+        with stage('export snapshot'):
+            snapshot, rebuilt = tracker.export_snapshot()
+        if rebuilt:
+            print(f"Wrote the columnar snapshot of {len(snapshot):,} rows in {time.perf_counter() - start:.2f}s")
+        else:
+            print(f"The columnar snapshot of {len(snapshot):,} rows is up to date")
+    
+    plans_failed = False
     
     # Generate reports
     if args.report:
-        if args.report == 'by_category' or args.report == 'all':
-            results = tracker.get_category_totals()
-            print_table(['Category', 'Transactions', 'Total', 'Average'],
-                       results, 'SPENDING BY CATEGORY')
-        
-        if args.report == 'monthly' or args.report == 'all':
-            results = tracker.get_monthly_totals()
-            print_table(['Month', 'Transactions', 'Total Spent'],
-                       results, 'MONTHLY SPENDING')
+        names = reports.SUMMARY_REPORTS if args.report == 'all' else [args.report]
+        with stage('query'):
+            results = tracker.run_reports(names, args.threshold, args.top_n, stream=True, group=args.group_by,
+                                          z_score=args.z_score)
+            known_widths = None
+            if args.format == 'table':
+                # Dates and categories of rows past the table's sample are no wider
+                categories = [row[0] for row in tracker.get_category_totals()]
+                known_widths = {'Date': len('YYYY-MM-DD'), 'Category': max(map(len, categories), default=0)}
         
-        if args.report == 'biggest' or args.report == 'all':
-            results = tracker.get_biggest_expenses()
-            print_table(['Date', 'Category', 'Description', 'Amount'],
-                       results, 'TOP 10 BIGGEST EXPENSES')
-        
-        if args.report == 'over_threshold' or args.report == 'all':
-            results = tracker.get_expenses_over_threshold(args.threshold)
-            print_table(['Date', 'Category', 'Description', 'Amount'],
-                       results, f'EXPENSES OVER ₹{args.threshold:.2f}')
+        # over_threshold is fetched from its cursor while it is written
+        with stage('format'):
+            try:
+                print_reports(results, args.threshold, args.format, known_widths, args.group_by, args.z_score,
+                              args.top_n)
+            except BrokenPipeError:
+                # The reader went away, e.g. | head; silence the final flush of stdout
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+                sys.exit(1)
+    
+    if args.check_plans:
+        with stage('check plans'):
+            results = tracker.check_query_plans()
+        print_table(['Report', 'Query Plan', 'Status'],
+                   [(name, '; '.join(plan), 'FULL SCAN' if scans else 'OK') for name, plan, scans in results],
+                   'QUERY PLANS')
+        plans_failed = any(scans for _, _, scans in results)
     
-    if not args.import_csv and not args.report:
+    if args.db_stats:
+        stats = tracker.db_stats()
+        for counter in ('statement_cache_hit_rate', 'result_cache_hit_rate'):
+            stats[counter] = f"{stats[counter]:.1%}"
+        print_table(['Counter', 'Value'], list(stats.items()), 'DATABASE STATS')
+    
+    if profiler:
+        print_profile(profiler, tracker.db.connection())
+    
+    if not (args.import_csv or args.report or args.migrate or args.check_plans or args.rebuild_rollups
+            or args.db_stats or args.export_snapshot):
         parser.print_help()
+    
+    if plans_failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+"""
+Report output for main.py: aligned tables, CSV and JSON Lines
+
+Every writer takes any iterable of rows, including a cursor still
+fetching them, and writes each row as it comes, so a report of millions
+of rows is never held in memory:
+
+  - table   the aligned tables main.py has always printed. Column
+            widths come from the headers and the first SAMPLE_ROWS
+            rows; a later, wider cell is written in full and pushes the
+            rest of its line to the right. Reports sorted by amount put
+            their widest amounts first, and callers can pass the
+            widths of columns whose values they know, such as categories
+  - csv     a header row of column names, then one line per row
+  - jsonl   one JSON object per row, keyed by column name, with the
+            report it belongs to
+
+Column names are the table headers in snake case (Total Spent becomes
+total_spent). CSV and JSON Lines write amounts as plain numbers, without
+the currency sign and rounding of the tables.
+
+open_stdout() wraps standard output in a larger buffer than print()
+goes through, so rows reach the terminal or pipe in big writes.
+"""
+
+import contextlib
+import csv
+import itertools
+import json
+import sys
+
+# Output formats of main.py --format
+FORMATS = ('table', 'csv', 'jsonl')
+
+# Rows write_table() sizes its columns from
+SAMPLE_ROWS = 1000
+
+# Bytes buffered by open_stdout() before each write to standard output
+BUFFER_SIZE = 1024 * 1024
+
+def open_stdout(buffer_size=BUFFER_SIZE):
+    """Standard output with a buffer_size buffer, as a context manager that flushes it on exit
+
+    Anything already printed is flushed first, so output stays in order.
+    Falls back to sys.stdout itself when it isn't backed by a file, e.g.
+    when it has been redirected to a StringIO.
+    """
+    sys.stdout.flush()
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        return contextlib.nullcontext(sys.stdout)
+    return open(fileno, 'w', buffering=buffer_size, encoding=sys.stdout.encoding,
+                errors=sys.stdout.errors, closefd=False)
+
+def column_name(header):
+    """The CSV and JSON name of a table header"""
+    return '_'.join(header.lower().split())
+
+def format_cell(cell):
+    """A table cell as text, amounts with the currency sign and two decimals"""
+    if isinstance(cell, float):
+        return f"₹{cell:.2f}"
+    return str(cell)
+
+def write_table(out, headers, rows, title=None, widths=None, formats=None, sample_rows=SAMPLE_ROWS):
+    """Write rows as an aligned table, sizing the columns from the first sample_rows rows
+
+    widths, if given, are the least width of each column, and formats the
+    function turning each column's values into text (format_cell() by
+    default).
+    """
+    if title:
+        out.write(f"\n{title}\n")
+        out.write("=" * len(title) + "\n")
+
+    formats = formats or [format_cell] * len(headers)
+    rows = iter(rows)
+    sample = [[format(cell) for format, cell in zip(formats, row)] for row in itertools.islice(rows, sample_rows)]
+    if not sample:
+        out.write("No data found.\n")
+        return
+
+    # Calculate column widths
+    widths = [max(len(str(header)), width) for header, width in zip(headers, widths or [0] * len(headers))]
+    for cells in sample:
+        for i, cell in enumerate(cells):
+            widths[i] = max(widths[i], len(cell))
+
+    # Write header
+    header_row = " | ".join(str(header).ljust(widths[i]) for i, header in enumerate(headers))
+    out.write(f"\n{header_row}\n")
+    out.write("-" * len(header_row) + "\n")
+
+    # Write the sampled rows, then the rest as they come
+    for cells in sample:
+        out.write(" | ".join(cell.ljust(width) for cell, width in zip(cells, widths)) + "\n")
+    for row in rows:
+        out.write(" | ".join(format(cell).ljust(width) for format, cell, width in zip(formats, row, widths)) + "\n")
+
+def write_csv(out, headers, rows):
+    """Write a header row of column names, then rows, as CSV"""
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow([column_name(header) for header in headers])
+    writer.writerows(rows)
+
+def write_jsonl(out, headers, rows, report=None):
+    """Write one JSON object per row, with a "report" key first if report is given"""
+    names = [column_name(header) for header in headers]
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    prefix = {'report': report} if report else {}
+    for row in rows:
+        out.write(encode({**prefix, **dict(zip(names, row))}) + "\n")
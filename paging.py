@@ -0,0 +1,208 @@
+"""
+Keyset pagination over the expenses table for the GUI's All Expenses tab
+
+ExpensePager hands out rows by position in a sort order without loading
+the table: rows are fetched in blocks of block_size, each block starting
+right after the (sort value, id) key that ended the previous one, so a
+page costs an index seek instead of an OFFSET over everything before it.
+The start keys form a sparse index of the sort order, one key per block.
+A jump to a block whose start key isn't known yet (dragging the
+scrollbar) starts from the nearest known key or, when sorting on date or
+category, from the first row of the value the block lands in, found by
+adding up the counts of the rollup tables. It then walks the keys from
+there, recording the start key of every block it passes, so a later jump
+to any of them is a seek. A small LRU keeps the most recently used
+blocks, and the total row count comes from the rollup tables, so it is
+known before any row is read.
+
+Sorting on date or amount walks the managed indexes of schema.py, which
+are ordered by (column, id). Category and description have no index of
+their own, so each block of such a sort has SQLite sort the table.
+"""
+
+import math
+from collections import OrderedDict
+
+# Rows fetched per query
+BLOCK_SIZE = 200
+
+# Blocks kept in memory
+CACHE_BLOCKS = 16
+
+SORT_COLUMNS = ('date', 'category', 'description', 'amount')
+
+# Sort columns with an index of their own (see the module docstring)
+INDEXED_COLUMNS = ('date', 'amount')
+
+# Rollup table and key column counting the rows of every value of a sort column
+VALUE_COUNTS = {
+    'date': ('daily_rollup', 'date'),
+    'category': ('category_rollup', 'category'),
+}
+
+class ExpensePager:
+    """Rows of the expenses table in a sort order, fetched in blocks by keyset pagination
+
+    Rows are (id, date, category, description, amount) tuples.
+    """
+
+    def __init__(self, db, sort_column='date', descending=True,
+                 block_size=BLOCK_SIZE, cache_blocks=CACHE_BLOCKS):
+        self.db = db
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.set_sort(sort_column, descending)
+
+    def set_sort(self, sort_column, descending=True):
+        """Change the sort order, forgetting every loaded block"""
+        if sort_column not in SORT_COLUMNS:
+            raise ValueError(f"can't sort by '{sort_column}', expected one of {', '.join(SORT_COLUMNS)}")
+        self.sort_column = sort_column
+        self.descending = descending
+        self.reset()
+
+    def reset(self):
+        """Forget the loaded blocks and the row count, e.g. after the data changed"""
+        self._blocks = OrderedDict()
+        # Key (sort value, id) of the last row before each block; block 0 starts at the top
+        self._start_keys = {0: None}
+        self._count = None
+
+    def count(self):
+        """Total number of rows"""
+        if self._count is None:
+            self._count = self.db.query(
+                'SELECT IFNULL(SUM(transaction_count), 0) FROM category_rollup')[0][0]
+        return self._count
+
+    def rows(self, start, stop):
+        """Rows at positions start to stop - 1 of the sort order"""
+        start = max(start, 0)
+        stop = min(stop, self.count())
+        rows = []
+        position = start
+        while position < stop:
+            block_number, offset = divmod(position, self.block_size)
+            block = self.block(block_number)
+            if offset >= len(block):
+                break
+            taken = block[offset:offset + stop - position]
+            rows.extend(taken)
+            position += len(taken)
+        return rows
+
+    def block(self, block_number):
+        """Rows of one block, from the cache or the database"""
+        block = self._blocks.get(block_number)
+        if block is not None:
+            self._blocks.move_to_end(block_number)
+            return block
+
+        # Start from the closest block whose start key is known, or the
+        # first row of the sort value the block starts in if that is closer
+        known = max(number for number in self._start_keys if number <= block_number)
+        start = (known * self.block_size, self._start_keys[known])
+        target = block_number * self.block_size
+        if start[0] < target and self.sort_column in VALUE_COUNTS:
+            start = max(start, self._value_start(target), key=lambda start: start[0])
+        if start[0] < target:
+            self._skip(*start, target)
+        else:
+            self._start_keys[block_number] = start[1]
+        if block_number not in self._start_keys:
+            # Fewer rows than the rollups count
+            return []
+        block = self._fetch(self._start_keys[block_number])
+
+        if len(block) == self.block_size:
+            last = block[-1]
+            self._start_keys[block_number + 1] = (last[SORT_COLUMNS.index(self.sort_column) + 1], last[0])
+        self._blocks[block_number] = block
+        if len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def _value_start(self, position):
+        """(position, key) of the first row of the sort value holding a position, from the rollup counts
+
+        The key's id is past every id, so the rows following it are all the
+        rows of that value and after.
+        """
+        rollup, column = VALUE_COUNTS[self.sort_column]
+        direction = 'DESC' if self.descending else 'ASC'
+        row = self.db.query(f'''
+            SELECT value, through - transaction_count
+            FROM (
+                SELECT {column} AS value, transaction_count,
+                       SUM(transaction_count) OVER (ORDER BY {column} {direction}) AS through
+                FROM {rollup}
+            )
+            WHERE through > ?
+            ORDER BY through
+            LIMIT 1
+        ''', (position,))
+        if not row:
+            return 0, None
+        value, start = row[0]
+        return start, (value, math.inf if self.descending else -math.inf)
+
+    def _skip(self, position, after_key, target):
+        """Walk from the row after after_key, at position, to target, recording the start key of every block passed"""
+        where, params = self._following(after_key)
+        column = self.sort_column
+        direction = 'DESC' if self.descending else 'ASC'
+        if column in INDEXED_COLUMNS:
+            # A seek and a walk of at most one block along the index per block
+            while position < target:
+                step = self.block_size - position % self.block_size
+                key = self.db.query(f'''
+                    SELECT {column}, id
+                    FROM expenses
+                    {where}
+                    ORDER BY {column} {direction}, id {direction}
+                    LIMIT 1 OFFSET ?3
+                ''', params + (step - 1,))
+                if not key:
+                    return
+                position += step
+                self._start_keys[position // self.block_size] = after_key = key[0]
+                where, params = self._following(after_key)
+        else:
+            # Every query sorts the rows, so read all the keys up to target in one
+            cursor = self.db.execute(f'''
+                SELECT {column}, id
+                FROM expenses
+                {where}
+                ORDER BY {column} {direction}, id {direction}
+                LIMIT ?3
+            ''', params + (target - position,))
+            while position < target:
+                step = self.block_size - position % self.block_size
+                keys = cursor.fetchmany(step)
+                if len(keys) < step:
+                    return
+                position += step
+                self._start_keys[position // self.block_size] = keys[-1]
+
+    def _following(self, after_key):
+        """WHERE clause and its ?1, ?2 parameters selecting the rows after a key in the sort order"""
+        column = self.sort_column
+        comparison = '<' if self.descending else '>'
+        if after_key is None:
+            return '', (None, None)
+        # Same as ({column}, id) {comparison} (?, ?), written so that SQLite
+        # can seek on the compact layout's expression indexes too
+        return f'WHERE {column} {comparison}= ?1 AND ({column} {comparison} ?1 OR id {comparison} ?2)', after_key
+
+    def _fetch(self, after_key):
+        """Fetch one block of rows following a key"""
+        column = self.sort_column
+        direction = 'DESC' if self.descending else 'ASC'
+        where, params = self._following(after_key)
+        return self.db.query(f'''
+            SELECT id, date, category, description, amount
+            FROM expenses
+            {where}
+            ORDER BY {column} {direction}, id {direction}
+            LIMIT ?3
+        ''', params + (self.block_size,))
@@ -0,0 +1,179 @@
+"""
+Where a CLI or GUI run spends its time, for main.py --profile and the GUI's Profile toggle
+
+A Profiler records two things:
+
+  - stages: wall and CPU time of named steps such as import, query,
+    format and render, timed with the stage() context manager. CPU time
+    is the calling thread's, so the GUI's worker thread and main loop
+    don't count each other's work
+  - statements: every statement SQLite runs on an attached connection,
+    reported by set_trace_callback, with the SQLite VM instructions it
+    took counted by a progress handler every PROGRESS_STEPS instructions
+
+SQLite only reports when a statement starts. On the connections of
+database.py a statement ends when execute() returns if it has no rows,
+or when fetchall() returns; otherwise, e.g. for a query whose cursor is
+iterated, it runs until the next statement starts on the same thread or
+the enclosing stage ends, so its time includes the work done between
+rows. Statements are grouped
+with their literals replaced by ?, so the rows of an executemany, or one
+query run with different parameters, add up to a single entry.
+statement_rows() lists the slowest ones with their EXPLAIN QUERY PLAN.
+
+With an output path, cProfile runs from start() to stop() and its stats
+are saved there for python -m pstats. cProfile only sees the thread that
+started it: the CLI, or the GUI's main loop.
+"""
+
+import contextlib
+import cProfile
+import re
+import sqlite3
+import threading
+import time
+
+import reports
+
+# SQLite VM instructions between progress handler calls
+PROGRESS_STEPS = 1000
+
+# Statements listed by statement_rows()
+SLOWEST_STATEMENTS = 10
+
+# String and numeric literals of a statement
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+
+def normalize_sql(sql):
+    """A statement with its literals replaced by ? and its whitespace collapsed"""
+    return ' '.join(LITERALS.sub('?', sql).split())
+
+class Profiler:
+    """Stage timers and a per-statement SQL timer"""
+
+    def __init__(self, output=None):
+        self.output = output
+        # name: [calls, wall seconds, CPU seconds]
+        self.stages = {}
+        # normalized SQL: [runs, seconds, slowest run's seconds, VM steps, slowest run's SQL]
+        self.statements = {}
+        self._connections = []
+        self._running = threading.local()
+        self._lock = threading.Lock()
+        self._cprofile = None
+
+    def start(self):
+        if self.output:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        """Stop timing, detach every connection and save the cProfile stats"""
+        self._finish_statement()
+        for conn, count_steps in self._connections:
+            if hasattr(conn, 'statement_finished'):
+                conn.statement_finished = None
+            try:
+                conn.set_trace_callback(None)
+                if count_steps:
+                    conn.set_progress_handler(None, PROGRESS_STEPS)
+            except sqlite3.ProgrammingError:
+                # Already closed
+                pass
+        self._connections = []
+        if self._cprofile:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.output)
+            self._cprofile = None
+
+    def attach(self, conn, count_steps=True):
+        """Time the statements of a connection
+
+        Without count_steps no progress handler is installed, for a
+        connection that has its own; call add_steps() from it instead.
+        """
+        conn.set_trace_callback(self._statement_started)
+        if count_steps:
+            conn.set_progress_handler(self._progress, PROGRESS_STEPS)
+        if hasattr(conn, 'statement_finished'):
+            conn.statement_finished = self._finish_statement
+        self._connections.append((conn, count_steps))
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Add the wall and CPU time of the with block to a stage"""
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self._finish_statement()
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            with self._lock:
+                entry = self.stages.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += wall
+                entry[2] += cpu
+
+    def timed(self, name, function):
+        """function wrapped to run as a stage"""
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def add_steps(self, steps):
+        """Count VM steps of the statement running on this thread"""
+        if getattr(self._running, 'sql', None) is not None:
+            self._running.steps += steps
+
+    def _progress(self):
+        self.add_steps(PROGRESS_STEPS)
+        return 0
+
+    def _statement_started(self, sql):
+        now = time.perf_counter()
+        self._finish_statement(now)
+        self._running.sql = sql
+        self._running.started = now
+        self._running.steps = 0
+
+    def _finish_statement(self, now=None):
+        """Record the statement running on this thread, if any, as done"""
+        sql = getattr(self._running, 'sql', None)
+        if sql is None:
+            return
+        elapsed = (now or time.perf_counter()) - self._running.started
+        self._running.sql = None
+        with self._lock:
+            entry = self.statements.setdefault(normalize_sql(sql), [0, 0.0, 0.0, 0, sql])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[3] += self._running.steps
+            if elapsed >= entry[2]:
+                entry[2] = elapsed
+                entry[4] = sql
+
+    def stage_rows(self):
+        """(stage, calls, wall, CPU) rows, in the order the stages first ran"""
+        return [(name, calls, f"{wall * 1000:,.1f} ms", f"{cpu * 1000:,.1f} ms")
+                for name, (calls, wall, cpu) in self.stages.items()]
+
+    def statement_rows(self, conn, limit=SLOWEST_STATEMENTS):
+        """(statement, runs, total, slowest, VM steps, plan) rows of the slowest statements
+
+        Plans are explained on conn, with the literals of the slowest run.
+        """
+        slowest = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        rows = []
+        for sql, (runs, seconds, longest, steps, example) in slowest:
+            plan = ''
+            if (example.split(None, 1) or [''])[0].upper() in ('SELECT', 'WITH'):
+                try:
+                    plan = '; '.join(reports.query_plan(conn, example))
+                except sqlite3.Error:
+                    pass
+            rows.append((sql if len(sql) <= 80 else sql[:77] + '...', runs, f"{seconds * 1000:,.1f} ms",
+                         f"{longest * 1000:,.1f} ms", f"{steps:,}", plan))
+        return rows
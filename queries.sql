@@ -106,3 +106,21 @@ SELECT
 FROM expenses, stats
 WHERE amount > (stats.mean_amount + 2 * SQRT(stats.variance))
 ORDER BY amount DESC;
+
+
+-- 11. Find outliers per category (expenses 2 standard deviations from their category's mean, kept in category_stats)
+WITH stats AS (
+    SELECT
+        category,
+        total_paise / 100.0 / transaction_count as mean_amount,
+        SQRT(m2_paise / (transaction_count - 1)) / 100.0 as std_dev
+    FROM category_stats
+    WHERE transaction_count > 1
+)
+SELECT
+    e.date, e.category, e.description, e.amount,
+    ROUND((e.amount - stats.mean_amount) / stats.std_dev, 2) as std_deviations
+FROM expenses e
+JOIN stats ON stats.category = e.category
+WHERE ABS(e.amount - stats.mean_amount) > 2 * stats.std_dev
+ORDER BY ABS(e.amount - stats.mean_amount) / stats.std_dev DESC;
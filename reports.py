@@ -0,0 +1,444 @@
+"""
+SQL for the built-in reports of the CLI (main.py) and the GUI (gui_app.py)
+
+Each function returns a (sql, params) pair. Month filters are written as
+date range predicates (date >= first day AND date < first day of the next
+month) rather than strftime('%Y-%m', date) = ?, so they can use the
+indexes created by schema.py. check_query_plans() verifies with EXPLAIN
+QUERY PLAN that none of these queries falls back to a full table scan,
+or to walking a whole index past the rows its filter is after.
+
+The category, month and day totals read the rollup tables maintained by
+rollups.py, so they cost the same whatever the size of the ledger and
+don't depend on the storage layout. Row-level reports query the expenses
+table (or view) directly.
+
+amount_stats() and outliers() read the per category and per month count,
+total, M2 (sum of squared deviations), minimum and maximum that rollups.py
+keeps with Welford's method, instead of the AVG() subqueries per row of
+the outlier query in queries.sql. An outlier is an expense more than a
+given number of standard deviations (its z-score) from the mean amount of
+its category or month.
+
+top_per_group() ranks the largest expenses within every month, category,
+or month and category in one walk down the amount index. The rollup
+tables say how many expenses each group has, so the walk stops as soon
+as every group has its rows; run_reports() shares that walk with the
+biggest and over_threshold reports.
+"""
+
+import re
+from datetime import datetime
+
+import rollups
+
+# Reports of main.py --report
+REPORTS = ('by_category', 'monthly', 'biggest', 'over_threshold', 'amount_stats', 'outliers', 'top_per_group')
+
+# The reports --report all prints, in order. The statistics reports are
+# only printed when asked for by name, so all gives the same output it
+# always has and no unlimited outlier list lands in it
+SUMMARY_REPORTS = ('by_category', 'monthly', 'biggest', 'over_threshold')
+
+# Groups amount_stats() and outliers() can work per, each with its
+# expression over a row of expenses
+GROUPS = {
+    'category': '{row}.category',
+    'month': 'substr({row}.date, 1, 7)',
+}
+
+# Groups top_per_group() can rank within, each with the rollup query
+# counting its expenses per group and the group of a (date, category,
+# description, amount) row
+TOP_GROUPS = {
+    'category': ('SELECT category, transaction_count FROM category_rollup',
+                 lambda row: row[1]),
+    'month': ('SELECT month, SUM(transaction_count) FROM month_category_rollup GROUP BY month',
+              lambda row: row[0][:7]),
+    'month_category': ("SELECT month || ' ' || category, transaction_count FROM month_category_rollup",
+                       lambda row: f'{row[0][:7]} {row[1]}'),
+}
+
+def check_group(group, groups=GROUPS):
+    """Raise ValueError for anything but a name in groups"""
+    if group not in groups:
+        raise ValueError(f"unknown group '{group}', expected one of {', '.join(groups)}")
+
+def month_bounds(month):
+    """Return the first day of a YYYY-MM month and the first day of the next one"""
+    if len(month) != 7:
+        raise ValueError(f"invalid month '{month}', expected YYYY-MM")
+    first_day = datetime.strptime(month, '%Y-%m').date()
+    if first_day.month == 12:
+        next_month = first_day.replace(year=first_day.year + 1, month=1)
+    else:
+        next_month = first_day.replace(month=first_day.month + 1)
+    return first_day.isoformat(), next_month.isoformat()
+
+def category_totals():
+    """Transactions, total and average per category, largest total first"""
+    return '''
+        SELECT
+            category,
+            transaction_count,
+            total_paise / 100.0 as total_amount,
+            total_paise / 100.0 / transaction_count as avg_amount
+        FROM category_rollup
+        ORDER BY total_amount DESC
+    ''', ()
+
+def monthly_totals():
+    """Transactions and total per month, latest month first"""
+    return '''
+        SELECT
+            month,
+            SUM(transaction_count) as transactions,
+            SUM(total_paise) / 100.0 as total_spent
+        FROM month_category_rollup
+        GROUP BY month
+        ORDER BY month DESC
+    ''', ()
+
+def biggest_expenses(limit=10):
+    """The largest individual expenses"""
+    return '''
+        SELECT date, category, description, amount
+        FROM expenses
+        ORDER BY amount DESC
+        LIMIT ?
+    ''', (limit,)
+
+def expenses_over_threshold(threshold):
+    """Every expense above an amount, largest first"""
+    return '''
+        SELECT date, category, description, amount
+        FROM expenses
+        WHERE amount > ?
+        ORDER BY amount DESC
+    ''', (threshold,)
+
+def amount_stats(group='category'):
+    """Transactions, mean, standard deviation, minimum and maximum amount per category or month
+
+    The standard deviation is the sample one, 0 for a single transaction.
+    """
+    check_group(group)
+    return f'''
+        SELECT
+            {group},
+            transaction_count,
+            total_paise / 100.0 / transaction_count as mean_amount,
+            CASE WHEN transaction_count > 1
+                 THEN sqrt(m2_paise / (transaction_count - 1)) / 100.0
+                 ELSE 0.0 END as std_dev,
+            min_paise / 100.0 as min_amount,
+            max_paise / 100.0 as max_amount
+        FROM {group}_stats
+        ORDER BY {group}
+    ''', ()
+
+def outliers(group='category', z_score=2.0, limit=None):
+    """Expenses more than z_score standard deviations from the mean of their category or month
+
+    Rows come with the mean and standard deviation of their group and
+    their own z-score, furthest from the mean first. Only amounts above the
+    lowest upper cut-off of any group, or below the highest lower one, are
+    read: from the two ends of the amount index, or of each category's
+    range of the (category, amount) index.
+    """
+    check_group(group)
+    return f'''
+        WITH stats AS (
+            SELECT
+                {group} as grp,
+                total_paise / 100.0 / transaction_count as mean_amount,
+                sqrt(m2_paise / (transaction_count - 1)) / 100.0 as std_dev
+            FROM {group}_stats
+            WHERE transaction_count > 1 AND m2_paise > 0
+        ),
+        bounds AS (
+            SELECT
+                MIN(mean_amount + ?1 * std_dev) as upper,
+                MAX(mean_amount - ?1 * std_dev) as lower
+            FROM stats
+        )
+        SELECT
+            e.date, e.category, e.description, e.amount, stats.mean_amount, stats.std_dev,
+            (e.amount - stats.mean_amount) / stats.std_dev as z_score
+        FROM expenses e
+        JOIN stats ON stats.grp = {GROUPS[group].format(row='e')}
+        WHERE (e.amount > (SELECT upper FROM bounds) OR e.amount < (SELECT lower FROM bounds))
+          AND abs(e.amount - stats.mean_amount) > ?1 * stats.std_dev
+        ORDER BY abs(z_score) DESC, e.id DESC
+        LIMIT ?2
+    ''', (z_score, -1 if limit is None else limit)
+
+class TopPerGroup:
+    """The largest expenses of every group, picked from rows that come largest first
+
+    A group whose rows are all in is complete even if it has fewer than
+    limit of them. Rows of a group the rollup tables don't know are
+    ignored.
+    """
+
+    def __init__(self, conn, group='month', limit=10):
+        check_group(group, TOP_GROUPS)
+        counts, self.group_of = TOP_GROUPS[group]
+        self.wanted = {key: min(limit, count) for key, count in conn.execute(counts) if count > 0}
+        self.rows = {key: [] for key in self.wanted}
+        self.remaining = sum(self.wanted.values())
+
+    def add(self, row):
+        """Keep row if its group still needs rows, returning whether every group is complete"""
+        key = self.group_of(row)
+        rows = self.rows.get(key)
+        if rows is not None and len(rows) < self.wanted[key]:
+            rows.append(row)
+            self.remaining -= 1
+        return not self.remaining
+
+    def results(self):
+        """(group, rank, date, category, description, amount) rows, by group and then rank"""
+        return [(key, rank, *row) for key in sorted(self.rows)
+                for rank, row in enumerate(self.rows[key], 1)]
+
+def top_per_group(conn, group='month', limit=10):
+    """(group, rank, date, category, description, amount) of the limit largest expenses of every group
+
+    group is a name in TOP_GROUPS. Equal amounts rank the later expense
+    first, as biggest_expenses() does.
+    """
+    top = TopPerGroup(conn, group, limit)
+    if top.remaining:
+        for row in conn.execute(largest_first()):
+            if top.add(row):
+                break
+    return top.results()
+
+def largest_first():
+    """Every expense, largest first, read down the amount index"""
+    return '''
+        SELECT date, category, description, amount
+        FROM expenses
+        ORDER BY amount DESC
+    '''
+
+def run_reports(conn, names, threshold=100.0, limit=10, group='category', z_score=2.0):
+    """Compute several CLI reports on one connection, returning {name: rows}
+
+    names is any subset of REPORTS. All reports read the same snapshot:
+    by_category and monthly come from the rollup tables, amount_stats
+    from the statistics tables, and biggest, over_threshold and
+    top_per_group share a single walk down the amount index, which stops
+    as soon as it has the largest limit rows, has passed the threshold
+    and has filled every group. group is the one of amount_stats,
+    outliers and top_per_group, and z_score the one of outliers. The rows
+    are the ones the individual queries above return.
+    """
+    unknown = [name for name in names if name not in REPORTS]
+    if unknown:
+        raise ValueError(f"unknown report '{unknown[0]}', expected one of {', '.join(REPORTS)}")
+
+    results = {}
+    # Carry on an implicit transaction the caller already has open
+    opened = not conn.in_transaction
+    if opened:
+        conn.execute('BEGIN')
+    try:
+        if 'by_category' in names:
+            results['by_category'] = conn.execute(*category_totals()).fetchall()
+        if 'monthly' in names:
+            results['monthly'] = conn.execute(*monthly_totals()).fetchall()
+        if 'amount_stats' in names:
+            results['amount_stats'] = conn.execute(*amount_stats(group)).fetchall()
+        if 'outliers' in names:
+            results['outliers'] = conn.execute(*outliers(group, z_score)).fetchall()
+
+        top_count = limit if 'biggest' in names else 0
+        over_threshold = 'over_threshold' in names
+        top = TopPerGroup(conn, group, limit) if 'top_per_group' in names else None
+        grouped = top is not None and top.remaining > 0
+        if top_count or over_threshold or grouped:
+            biggest = []
+            above = []
+            for row in conn.execute(largest_first()):
+                if len(biggest) < top_count:
+                    biggest.append(row)
+                if grouped:
+                    grouped = not top.add(row)
+                if over_threshold and row[3] > threshold:
+                    above.append(row)
+                elif len(biggest) >= top_count and not grouped:
+                    break
+            if top_count:
+                results['biggest'] = biggest
+            if over_threshold:
+                results['over_threshold'] = above
+        if top is not None:
+            results['top_per_group'] = top.results()
+    finally:
+        if opened:
+            conn.execute('COMMIT')
+
+    return {name: results[name] for name in names}
+
+def category_spending(month=None):
+    """Total per category, optionally for one YYYY-MM month"""
+    if month:
+        month_bounds(month)  # raises ValueError for anything but YYYY-MM
+        return '''
+            SELECT category, total_paise / 100.0 as total
+            FROM month_category_rollup
+            WHERE month = ?
+            ORDER BY total DESC
+        ''', (month,)
+    return '''
+        SELECT category, total_paise / 100.0 as total
+        FROM category_rollup
+        ORDER BY total DESC
+    ''', ()
+
+def top_expenses(limit=10, month=None):
+    """The largest expenses, optionally within one YYYY-MM month"""
+    if month:
+        return '''
+            SELECT date, category, description, amount
+            FROM expenses
+            WHERE date >= ? AND date < ?
+            ORDER BY amount DESC
+            LIMIT ?
+        ''', month_bounds(month) + (limit,)
+    return biggest_expenses(limit)
+
+# First day of the period a date falls in, for daily_totals()
+PERIODS = {
+    'day': 'date',
+    'week': "date(date, '-6 days', 'weekday 1')",  # the Monday starting the week
+    'month': "substr(date, 1, 7) || '-01'",
+}
+
+# Days of the daily rollup that are real YYYY-MM-DD dates. date() rejects
+# 01/02/2024 and, with a modifier, normalizes 2024-02-30 to 2024-03-01;
+# imports no longer accept such dates, but older databases may hold them
+VALID_DAY = "date(date, '+0 days') IS date"
+
+def daily_totals(date_from=None, date_to=None, period='day'):
+    """Total per day, week or month, optionally between two dates (inclusive)
+
+    Weeks and months are labelled with their first day. Days that are
+    not valid dates are left out.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"unknown period '{period}', expected one of {', '.join(PERIODS)}")
+    where = f'WHERE {VALID_DAY}'
+    params = ()
+    if date_from and date_to:
+        where += ' AND date >= ? AND date <= ?'
+        params = (date_from, date_to)
+    if period == 'day':
+        return f'''
+            SELECT date, total_paise / 100.0 as total
+            FROM daily_rollup
+            {where}
+            ORDER BY date
+        ''', params
+    return f'''
+        SELECT {PERIODS[period]} as period_start, SUM(total_paise) / 100.0 as total
+        FROM daily_rollup
+        {where}
+        GROUP BY period_start
+        ORDER BY period_start
+    ''', params
+
+def date_span(date_from=None, date_to=None):
+    """First and last day with expenses, optionally between two dates (inclusive)"""
+    # Separate MIN and MAX subqueries each walk the primary key from one
+    # end, stopping at the first valid day
+    where = f'WHERE {VALID_DAY}' + (' AND date >= ?1 AND date <= ?2' if date_from and date_to else '')
+    return f'''
+        SELECT
+            (SELECT MIN(date) FROM daily_rollup {where}),
+            (SELECT MAX(date) FROM daily_rollup {where})
+    ''', (date_from, date_to) if date_from and date_to else ()
+
+def threshold_expenses(threshold=None, date_from=None, date_to=None, limit=15):
+    """The largest expenses, optionally above a threshold and between two dates"""
+    conditions = []
+    params = []
+    if threshold:
+        conditions.append('amount > ?')
+        params.append(threshold)
+    if date_from and date_to:
+        conditions.append('date >= ? AND date <= ?')
+        params.extend([date_from, date_to])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'''
+        SELECT date, category, description, amount
+        FROM expenses
+        {where}
+        ORDER BY amount DESC
+        LIMIT ?
+    ''', tuple(params) + (limit,)
+
+def builtin_reports():
+    """(name, sql, params) for every built-in report, with typical parameters"""
+    return [
+        ('by_category', *category_totals()),
+        ('monthly', *monthly_totals()),
+        ('biggest', *biggest_expenses()),
+        ('over_threshold', *expenses_over_threshold(5000)),
+        ('gui category spending', *category_spending()),
+        ('gui category spending for a month', *category_spending('2025-01')),
+        ('gui top 10', *top_expenses()),
+        ('gui top 10 for a month', *top_expenses(10, '2025-01')),
+        ('gui daily pattern', *daily_totals()),
+        ('gui daily pattern for a range', *daily_totals('2024-01-01', '2025-12-31')),
+        ('gui weekly pattern', *daily_totals(period='week')),
+        ('gui monthly pattern for a range', *daily_totals('2024-01-01', '2025-12-31', 'month')),
+        ('gui date span', *date_span()),
+        ('gui threshold', *threshold_expenses(5000)),
+        ('gui threshold for a range', *threshold_expenses(5000, '2024-01-01', '2025-12-31')),
+        ('gui top 15 for a range', *threshold_expenses(None, '2024-01-01', '2025-12-31')),
+        ('amount_stats', *amount_stats()),
+        ('amount_stats by month', *amount_stats('month')),
+        ('outliers', *outliers()),
+        ('outliers by month', *outliers('month')),
+        ('top_per_group', largest_first(), ()),
+    ]
+
+def query_plan(conn, sql, params=()):
+    """Return the detail lines of EXPLAIN QUERY PLAN for a query"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+def full_scans(plan, filtered=True):
+    """Plan lines that read a whole table or index
+
+    Scanning a rollup or statistics table is fine: it has one row per
+    category, month and category, month, or day, however many expenses
+    there are. So is scanning a materialized CTE, whose own scans are
+    checked where the plan materializes it. SCAN CONSTANT ROW is the
+    single row of a SELECT without FROM.
+
+    A SCAN ... USING INDEX walks an index from one end. For a query
+    without a WHERE clause (filtered false) that is the ORDER BY amount
+    DESC walk of the biggest expenses, which stops after its first rows.
+    For a filtered query it means the filter couldn't seek the index, and
+    the walk may read every row before it finds the ones it wants.
+    """
+    small = {*rollups.ROLLUPS, *rollups.STATS,
+             *(line.split()[1] for line in plan if line.startswith('MATERIALIZE '))}
+    return [line for line in plan
+            if line.startswith('SCAN ') and line.split()[1] not in small and line != 'SCAN CONSTANT ROW'
+            and (filtered or (' INDEX ' not in line and 'PRIMARY KEY' not in line))]
+
+def is_filtered(sql):
+    """Whether a query has a WHERE clause"""
+    return re.search(r'\bWHERE\b', sql, re.IGNORECASE) is not None
+
+def check_query_plans(conn):
+    """Return (name, plan, full scans) for every built-in report"""
+    results = []
+    for name, sql, params in builtin_reports():
+        plan = query_plan(conn, sql, params)
+        results.append((name, plan, full_scans(plan, is_filtered(sql))))
+    return results
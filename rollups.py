@@ -0,0 +1,394 @@
+"""
+Rollup tables for the Personal Expense Tracker
+
+Per category, per month and category, and per day totals are kept in
+small tables so the summary reports and GUI charts never have to
+aggregate the whole ledger:
+
+  category_rollup        (category)          transaction_count, total_paise
+  month_category_rollup  (month, category)   transaction_count, total_paise
+  daily_rollup           (date)              transaction_count, total_paise
+
+Totals are integer paise, so they add up exactly however rows come and go.
+AFTER INSERT/UPDATE/DELETE triggers on the table that stores the rows
+(expenses, or expense_rows in the compact layout) keep the rollups in step
+with every write. Bulk imports use deferred() instead, which drops the
+triggers for the duration of the transaction and folds the new rows in
+with one grouped INSERT per rollup at the end.
+
+The statistics tables keep, per category and per month, what the mean,
+variance, minimum and maximum of the amounts are computed from:
+
+  category_stats  (category)  transaction_count, total_paise, m2_paise,
+  month_stats     (month)     min_paise, max_paise
+
+m2_paise is the sum of squared deviations from the mean (in paise²), so
+the sample variance is m2_paise / (transaction_count - 1). It is kept with
+Welford's method: the triggers fold each new row in with the pairwise
+update of Chan et al. (STATS_MERGE), which for a single row is Welford's
+step, and take a deleted row back out by solving the same update for the
+remaining rows. Bulk imports compute the count, total, M2, minimum and
+maximum of the new rows of each month and category in one grouped pass
+(M2 by the WelfordM2 aggregate), merge those per month and per category
+in Python and fold them in with STATS_MERGE, so the rows already stored
+are never read again. Removing a row that held the minimum or maximum of
+its category or month looks the new one up among the remaining rows,
+with one seek into the (category, amount) or (month, amount) index of
+schema.MANAGED_INDEXES instead of a scan of the whole table.
+
+change_counter holds a single number that the same triggers (plus one
+on an update of any column), deferred() and rebuild() add one to on
+every write to the stored rows. Unlike the
+file's size and modification time it changes with every commit that
+touches an expense, whatever the journal mode or filesystem timestamp
+resolution, and unlike PRAGMA data_version it persists across
+connections, so other processes can tell whether a copy of the rows
+they made (such as analytics.py's snapshot file) is still current. Its
+rewrites column counts only the updates, deletes and rebuilds, so a copy
+whose rewrites still match only lacks the rows with a new id.
+
+A month is the first seven characters (YYYY-MM) of the date; every
+import path rejects dates that are not YYYY-MM-DD (importer.parse_row),
+so a date such as 01/02/2024 can't make a bogus month. Writes that
+bypass the triggers, such as INSERT OR REPLACE deleting a conflicting row
+or renaming a category in the compact layout's categories table, can leave
+the rollups out of date; rebuild() recomputes them from scratch.
+"""
+
+import contextlib
+
+ROLLUP_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS category_rollup (
+        category TEXT PRIMARY KEY,
+        transaction_count INTEGER NOT NULL,
+        total_paise INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS month_category_rollup (
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        total_paise INTEGER NOT NULL,
+        PRIMARY KEY (month, category)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_rollup (
+        date TEXT PRIMARY KEY,
+        transaction_count INTEGER NOT NULL,
+        total_paise INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+]
+
+STATS_TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS category_stats (
+        category TEXT PRIMARY KEY,
+        transaction_count INTEGER NOT NULL,
+        total_paise INTEGER NOT NULL,
+        m2_paise REAL NOT NULL,
+        min_paise INTEGER NOT NULL,
+        max_paise INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS month_stats (
+        month TEXT PRIMARY KEY,
+        transaction_count INTEGER NOT NULL,
+        total_paise INTEGER NOT NULL,
+        m2_paise REAL NOT NULL,
+        min_paise INTEGER NOT NULL,
+        max_paise INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+]
+
+CHANGE_COUNTER_TABLE = '''
+    CREATE TABLE IF NOT EXISTS change_counter (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        changes INTEGER NOT NULL,
+        rewrites INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+BUMP_CHANGES = 'UPDATE change_counter SET changes = changes + 1'
+BUMP_REWRITES = 'UPDATE change_counter SET changes = changes + 1, rewrites = rewrites + 1'
+
+# Key columns of each rollup table
+ROLLUPS = {
+    'category_rollup': ('category',),
+    'month_category_rollup': ('month', 'category'),
+    'daily_rollup': ('date',),
+}
+
+# How the date, category and amount in paise of a row are read from each
+# storage table, and the columns whose updates move a row between rollups
+ROLLUP_SOURCES = {
+    'expenses': {
+        'date': '{row}.date',
+        'category': '{row}.category',
+        'paise': 'CAST(round({row}.amount * 100) AS INTEGER)',
+        'columns': 'date, category, amount',
+        # The stored category and amount, which the (category, amount) and
+        # (month, amount) indexes of schema.MANAGED_INDEXES are on, and the
+        # paise of an amount (rounding keeps the order, so the paise of the
+        # smallest amount are the smallest paise)
+        'category_key': '{row}.category',
+        'amount': '{row}.amount',
+        'to_paise': 'CAST(round({amount} * 100) AS INTEGER)',
+    },
+    'expense_rows': {
+        'date': "date({row}.day * 86400, 'unixepoch')",
+        'category': '(SELECT name FROM categories WHERE id = {row}.category_id)',
+        'paise': '{row}.amount_paise',
+        'columns': 'day, category_id, amount_paise',
+        'category_key': '{row}.category_id',
+        'amount': '{row}.amount_paise',
+        'to_paise': '{amount}',
+    },
+}
+
+# Key column of each statistics table
+STATS = {
+    'category_stats': 'category',
+    'month_stats': 'month',
+}
+
+TRIGGERS = ('rollup_insert', 'rollup_update', 'rollup_delete', 'change_update')
+
+UPSERT = '''
+    INSERT INTO {rollup} ({keys}, transaction_count, total_paise)
+    {rows}
+    ON CONFLICT ({keys}) DO UPDATE SET
+        transaction_count = transaction_count + excluded.transaction_count,
+        total_paise = total_paise + excluded.total_paise
+'''
+
+# Folds the count, total, M2, minimum and maximum of some rows into a
+# statistics row (Chan et al.'s pairwise update of the mean and M2)
+STATS_MERGE = '''
+    INSERT INTO {stats} ({key}, transaction_count, total_paise, m2_paise, min_paise, max_paise)
+    {rows}
+    ON CONFLICT ({key}) DO UPDATE SET
+        transaction_count = transaction_count + excluded.transaction_count,
+        total_paise = total_paise + excluded.total_paise,
+        m2_paise = m2_paise + excluded.m2_paise
+            + (excluded.total_paise * 1.0 / excluded.transaction_count - total_paise * 1.0 / transaction_count)
+            * (excluded.total_paise * 1.0 / excluded.transaction_count - total_paise * 1.0 / transaction_count)
+            * transaction_count * excluded.transaction_count / (transaction_count + excluded.transaction_count),
+        min_paise = MIN(min_paise, excluded.min_paise),
+        max_paise = MAX(max_paise, excluded.max_paise)
+'''
+
+# Takes one row of {paise} paise back out of a statistics row. M2 is
+# clamped at 0 against rounding; the min and max subqueries only run if
+# the row held one of them.
+STATS_REMOVE = '''
+    UPDATE {stats} SET
+        transaction_count = transaction_count - 1,
+        total_paise = total_paise - {paise},
+        m2_paise = CASE WHEN transaction_count > 1 THEN MAX(0.0, m2_paise
+            - ({paise} - (total_paise - {paise}) * 1.0 / (transaction_count - 1))
+            * ({paise} - (total_paise - {paise}) * 1.0 / (transaction_count - 1))
+            * (transaction_count - 1) / transaction_count) ELSE 0.0 END,
+        min_paise = CASE WHEN {paise} = min_paise
+            THEN IFNULL(({lowest}), min_paise)
+            ELSE min_paise END,
+        max_paise = CASE WHEN {paise} = max_paise
+            THEN IFNULL(({highest}), max_paise)
+            ELSE max_paise END
+    WHERE {key} = {value}
+'''
+
+class WelfordM2:
+    """SQLite aggregate: the sum of squared deviations from the mean, in one pass (Welford)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def step(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def finalize(self):
+        return self.m2
+
+def merge_stats(a, b):
+    """[count, total, M2, min, max] of two sets of rows taken together (see STATS_MERGE)"""
+    count_a, total_a, m2_a, min_a, max_a = a
+    count_b, total_b, m2_b, min_b, max_b = b
+    count = count_a + count_b
+    delta = total_b / count_b - total_a / count_a
+    return [count, total_a + total_b, m2_a + m2_b + delta * delta * count_a * count_b / count,
+            min(min_a, min_b), max(max_a, max_b)]
+
+def _row_expressions(table, row):
+    """Return the key expressions and the paise expression for a row alias"""
+    source = ROLLUP_SOURCES[table]
+    row_date = source['date'].format(row=row)
+    keys = {
+        'date': row_date,
+        'month': f'substr({row_date}, 1, 7)',
+        'category': source['category'].format(row=row),
+    }
+    return keys, source['paise'].format(row=row)
+
+def extreme_paise(table, key, row):
+    """SELECTs of the smallest and largest paise in the category or month of a row, one index seek each"""
+    source = ROLLUP_SOURCES[table]
+    if key == 'category':
+        stored, wanted = (source['category_key'].format(row=alias) for alias in ('r', row))
+    else:
+        stored, wanted = (_row_expressions(table, alias)[0][key] for alias in ('r', row))
+    amount = source['amount'].format(row='r')
+    return tuple(f"SELECT {source['to_paise'].format(amount=f'{aggregate}({amount})')} "
+                 f"FROM {table} r WHERE {stored} = {wanted}"
+                 for aggregate in ('MIN', 'MAX'))
+
+def _change_statements(table, row, sign):
+    """Statements adding (sign 1) or removing (sign -1) one row from every rollup"""
+    keys, paise = _row_expressions(table, row)
+    statements = []
+    for rollup, columns in ROLLUPS.items():
+        values = ', '.join(keys[column] for column in columns)
+        statements.append(UPSERT.format(rollup=rollup, keys=', '.join(columns),
+                                        rows=f'VALUES ({values}, {sign}, {sign} * {paise})'))
+        if sign < 0:
+            match = ' AND '.join(f'{column} = {keys[column]}' for column in columns)
+            statements.append(f'DELETE FROM {rollup} WHERE {match} AND transaction_count = 0')
+    for stats, key in STATS.items():
+        if sign > 0:
+            statements.append(STATS_MERGE.format(stats=stats, key=key,
+                                                 rows=f'VALUES ({keys[key]}, 1, {paise}, 0.0, {paise}, {paise})'))
+        else:
+            lowest, highest = extreme_paise(table, key, row)
+            statements.append(STATS_REMOVE.format(stats=stats, key=key, value=keys[key], paise=paise,
+                                                  lowest=lowest, highest=highest))
+            statements.append(f'DELETE FROM {stats} WHERE {key} = {keys[key]} AND transaction_count = 0')
+    return statements
+
+def create_triggers(conn, table):
+    """Create the triggers that keep the rollups in step with writes to a storage table
+
+    A trigger whose SQL differs, because an older version created it or it
+    is on the other storage table, is replaced.
+    """
+    existing = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+    columns = ROLLUP_SOURCES[table]['columns']
+    triggers = {
+        'rollup_insert': (f'AFTER INSERT ON {table}', _change_statements(table, 'NEW', 1) + [BUMP_CHANGES]),
+        'rollup_update': (f'AFTER UPDATE OF {columns} ON {table}',
+                          _change_statements(table, 'OLD', -1) + _change_statements(table, 'NEW', 1)),
+        'rollup_delete': (f'AFTER DELETE ON {table}', _change_statements(table, 'OLD', -1) + [BUMP_REWRITES]),
+        # Any column, so an edited description counts as a change too
+        'change_update': (f'AFTER UPDATE ON {table}', [BUMP_REWRITES]),
+    }
+    for name, (event, statements) in triggers.items():
+        body = ''.join(f'{statement.strip()};\n' for statement in statements)
+        sql = f'CREATE TRIGGER {name} {event}\nBEGIN\n{body}END'
+        if existing.get(name) != sql:
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+            conn.execute(sql)
+
+def drop_triggers(conn):
+    """Drop the rollup triggers, whichever table they are on"""
+    for name in TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def add_rows(conn, table, after_id=0):
+    """Add the rows of a storage table with an id above after_id to the rollups and statistics"""
+    add_totals(conn, table, after_id)
+    add_stats(conn, table, after_id)
+    conn.execute(BUMP_CHANGES)
+
+def change_count(conn):
+    """The change counter of the stored rows (see change_counter above)"""
+    return conn.execute('SELECT changes FROM change_counter').fetchone()[0]
+
+def change_counts(conn):
+    """(changes, rewrites) of the change counter, read together"""
+    return conn.execute('SELECT changes, rewrites FROM change_counter').fetchone()
+
+def add_totals(conn, table, after_id=0):
+    """Add the rows of a storage table with an id above after_id to the rollup tables"""
+    keys, paise = _row_expressions(table, 'r')
+    for rollup, columns in ROLLUPS.items():
+        select = ', '.join(keys[column] for column in columns)
+        group_by = ', '.join(str(position) for position in range(1, len(columns) + 1))
+        conn.execute(UPSERT.format(rollup=rollup, keys=', '.join(columns), rows=f'''
+            SELECT {select}, COUNT(*), SUM({paise})
+            FROM {table} r
+            WHERE r.id > ?
+            GROUP BY {group_by}
+        '''), (after_id,))
+
+def add_stats(conn, table, after_id=0):
+    """Fold the rows of a storage table with an id above after_id into the statistics tables
+
+    One grouped pass over the new rows finds the figures of each month and
+    category; they are merged per month and per category before going into
+    the tables.
+    """
+    keys, paise = _row_expressions(table, 'r')
+    conn.create_aggregate('welford_m2', 1, WelfordM2)
+    merged = {stats: {} for stats in STATS}
+    for month, category, *figures in conn.execute(f'''
+        SELECT {keys['month']}, {keys['category']},
+               COUNT(*), SUM({paise}), welford_m2({paise}), MIN({paise}), MAX({paise})
+        FROM {table} r
+        WHERE r.id > ?
+        GROUP BY 1, 2
+    ''', (after_id,)).fetchall():
+        for stats, key in (('month_stats', month), ('category_stats', category)):
+            previous = merged[stats].get(key)
+            merged[stats][key] = figures if previous is None else merge_stats(previous, figures)
+    for stats, key in STATS.items():
+        conn.executemany(STATS_MERGE.format(stats=stats, key=key, rows='VALUES (?, ?, ?, ?, ?, ?)'),
+                         [(value, *figures) for value, figures in merged[stats].items()])
+
+def create_rollups(conn, table):
+    """Create any missing rollup and statistics tables and triggers, filling new tables from the stored rows"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for statement in ROLLUP_TABLES + STATS_TABLES + [CHANGE_COUNTER_TABLE]:
+        conn.execute(statement)
+    if 'rewrites' not in [column[1] for column in conn.execute('PRAGMA table_info(change_counter)')]:
+        conn.execute('ALTER TABLE change_counter ADD COLUMN rewrites INTEGER NOT NULL DEFAULT 0')
+    conn.execute('INSERT OR IGNORE INTO change_counter (id, changes) VALUES (1, 0)')
+    create_triggers(conn, table)
+    if 'daily_rollup' not in existing:
+        add_totals(conn, table)
+    if 'month_stats' not in existing:
+        add_stats(conn, table)
+
+def rebuild(conn, table):
+    """Recompute every rollup and statistics table from the stored rows, returning the row count of each"""
+    for rollup in [*ROLLUPS, *STATS]:
+        conn.execute(f'DELETE FROM {rollup}')
+    add_rows(conn, table)
+    conn.execute(BUMP_REWRITES)
+    return {rollup: conn.execute(f'SELECT COUNT(*) FROM {rollup}').fetchone()[0]
+            for rollup in [*ROLLUPS, *STATS]}
+
+@contextlib.contextmanager
+def deferred(conn, table):
+    """Maintain the rollups for rows inserted in the with block in one pass at the end
+
+    Opens a transaction if none is active and leaves it open; the caller
+    commits, or rolls back on error, which also restores the triggers.
+    Only inserts are accounted for: new rows are recognised by ids above
+    the largest id at the start (ids are AUTOINCREMENT).
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    last_id = conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM {table}').fetchone()[0]
+    drop_triggers(conn)
+    yield
+    add_rows(conn, table, last_id)
+    create_triggers(conn, table)
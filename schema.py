@@ -0,0 +1,465 @@
+"""
+Database schema for the Personal Expense Tracker
+
+The expenses table can be stored in one of these layouts:
+
+  classic      UNIQUE(date, category, description, amount), the original
+               layout. The unique index repeats every column of the row.
+  fingerprint  A UNIQUE index on a 64-bit fingerprint of the four columns
+               instead. The fingerprint is a virtual generated column
+               computed by the row_fingerprint() SQL function, so it is
+               only stored in the index, ad-hoc INSERTs don't supply it and
+               UPDATEs recompute it. Two different rows with the same
+               fingerprint would be rejected as duplicates, about a one in
+               37 million chance for a table of a million rows.
+  compact      Rows live in expense_rows with the date as an INTEGER day
+               number (days since 1970-01-01), the amount as INTEGER paise
+               and category/description as ids into the categories and
+               descriptions lookup tables. A view named expenses exposes
+               the usual columns (plus amount_paise for exact totals) and
+               has INSTEAD OF triggers, so existing SELECTs, the queries in
+               queries.sql and ad-hoc INSERT/UPDATE/DELETE keep working.
+               Amounts are stored to the paise, so two amounts that round
+               to the same paise count as duplicates.
+
+Every layout also gets a managed set of secondary indexes for the report
+queries in reports.py (see MANAGED_INDEXES). PRAGMA user_version records
+which SCHEMA_VERSION the database was last brought up to, so the index set
+is only checked when it changes. A load into an empty table builds them
+once at the end instead (deferred_indexes()). The rollup tables of rollups.py are
+created alongside and kept up to date by triggers on the storage table.
+
+Every connection that writes to a fingerprint table needs the SQL
+functions of register_functions(); Database registers them on the
+connections it opens. RowWriter hides the differences between the layouts
+from the importer: it encodes rows for the current layout and writes them
+to the underlying table.
+"""
+
+import contextlib
+import hashlib
+import struct
+from datetime import date, datetime
+
+import rollups
+
+LAYOUTS = ('classic', 'fingerprint', 'compact')
+
+# Day 0 of the compact layout's day numbers
+EPOCH = date(1970, 1, 1)
+
+EXPENSES_TABLES = {
+    'classic': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            UNIQUE(date, category, description, amount)
+        )
+    ''',
+    'fingerprint': '''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            {fingerprint}
+        )
+    ''',
+}
+
+FINGERPRINT_COLUMN = '''fingerprint INTEGER GENERATED ALWAYS AS
+                (row_fingerprint(date, category, description, amount)) VIRTUAL'''
+
+FINGERPRINT_OBJECTS = [
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_fingerprint
+    ON expenses (fingerprint)
+    ''',
+]
+
+EXPENSES_VIEW = '''
+    CREATE {kind} {name} AS
+    SELECT
+        r.id AS id,
+        date(r.day * 86400, 'unixepoch') AS date,
+        c.name AS category,
+        d.text AS description,
+        r.amount_paise / 100.0 AS amount,
+        r.amount_paise AS amount_paise
+    FROM expense_rows r
+    JOIN categories c ON c.id = r.category_id
+    JOIN descriptions d ON d.id = r.description_id
+'''
+
+COMPACT_OBJECTS = [
+    '''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS descriptions (
+        id INTEGER PRIMARY KEY,
+        text TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS expense_rows (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        day INTEGER NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories (id),
+        description_id INTEGER NOT NULL REFERENCES descriptions (id),
+        amount_paise INTEGER NOT NULL,
+        UNIQUE(day, category_id, description_id, amount_paise)
+    )
+    ''',
+    EXPENSES_VIEW.format(kind='VIEW IF NOT EXISTS', name='expenses'),
+    '''
+    CREATE TRIGGER IF NOT EXISTS expenses_insert
+    INSTEAD OF INSERT ON expenses
+    BEGIN
+        INSERT OR IGNORE INTO categories (name) VALUES (NEW.category);
+        INSERT OR IGNORE INTO descriptions (text) VALUES (NEW.description);
+        INSERT INTO expense_rows (day, category_id, description_id, amount_paise)
+        VALUES (
+            CAST(julianday(NEW.date) - 2440587.5 AS INTEGER),
+            (SELECT id FROM categories WHERE name = NEW.category),
+            (SELECT id FROM descriptions WHERE text = NEW.description),
+            CAST(round(NEW.amount * 100) AS INTEGER)
+        );
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS expenses_update
+    INSTEAD OF UPDATE ON expenses
+    BEGIN
+        INSERT OR IGNORE INTO categories (name) VALUES (NEW.category);
+        INSERT OR IGNORE INTO descriptions (text) VALUES (NEW.description);
+        UPDATE expense_rows SET
+            day = CAST(julianday(NEW.date) - 2440587.5 AS INTEGER),
+            category_id = (SELECT id FROM categories WHERE name = NEW.category),
+            description_id = (SELECT id FROM descriptions WHERE text = NEW.description),
+            amount_paise = CAST(round(NEW.amount * 100) AS INTEGER)
+        WHERE id = OLD.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS expenses_delete
+    INSTEAD OF DELETE ON expenses
+    BEGIN
+        DELETE FROM expense_rows WHERE id = OLD.id;
+    END
+    ''',
+]
+
+# Bump SCHEMA_VERSION whenever MANAGED_INDEXES changes so existing databases
+# pick up the new set. Give an index a new name when its definition changes;
+# managed indexes that are no longer listed are dropped.
+SCHEMA_VERSION = 4
+
+# Category, month and day totals come from the rollup tables, so only the
+# row-level reports (date ranges, largest amounts) need indexes. An index
+# on one column is ordered by (column, rowid), which is also the keyset
+# the GUI pages the expenses table by (see paging.py).
+MANAGED_INDEXES = {
+    'expenses': {
+        'idx_expenses_date_id': '(date)',
+        'idx_expenses_amount': '(amount)',
+        # The new minimum or maximum of a category or month when the row
+        # holding it is deleted or updated (rollups.STATS_REMOVE)
+        'idx_expenses_category_amount': '(category, amount)',
+        'idx_expenses_month_amount': '(substr(date, 1, 7), amount)',
+    },
+    'expense_rows': {
+        # Expression indexes matching the expenses view's date and amount
+        # columns, so range filters and ORDER BY amount through the view
+        # can use them
+        'idx_expense_rows_date': "(date(day * 86400, 'unixepoch'))",
+        'idx_expense_rows_amount': '(amount_paise / 100.0)',
+        'idx_expense_rows_category_amount': '(category_id, amount_paise)',
+        'idx_expense_rows_month_amount': "(substr(date(day * 86400, 'unixepoch'), 1, 7), amount_paise)",
+    },
+}
+
+IMPORT_STATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS import_state (
+        source_path TEXT PRIMARY KEY,
+        byte_offset INTEGER NOT NULL,
+        row_count INTEGER NOT NULL,
+        prefix_hash TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+'''
+
+def row_fingerprint(date, category, description, amount):
+    """Return a signed 64-bit fingerprint of an expense row, or None if a column is NULL
+
+    SQLite stores a NaN amount as NULL, so None leaves the row to the
+    NOT NULL constraints, as in the classic layout.
+    """
+    if None in (date, category, description, amount):
+        return None
+    key = '\x1f'.join((str(date), str(category), str(description), repr(float(amount))))
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return struct.unpack('<q', digest)[0]
+
+def register_functions(conn):
+    """Register the SQL functions the fingerprint layout's schema calls"""
+    conn.create_function('row_fingerprint', 4, row_fingerprint, deterministic=True)
+
+def day_number(expense_date):
+    """Convert a YYYY-MM-DD string to the compact layout's day number"""
+    if len(expense_date) != 10:
+        raise ValueError(f"invalid date '{expense_date}', expected YYYY-MM-DD")
+    return (datetime.strptime(expense_date, '%Y-%m-%d').date() - EPOCH).days
+
+def to_paise(amount):
+    """Convert an amount in rupees to integer paise"""
+    return int(round(float(amount) * 100))
+
+def get_layout(conn):
+    """Return the layout of the expenses table, or None if it doesn't exist"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'expenses'").fetchone()
+    if row is None:
+        return None
+    if row[0] == 'view':
+        return 'compact'
+    columns = [column[1] for column in conn.execute('PRAGMA table_xinfo(expenses)')]
+    return 'fingerprint' if 'fingerprint' in columns else 'classic'
+
+def create_schema(conn, layout='classic'):
+    """Create any missing tables, using layout for a new expenses table"""
+    current = get_layout(conn)
+    if current is None and layout != 'compact':
+        conn.execute(EXPENSES_TABLES[layout].format(name='expenses', fingerprint=FINGERPRINT_COLUMN))
+    if current == 'fingerprint':
+        upgrade_fingerprint(conn)
+    if (current or layout) == 'fingerprint':
+        for statement in FINGERPRINT_OBJECTS:
+            conn.execute(statement)
+    if (current or layout) == 'compact':
+        for statement in COMPACT_OBJECTS:
+            conn.execute(statement)
+
+    # Progress of incremental imports, one row per source file
+    conn.execute(IMPORT_STATE_TABLE)
+
+    rollups.create_rollups(conn, storage_table(current or layout))
+    ensure_indexes(conn)
+
+def upgrade_fingerprint(conn):
+    """Replace the stored fingerprint column and dedup trigger of older fingerprint tables
+
+    Those skipped duplicate inserts with a trigger, but an UPDATE kept the
+    old fingerprint, so rows that duplicate an earlier row may exist; they
+    are deleted before the UNIQUE index is built, which updates the rollup
+    tables through their triggers. Returns the number of rows deleted.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'expenses_fingerprint_dedup'").fetchone() is None:
+        return 0
+
+    conn.execute('DROP TRIGGER expenses_fingerprint_dedup')
+    conn.execute('DROP INDEX IF EXISTS idx_expenses_fingerprint')
+    conn.execute('ALTER TABLE expenses DROP COLUMN fingerprint')
+    conn.execute(f'ALTER TABLE expenses ADD COLUMN {FINGERPRINT_COLUMN}')
+    return conn.execute('''
+        DELETE FROM expenses
+        WHERE rowid NOT IN (
+            SELECT MIN(rowid) FROM expenses
+            GROUP BY date, category, description, amount
+        )
+    ''').rowcount
+
+def storage_table(layout):
+    """Name of the table that holds the rows of a layout"""
+    return 'expense_rows' if layout == 'compact' else 'expenses'
+
+def ensure_indexes(conn, force=False):
+    """Bring the managed indexes up to date unless user_version says they already are"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION and not force:
+        return
+
+    table = storage_table(get_layout(conn))
+    wanted = MANAGED_INDEXES[table]
+    existing = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND name LIKE 'idx\\_%' ESCAPE '\\'",
+        (table,))]
+    for name in existing:
+        if name not in wanted and name != 'idx_expenses_fingerprint':
+            conn.execute(f'DROP INDEX {name}')
+    for name, columns in wanted.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} {columns}')
+
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+@contextlib.contextmanager
+def deferred_indexes(conn):
+    """Drop the managed indexes for a load into an empty table and build them at the end
+
+    Opens a transaction if none is active and leaves it open, like
+    rollups.deferred(). Sorting the loaded rows into a new index once is
+    cheaper than keeping it up to date row by row, but rebuilding it over
+    rows already stored is not, so a table with rows keeps its indexes.
+    user_version is reset while they are gone, so a load that never gets
+    to the end leaves them to ensure_indexes() on the next open.
+    """
+    table = storage_table(get_layout(conn))
+    empty = conn.execute(f'SELECT NOT EXISTS (SELECT 1 FROM {table})').fetchone()[0]
+    if empty:
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        for name in MANAGED_INDEXES[table]:
+            conn.execute(f'DROP INDEX IF EXISTS {name}')
+        conn.execute('PRAGMA user_version = 0')
+    yield
+    if empty:
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        ensure_indexes(conn, force=True)
+
+class RowWriter:
+    """Writes (date, category, description, amount) tuples to the expenses storage
+
+    encode() turns a tuple into the values stored by the current layout and
+    raises ValueError for values the layout can't store; insert() writes
+    encoded rows and returns how many were inserted. Duplicates raise
+    IntegrityError unless or_ignore is set.
+    """
+
+    def __init__(self, conn, layout):
+        self.conn = conn
+        self.layout = layout
+        self.cursor = conn.cursor()
+        self._lookup_ids = {}
+
+        if layout == 'compact':
+            self._insert_sql = '''
+                {verb} INTO expense_rows (day, category_id, description_id, amount_paise)
+                VALUES (?, ?, ?, ?)
+            '''
+            for table, column in (('categories', 'name'), ('descriptions', 'text')):
+                self._lookup_ids[table] = dict(
+                    (value, row_id) for row_id, value in conn.execute(f'SELECT id, {column} FROM {table}'))
+        else:
+            self._insert_sql = '''
+                {verb} INTO expenses (date, category, description, amount)
+                VALUES (?, ?, ?, ?)
+            '''
+
+    def _lookup_id(self, table, column, value):
+        """Return the id of a category or description, adding it if it's new"""
+        ids = self._lookup_ids[table]
+        row_id = ids.get(value)
+        if row_id is None:
+            if value is None:
+                raise ValueError(f"missing {column}")
+            self.cursor.execute(f'INSERT INTO {table} ({column}) VALUES (?)', (value,))
+            row_id = ids[value] = self.cursor.lastrowid
+        return row_id
+
+    def encode(self, row):
+        """Convert a row to the values stored by the layout"""
+        if self.layout == 'compact':
+            expense_date, category, description, amount = row
+            day = day_number(expense_date)
+            paise = to_paise(amount)
+            return (day,
+                    self._lookup_id('categories', 'name', category),
+                    self._lookup_id('descriptions', 'text', description),
+                    paise)
+        return row
+
+    def insert(self, encoded_rows, or_ignore=False):
+        """Insert encoded rows and return how many were actually inserted"""
+        verb = 'INSERT OR IGNORE' if or_ignore else 'INSERT'
+        self.cursor.executemany(self._insert_sql.format(verb=verb), encoded_rows)
+        # For executemany, rowcount is the sum of changes() over every row
+        return self.cursor.rowcount
+
+def migrate(conn, layout):
+    """Rebuild the expenses table in another layout, returning (rows kept, rows dropped)
+
+    Row ids are preserved. Rows that are duplicates of an earlier row
+    (possible in tables created without the UNIQUE constraint) are dropped,
+    and so are rows the compact layout can't store (dates that are not
+    YYYY-MM-DD).
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout '{layout}', expected one of {', '.join(LAYOUTS)}")
+
+    current = get_layout(conn)
+    if current == 'compact' and layout == 'compact':
+        row_count = conn.execute('SELECT COUNT(*) FROM expense_rows').fetchone()[0]
+        return row_count, 0
+
+    register_functions(conn)
+
+    conn.execute('BEGIN')
+    try:
+        # The rollups are rebuilt once the rows are in place
+        rollups.drop_triggers(conn)
+
+        # Move the current rows out of the way as expenses_old
+        if current == 'compact':
+            conn.execute('DROP VIEW expenses')
+            conn.execute(EXPENSES_VIEW.format(kind='TEMP VIEW', name='expenses_old'))
+        else:
+            conn.execute('DROP TRIGGER IF EXISTS expenses_fingerprint_dedup')
+            conn.execute('DROP INDEX IF EXISTS idx_expenses_fingerprint')
+            conn.execute('ALTER TABLE expenses RENAME TO expenses_old')
+        source_rows = conn.execute('SELECT COUNT(*) FROM expenses_old').fetchone()[0]
+
+        if layout == 'compact':
+            create_schema(conn, layout)
+            rollups.drop_triggers(conn)
+            conn.execute('INSERT OR IGNORE INTO categories (name) SELECT DISTINCT category FROM expenses_old')
+            conn.execute('INSERT OR IGNORE INTO descriptions (text) SELECT DISTINCT description FROM expenses_old')
+            conn.execute('''
+                INSERT OR IGNORE INTO expense_rows (id, day, category_id, description_id, amount_paise)
+                SELECT o.rowid,
+                       CAST(julianday(o.date) - 2440587.5 AS INTEGER),
+                       c.id, d.id,
+                       CAST(round(o.amount * 100) AS INTEGER)
+                FROM expenses_old o
+                JOIN categories c ON c.name = o.category
+                JOIN descriptions d ON d.text = o.description
+                WHERE length(o.date) = 10
+                ORDER BY o.rowid
+            ''')
+            kept_rows = conn.execute('SELECT COUNT(*) FROM expense_rows').fetchone()[0]
+        else:
+            conn.execute(EXPENSES_TABLES[layout].format(name='expenses', fingerprint=FINGERPRINT_COLUMN))
+            if layout == 'fingerprint':
+                for statement in FINGERPRINT_OBJECTS:
+                    conn.execute(statement)
+            # Keep the first row of each duplicate group, like the UNIQUE index does
+            conn.execute('''
+                INSERT OR IGNORE INTO expenses (id, date, category, description, amount)
+                SELECT rowid, date, category, description, amount
+                FROM expenses_old
+                ORDER BY rowid
+            ''')
+            kept_rows = conn.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]
+
+        if current == 'compact':
+            conn.execute('DROP VIEW expenses_old')
+            for table in ('expense_rows', 'descriptions', 'categories'):
+                conn.execute(f'DROP TABLE {table}')
+        else:
+            conn.execute('DROP TABLE expenses_old')
+        create_schema(conn, layout)
+        ensure_indexes(conn, force=True)
+        rollups.rebuild(conn, storage_table(layout))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+    conn.execute('VACUUM')
+    return kept_rows, source_rows - kept_rows
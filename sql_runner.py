@@ -0,0 +1,127 @@
+"""
+Bounded, streaming execution of ad-hoc SQL for the GUI's SQL Runner
+
+A QueryRun keeps the cursor of one query open and fetches its rows a
+chunk at a time with fetchmany, so a SELECT * over millions of rows
+never has to fit in memory: the SQL Runner stops at a row or time budget
+and fetches more only when asked. start() and fetch() do the database
+work and are meant to run on the GUI's worker thread (see background.py);
+the rest of the object is plain bookkeeping for the main thread.
+
+Rows are fetched until the run's budget is used up: a number of rows and
+a number of seconds spent in SQLite. extend() grants another budget of
+the same kind, which is what the SQL Runner's Fetch More button does.
+
+While more rows are available the query's statement stays open, which
+holds a read lock on the database; running another query or reaching the
+end releases it.
+"""
+
+import sqlite3
+import time
+
+# Rows per fetchmany call, and so per update of the results table
+FETCH_SIZE = 500
+
+DEFAULT_ROW_LIMIT = 1000
+DEFAULT_TIME_LIMIT = 5.0
+
+def query_plan_rows(conn, sql):
+    """(id, parent, detail) rows of EXPLAIN QUERY PLAN, or [] if the SQL can't be explained"""
+    try:
+        return [(row[0], row[1], row[3]) for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    except sqlite3.Error:
+        return []
+
+class QueryRun:
+    """One ad-hoc query: its open cursor, the rows fetched so far and the time spent"""
+
+    def __init__(self, sql):
+        self.sql = sql.strip().rstrip(';')
+        self.cursor = None
+        self.columns = []
+        self.plan = []
+        self.fetched = []
+        self.elapsed = 0.0
+        self.vm_steps = 0
+        self.done = False
+        self.row_budget = 0
+        self.time_budget = 0.0
+
+    def extend(self, row_limit=DEFAULT_ROW_LIMIT, time_limit=DEFAULT_TIME_LIMIT):
+        """Allow row_limit more rows and time_limit more seconds"""
+        self.row_budget = len(self.fetched) + row_limit
+        self.time_budget = self.elapsed + time_limit
+
+    def wants_more(self):
+        """Whether rows remain and the budget allows fetching them"""
+        return (not self.done and len(self.fetched) < self.row_budget
+                and self.elapsed < self.time_budget)
+
+    def next_fetch_size(self):
+        return min(FETCH_SIZE, self.row_budget - len(self.fetched))
+
+    def time_left(self):
+        return max(self.time_budget - self.elapsed, 0.0)
+
+    def start(self, conn, max_rows=FETCH_SIZE):
+        """Explain and execute the query and fetch its first rows (worker thread)"""
+        self.plan = query_plan_rows(conn, self.sql)
+        started = time.perf_counter()
+        try:
+            self.cursor = conn.execute(self.sql)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+        if self.cursor.description is None:
+            # Not a query. Changes made from the SQL Runner are not
+            # committed, as before; don't leave them holding the connection
+            if conn.in_transaction:
+                conn.rollback()
+            self.done = True
+            return []
+
+        self.columns = [description[0] for description in self.cursor.description]
+        return self.fetch(max_rows)
+
+    def fetch(self, max_rows=FETCH_SIZE):
+        """Fetch up to max_rows more rows and return them (worker thread)
+
+        The rows are not added to fetched here; the main thread does that
+        with add(), so it never sees the list change under it.
+        """
+        started = time.perf_counter()
+        try:
+            rows = self.cursor.fetchmany(max_rows)
+        except sqlite3.Error:
+            # An interrupted statement can't be resumed
+            self.close()
+            raise
+        finally:
+            self.elapsed += time.perf_counter() - started
+        if len(rows) < max_rows:
+            self.close()
+        return rows
+
+    def close(self):
+        """Release the query's statement"""
+        if self.cursor is not None:
+            self.cursor.close()
+        self.done = True
+
+    def add(self, rows, vm_steps=0):
+        """Record rows returned by start() or fetch() and the VM steps they took"""
+        self.fetched.extend(rows)
+        self.vm_steps += vm_steps
+
+    def count(self):
+        return len(self.fetched)
+
+    def rows(self, start, stop):
+        return self.fetched[start:stop]
+
+    def summary(self):
+        """One line describing the rows fetched, the time taken and the work done"""
+        more = ", more available" if not self.done else ""
+        return (f"{len(self.fetched):,} rows{more} in {self.elapsed * 1000:,.1f} ms"
+                f" (~{self.vm_steps:,} SQLite VM steps)")
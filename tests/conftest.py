@@ -0,0 +1,21 @@
+import csv
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIELDS = ['date', 'category', 'description', 'amount']
+
+def write_csv(path, rows):
+    """Write (date, category, description, amount) rows to a CSV file with a header"""
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+    return str(path)
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'expenses.db')
@@ -0,0 +1,125 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import analytics
+import rollups
+import main
+from conftest import write_csv
+
+ROWS = [
+    ('2024-01-05', 'Food', 'Lunch', 250.0),
+    ('2024-01-20', 'Food', 'Dinner', 1200.0),
+    ('2024-02-01', 'Bills', 'Internet', 999.0),
+    ('2025-01-03', 'Travel', 'Flight', 15400.0),
+]
+
+# Dates reports.VALID_DAY leaves out, stored with plain INSERTs
+INVALID_DATE_ROWS = [
+    ('2024-10-32', 'Food', 'Snacks', 40.0),
+    ('01/02/2024', 'Bills', 'Water', 300.0),
+]
+
+def test_numpy_engine_matches_sqlite(tmp_path, capsys):
+    db_path = str(tmp_path / 'expenses.db')
+    sqlite_tracker = main.ExpenseTracker(db_path)
+    sqlite_tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    capsys.readouterr()
+    numpy_tracker = main.ExpenseTracker(db_path, engine='numpy')
+
+    names = ['by_category', 'monthly', 'biggest', 'over_threshold']
+    assert numpy_tracker.run_reports(names, 500.0) == sqlite_tracker.run_reports(names, 500.0)
+    assert analytics.snapshot_path(db_path).endswith('.columns')
+    numpy_tracker.close()
+    sqlite_tracker.close()
+
+def test_numpy_engine_skips_invalid_dates(tmp_path, capsys):
+    db_path = str(tmp_path / 'expenses.db')
+    tracker = main.ExpenseTracker(db_path, engine='numpy')
+    with tracker.db.transaction() as conn:
+        conn.executemany('INSERT INTO expenses (date, category, description, amount) VALUES (?, ?, ?, ?)',
+                         ROWS + INVALID_DATE_ROWS)
+
+    snapshot = tracker.columnar_snapshot()
+    assert 'Warning: 2 expenses with an invalid date' in capsys.readouterr().err
+    assert len(snapshot) == len(ROWS)
+    assert [row[0] for row in snapshot.monthly_totals()] == ['2025-01', '2024-02', '2024-01']
+    assert snapshot.category_totals() == [('Travel', 1, 15400.0, 15400.0), ('Food', 2, 1450.0, 725.0),
+                                          ('Bills', 1, 999.0, 999.0)]
+
+    # The skipped rows don't make every refresh reload the snapshot
+    assert snapshot.refresh(tracker.db.connection()) == 0
+    tracker.close()
+
+def test_same_size_write_makes_the_snapshot_stale(tmp_path, capsys):
+    db_path = str(tmp_path / 'expenses.db')
+    tracker = main.ExpenseTracker(db_path)
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    conn = tracker.db.connection()
+    assert analytics.load_snapshot(conn, db_path)[1]
+    assert not analytics.load_snapshot(conn, db_path)[1]
+
+    # Neither the file size nor (within its resolution) the mtime changes
+    size = (tmp_path / 'expenses.db').stat().st_size
+    with tracker.db.transaction() as conn:
+        conn.execute("UPDATE expenses SET description = 'Lunck' WHERE description = 'Lunch'")
+    assert (tmp_path / 'expenses.db').stat().st_size == size
+    snapshot, rebuilt = analytics.load_snapshot(conn, db_path)
+    assert rebuilt
+    assert 'Lunck' in snapshot.descriptions
+    tracker.close()
+
+def test_refresh_reloads_after_an_update(tmp_path, capsys):
+    tracker = main.ExpenseTracker(str(tmp_path / 'expenses.db'), engine='numpy')
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    snapshot = tracker.columnar_snapshot()
+    conn = tracker.db.connection()
+
+    # Same row count and total, so only the change counter tells
+    with tracker.db.transaction() as write_conn:
+        write_conn.execute("UPDATE expenses SET category = 'Meals' WHERE description = 'Lunch'")
+    assert snapshot.refresh(conn) == len(ROWS)
+    assert 'Meals' in [row[0] for row in snapshot.category_totals()]
+
+    # New rows alone are appended
+    with tracker.db.transaction() as write_conn:
+        write_conn.execute("INSERT INTO expenses (date, category, description, amount) "
+                           "VALUES ('2025-02-01', 'Food', 'Snack', 40.0)")
+    assert snapshot.refresh(conn) == 1
+    assert snapshot.refresh(conn) == 0
+    tracker.close()
+
+def test_every_write_path_bumps_the_change_counter(tmp_path, capsys):
+    db_path = str(tmp_path / 'expenses.db')
+    tracker = main.ExpenseTracker(db_path)
+    conn = tracker.db.connection()
+    seen = [rollups.change_count(conn)]
+
+    def bumped():
+        seen.append(rollups.change_count(conn))
+        return seen[-1] > seen[-2]
+
+    tracker.import_csv(write_csv(tmp_path / 'rows.csv', ROWS[:2]))
+    assert bumped()
+    tracker.import_csv(write_csv(tmp_path / 'batch.csv', ROWS[2:]), workers=2)
+    assert bumped()
+    tracker.rebuild_rollups()
+    assert bumped()
+    with tracker.db.transaction() as conn:
+        conn.execute('DELETE FROM expenses WHERE amount < 500')
+    assert bumped()
+    tracker.close()
+
+def test_snapshot_loads_inside_an_open_transaction(tmp_path, capsys):
+    db_path = str(tmp_path / 'expenses.db')
+    tracker = main.ExpenseTracker(db_path)
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    conn = tracker.db.connection()
+    # An earlier write leaves an implicit transaction open
+    conn.execute('CREATE TEMP TABLE scratch (x)')
+    conn.execute('INSERT INTO scratch VALUES (1)')
+    snapshot, rebuilt = analytics.load_snapshot(conn, db_path)
+    assert rebuilt and conn.in_transaction
+    conn.rollback()
+    assert len(snapshot.amounts) == len(ROWS)
+    tracker.close()
@@ -0,0 +1,24 @@
+import downsampling
+import main
+
+def test_daily_series_skips_invalid_days(db_path):
+    tracker = main.ExpenseTracker(db_path)
+    # Dates imports reject, written by hand or by an older importer
+    rows = [('2024-01-05', 'Food', 'Lunch', 250.0), ('2024-10-32', 'Food', 'Dinner', 900.0),
+            ('01/02/2024', 'Food', 'Tea', 20.0), ('2024-02-30', 'Bills', 'Water', 300.0),
+            ('2024-03-01', 'Bills', 'Internet', 999.0)]
+    with tracker.db.transaction() as conn:
+        conn.executemany('INSERT INTO expenses (date, category, description, amount) VALUES (?, ?, ?, ?)', rows)
+
+    conn = tracker.db.connection()
+    assert downsampling.daily_series(conn) == ('day', [('2024-01-05', 250.0), ('2024-03-01', 999.0)])
+    assert downsampling.daily_series(conn, max_points=1) == ('month', [('2024-01-01', 250.0), ('2024-03-01', 999.0)])
+    tracker.close()
+
+def test_lttb_keeps_the_ends_and_the_spike():
+    rows = [(f'2024-01-{day:02d}', 10.0) for day in range(1, 31)]
+    rows[14] = ('2024-01-15', 500.0)
+    kept = downsampling.lttb(rows, 5)
+    assert len(kept) == 5
+    assert kept[0] == rows[0] and kept[-1] == rows[-1]
+    assert ('2024-01-15', 500.0) in kept
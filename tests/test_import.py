@@ -0,0 +1,131 @@
+import re
+
+import pytest
+
+import generate_data
+import importer
+import main
+import schema
+from conftest import write_csv
+
+IMPORT_PATHS = {
+    'rows': {},
+    'batch': {'batch_size': 1000},
+    'one_worker': {'workers': 1},
+    'workers': {'workers': 2},
+}
+
+# Rows every import path must reject
+INVALID_ROWS = [
+    ('2024-10-32', 'Food', 'Lunch', '250.00'),
+    ('01/02/2024', 'Food', 'Lunch', '250.00'),
+    ('2024-1-5', 'Food', 'Lunch', '250.00'),
+    ('2024-W01-1', 'Food', 'Lunch', '250.00'),
+    ('2024-0\u0661-05', 'Food', 'Lunch', '250.00'),
+    ('2024-01-05', 'Food', 'Lunch', 'nan'),
+    ('2024-01-05', 'Food', 'Lunch', 'inf'),
+    ('2024-01-05', 'Food', 'Lunch', 'n/a'),
+    ('2024-01-05', 'Food', 'Lunch'),
+]
+
+VALID_ROWS = [
+    ('2024-01-05', 'Food', 'Lunch', '250.00'),
+    ('2024-01-05', 'Food', 'Lunch', '250.00'),
+    ('2024-02-29', 'Travel', 'Taxi', '480.50'),
+]
+
+def import_counts(db_path, csv_path, capsys, **options):
+    """Import csv_path into a new database, returning (imported, duplicates, stored rows)"""
+    tracker = main.ExpenseTracker(db_path)
+    try:
+        tracker.import_csv(csv_path, **options)
+        rows = sorted(tracker.db.query('SELECT date, category, description, amount FROM expenses'))
+    finally:
+        tracker.close()
+    output = capsys.readouterr().out
+    imported = int(re.search(r'(\d+) new records imported', output).group(1))
+    duplicates = int(re.search(r'(\d+) duplicates skipped', output).group(1))
+    return imported, duplicates, rows
+
+@pytest.mark.parametrize('path', IMPORT_PATHS)
+def test_direct_load_matches_csv_import(tmp_path, capsys, path):
+    tasks = lambda: generate_data.chunk_tasks(20000, 7, 5000, '2025-06-30', 0.01, 0.01)
+    csv_path = str(tmp_path / 'expenses.csv')
+    generate_data.stream_to_csv(tasks(), csv_path)
+    imported, duplicates, invalid = generate_data.stream_to_db(tasks(), str(tmp_path / 'direct.db'))
+    assert invalid > 0
+
+    direct = main.ExpenseTracker(str(tmp_path / 'direct.db'))
+    direct_rows = sorted(direct.db.query('SELECT date, category, description, amount FROM expenses'))
+    direct.close()
+    capsys.readouterr()
+
+    assert import_counts(str(tmp_path / f'{path}.db'), csv_path, capsys, **IMPORT_PATHS[path]) == (
+        imported, duplicates, direct_rows)
+
+def test_generated_rows_hold_the_requested_rates(tmp_path, capsys):
+    tasks = generate_data.chunk_tasks(10000, 7, 5000, '2025-06-30', 0.3, 0.3)
+    imported, duplicates, invalid = generate_data.stream_to_db(tasks, str(tmp_path / 'expenses.db'))
+    # Within about three standard deviations of 3,000
+    assert abs(duplicates - 3000) < 150
+    assert abs(invalid - 3000) < 150
+
+@pytest.mark.parametrize('path', IMPORT_PATHS)
+def test_every_import_path_rejects_the_same_rows(tmp_path, capsys, path):
+    csv_path = write_csv(tmp_path / 'expenses.csv', VALID_ROWS[:1] + INVALID_ROWS + VALID_ROWS[1:])
+    for row in INVALID_ROWS:
+        with pytest.raises((ValueError, KeyError)):
+            importer.parse_row(dict(zip(['date', 'category', 'description', 'amount'], row)))
+
+    imported, duplicates, rows = import_counts(str(tmp_path / 'expenses.db'), csv_path, capsys,
+                                               **IMPORT_PATHS[path])
+    assert (imported, duplicates) == (2, 1)
+    assert rows == [('2024-01-05', 'Food', 'Lunch', 250.0), ('2024-02-29', 'Travel', 'Taxi', 480.5)]
+
+def test_incremental_import_matches_full_import(tmp_path, capsys):
+    rows = VALID_ROWS + INVALID_ROWS + [('2024-03-01', 'Bills', 'Internet', '999.00')]
+    csv_path = write_csv(tmp_path / 'expenses.csv', rows[:5])
+    db_path = str(tmp_path / 'incremental.db')
+
+    # A regular import first, then incremental imports of the rows appended since
+    assert import_counts(db_path, csv_path, capsys)[:2] == (2, 1)
+    write_csv(csv_path, rows)
+    assert import_counts(db_path, csv_path, capsys, incremental=True)[:2] == (1, 3)
+    write_csv(csv_path, rows + [('2024-03-02', 'Food', 'Coffee', '90.00')])
+    imported, duplicates, incremental_rows = import_counts(db_path, csv_path, capsys, incremental=True)
+    assert (imported, duplicates) == (1, 0)
+
+    assert incremental_rows == import_counts(str(tmp_path / 'full.db'), csv_path, capsys)[2]
+
+def managed_indexes(tracker):
+    """(user_version, names of the managed indexes present)"""
+    conn = tracker.db.connection()
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    return conn.execute('PRAGMA user_version').fetchone()[0], names & set(schema.MANAGED_INDEXES['expenses'])
+
+@pytest.mark.parametrize('path', IMPORT_PATHS)
+def test_imports_leave_the_managed_indexes_in_place(db_path, tmp_path, capsys, path):
+    tracker = main.ExpenseTracker(db_path)
+    wanted = (schema.SCHEMA_VERSION, set(schema.MANAGED_INDEXES['expenses']))
+    # Into an empty table, which builds them at the end, then appended to
+    for name in ('first', 'second'):
+        rows = [(f'2024-01-{day:02d}', name, 'Lunch', f'{day}.00') for day in range(1, 29)]
+        tracker.import_csv(write_csv(tmp_path / f'{name}.csv', rows), **IMPORT_PATHS[path])
+        assert managed_indexes(tracker) == wanted
+    tracker.close()
+
+def test_interrupted_load_gets_its_indexes_back_on_open(db_path, capsys):
+    tracker = main.ExpenseTracker(db_path)
+    conn = tracker.db.connection()
+    with pytest.raises(KeyboardInterrupt):
+        def batches():
+            yield [('2024-01-05', 'Food', 'Lunch', 250.0)], []
+            raise KeyboardInterrupt
+        tracker.import_batches(batches())
+    assert managed_indexes(tracker)[1] == set()
+    tracker.close()
+
+    tracker = main.ExpenseTracker(db_path)
+    assert managed_indexes(tracker) == (schema.SCHEMA_VERSION, set(schema.MANAGED_INDEXES['expenses']))
+    assert tracker.db.query('SELECT COUNT(*) FROM expenses') == [(1,)]
+    tracker.close()
@@ -0,0 +1,32 @@
+import pytest
+
+import main
+import paging
+import schema
+from conftest import write_csv
+
+# Repeated dates, categories and amounts, so ties are broken by id
+ROWS = [(f'2024-01-{day % 5 + 1:02d}', ('Food', 'Bills', 'Travel')[day % 3], f'Item {day % 7}', float(day % 4 * 100))
+        for day in range(47)]
+
+@pytest.fixture(params=schema.LAYOUTS)
+def tracker(request, tmp_path, capsys):
+    tracker = main.ExpenseTracker(str(tmp_path / 'expenses.db'))
+    tracker.migrate(request.param)
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    capsys.readouterr()
+    yield tracker
+    tracker.close()
+
+@pytest.mark.parametrize('descending', [True, False])
+@pytest.mark.parametrize('column', paging.SORT_COLUMNS)
+def test_jumps_match_paging_from_the_top(tracker, column, descending):
+    index = paging.SORT_COLUMNS.index(column) + 1
+    expected = sorted(tracker.db.query('SELECT id, date, category, description, amount FROM expenses'),
+                      key=lambda row: (row[index], row[0]), reverse=descending)
+
+    pager = paging.ExpensePager(tracker.db, column, descending, block_size=4, cache_blocks=2)
+    for start in (30, 9, 41, 22, 0, 45):
+        assert pager.rows(start, start + 6) == expected[start:start + 6]
+    # The blocks walked past on the way were recorded
+    assert set(range(11)) <= set(pager._start_keys)
@@ -0,0 +1,77 @@
+import json
+import re
+
+import pytest
+
+import main
+import reports
+import schema
+from conftest import write_csv
+
+ROWS = [
+    ('2024-01-05', 'Food', 'Lunch', 250.0),
+    ('2024-01-20', 'Food', 'Dinner', 1200.0),
+    ('2024-02-01', 'Bills', 'Internet', 999.0),
+    ('2025-01-03', 'Travel', 'Flight', 15400.0),
+    ('2025-01-15', 'Travel', 'Taxi', 480.5),
+]
+
+@pytest.fixture(params=schema.LAYOUTS)
+def tracker(request, tmp_path, capsys):
+    tracker = main.ExpenseTracker(str(tmp_path / 'expenses.db'))
+    tracker.migrate(request.param)
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    capsys.readouterr()
+    yield tracker
+    tracker.close()
+
+def test_builtin_reports_use_indexes(tracker):
+    for name, plan, scans in tracker.check_query_plans():
+        assert not scans, f"{name}: {'; '.join(plan)}"
+
+def test_full_index_walk_of_a_filtered_query_is_flagged(tracker):
+    # No index covers description, so this walks the whole amount index
+    sql = "SELECT date, amount FROM expenses WHERE description = 'Taxi' ORDER BY amount DESC LIMIT 10"
+    plan = reports.query_plan(tracker.db.connection(), sql)
+    assert any(' INDEX ' in line for line in plan)
+    assert reports.full_scans(plan, reports.is_filtered(sql))
+
+def test_ordered_walk_of_an_unfiltered_query_is_not_flagged(tracker):
+    sql, params = reports.biggest_expenses()
+    plan = reports.query_plan(tracker.db.connection(), sql, params)
+    assert any(' INDEX ' in line for line in plan)
+    assert not reports.full_scans(plan, reports.is_filtered(sql))
+    assert reports.full_scans(plan)
+
+@pytest.mark.parametrize('options', [{}, {'batch_size': 100}, {'workers': 2}])
+def test_month_buckets_are_iso_months(tmp_path, capsys, options):
+    tracker = main.ExpenseTracker(str(tmp_path / 'expenses.db'))
+    rows = ROWS + [('01/02/2024', 'Food', 'Snacks', 40.0), ('2024-1-05', 'Food', 'Tea', 20.0),
+                   ('2024-02-30', 'Bills', 'Water', 300.0)]
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', rows), **options)
+    capsys.readouterr()
+
+    months = [row[0] for row in tracker.get_monthly_totals()]
+    assert months and all(re.fullmatch(r'\d{4}-\d{2}', month) for month in months)
+    assert sorted(set(months)) == ['2024-01', '2024-02', '2025-01']
+    tracker.close()
+
+def test_report_all_prints_the_summary_reports(tmp_path, capsys, monkeypatch):
+    db_path = str(tmp_path / 'expenses.db')
+    csv_path = write_csv(tmp_path / 'expenses.csv', ROWS)
+    monkeypatch.setattr('sys.argv', ['main.py', '--db', db_path, '--import_csv', csv_path,
+                                     '--report', 'all', '--format', 'jsonl'])
+    main.main()
+    printed = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+    assert {row['report'] for row in printed} == set(reports.SUMMARY_REPORTS)
+
+def test_reports_carry_on_an_open_transaction(tracker):
+    conn = tracker.db.connection()
+    # An earlier write leaves an implicit transaction open
+    conn.execute('CREATE TEMP TABLE scratch (x)')
+    conn.execute('INSERT INTO scratch VALUES (1)')
+    assert conn.in_transaction
+    results = reports.run_reports(conn, ['by_category', 'biggest'], limit=2)
+    assert conn.in_transaction
+    conn.rollback()
+    assert [row[3] for row in results['biggest']] == [15400.0, 1200.0]
@@ -0,0 +1,68 @@
+import pytest
+
+import main
+import reports
+import rollups
+import schema
+from conftest import write_csv
+
+ROWS = [
+    ('2024-01-05', 'Food', 'Lunch', 250.0),
+    ('2024-01-20', 'Food', 'Dinner', 1200.0),
+    ('2024-01-22', 'Food', 'Snacks', 40.0),
+    ('2024-02-01', 'Bills', 'Internet', 999.0),
+    ('2024-02-09', 'Bills', 'Water', 300.0),
+]
+
+@pytest.fixture(params=schema.LAYOUTS)
+def tracker(request, tmp_path, capsys):
+    tracker = main.ExpenseTracker(str(tmp_path / 'expenses.db'))
+    tracker.migrate(request.param)
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    capsys.readouterr()
+    yield tracker
+    tracker.close()
+
+def stats(conn):
+    # M2 to the nearest paise², as the one-row and grouped updates round differently
+    return [conn.execute(f'SELECT {key}, transaction_count, total_paise, round(m2_paise), min_paise, max_paise '
+                         f'FROM {table} ORDER BY 1').fetchall()
+            for table, key in rollups.STATS.items()]
+
+def test_deleting_the_extremes_keeps_the_statistics(tracker):
+    with tracker.db.transaction() as conn:
+        # The minimum of Food and January, then the maximum of February
+        conn.execute("DELETE FROM expenses WHERE description IN ('Snacks', 'Internet')")
+        conn.execute("UPDATE expenses SET amount = 2000.0 WHERE description = 'Lunch'")
+    kept = stats(conn)
+    tracker.rebuild_rollups()
+    assert kept == stats(tracker.db.connection())
+    assert kept[0] == [('Bills', 1, 30000, 0.0, 30000, 30000),
+                       ('Food', 2, 320000, 3_200_000_000.0, 120000, 200000)]
+
+def test_extreme_lookups_seek_an_index(tracker):
+    conn = tracker.db.connection()
+    table = schema.storage_table(tracker.layout)
+    for key in rollups.STATS.values():
+        for lookup in rollups.extreme_paise(table, key, 'x'):
+            plan = reports.query_plan(conn, f'SELECT ({lookup}) FROM {table} x WHERE x.id = 1')
+            assert not [line for line in plan if line.startswith('SCAN ')], plan
+            assert any(line.startswith('SEARCH r USING ') and 'INDEX' in line for line in plan), plan
+
+def test_outdated_triggers_are_replaced_on_open(tmp_path, capsys):
+    db_path = str(tmp_path / 'expenses.db')
+    tracker = main.ExpenseTracker(db_path)
+    tracker.import_csv(write_csv(tmp_path / 'expenses.csv', ROWS))
+    with tracker.db.transaction() as conn:
+        # A trigger left by an older version, which doesn't maintain the statistics
+        conn.execute('DROP TRIGGER rollup_delete')
+        conn.execute('CREATE TRIGGER rollup_delete AFTER DELETE ON expenses BEGIN SELECT 1; END')
+    tracker.close()
+
+    tracker = main.ExpenseTracker(db_path)
+    with tracker.db.transaction() as conn:
+        conn.execute("DELETE FROM expenses WHERE description = 'Snacks'")
+    kept = stats(conn)
+    tracker.rebuild_rollups()
+    assert kept == stats(tracker.db.connection())
+    tracker.close()
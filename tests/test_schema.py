@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+import main
+import schema
+from conftest import write_csv
+
+ROWS = [
+    ('2024-01-05', 'Food', 'Lunch', 250.0),
+    ('2024-01-06', 'Travel', 'Taxi', 480.5),
+    ('2024-02-01', 'Bills', 'Internet', 999.0),
+]
+
+def import_quietly(tracker, csv_path, capsys, **options):
+    tracker.import_csv(csv_path, **options)
+    return capsys.readouterr().out
+
+def stored_rows(tracker):
+    return sorted(tracker.db.query('SELECT date, category, description, amount FROM expenses'))
+
+@pytest.mark.parametrize('layout', schema.LAYOUTS)
+def test_reimport_after_update_is_a_duplicate(tmp_path, db_path, capsys, layout):
+    tracker = main.ExpenseTracker(db_path)
+    tracker.migrate(layout)
+    csv_path = write_csv(tmp_path / 'expenses.csv', ROWS)
+    import_quietly(tracker, csv_path, capsys)
+
+    with tracker.db.transaction() as conn:
+        conn.execute("UPDATE expenses SET amount = 300.0, description = 'Dinner' WHERE description = 'Lunch'")
+    updated = write_csv(tmp_path / 'updated.csv', [('2024-01-05', 'Food', 'Dinner', 300.0)])
+
+    output = import_quietly(tracker, updated, capsys)
+    assert '0 new records imported' in output
+    assert '1 duplicates skipped' in output
+    # The original row is no longer stored, so it imports again
+    output = import_quietly(tracker, csv_path, capsys)
+    assert '1 new records imported' in output
+    assert len(stored_rows(tracker)) == 4
+
+def test_fingerprint_adhoc_insert_and_update(db_path, capsys):
+    tracker = main.ExpenseTracker(db_path)
+    tracker.migrate('fingerprint')
+    capsys.readouterr()
+    insert = 'INSERT INTO expenses (date, category, description, amount) VALUES (?, ?, ?, ?)'
+    with tracker.db.transaction() as conn:
+        conn.executemany(insert, ROWS)
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute(insert, ROWS[0])
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("UPDATE expenses SET date = '2024-01-05', category = 'Food', "
+                         "description = 'Lunch', amount = 250.0 WHERE description = 'Taxi'")
+    assert stored_rows(tracker) == sorted(ROWS)
+
+def test_fingerprint_upgrade_drops_duplicates_left_by_updates(db_path):
+    # A fingerprint table as created before the UNIQUE index: a stored
+    # fingerprint column and a trigger skipping duplicate inserts
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE expenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            fingerprint INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_expenses_fingerprint ON expenses (fingerprint)')
+    conn.execute('''
+        CREATE TRIGGER expenses_fingerprint_dedup BEFORE INSERT ON expenses
+        WHEN EXISTS (SELECT 1 FROM expenses WHERE fingerprint = NEW.fingerprint)
+        BEGIN SELECT RAISE(IGNORE); END
+    ''')
+    conn.executemany('INSERT INTO expenses (date, category, description, amount, fingerprint) VALUES (?, ?, ?, ?, ?)',
+                     [row + (schema.row_fingerprint(*row),) for row in ROWS])
+    conn.execute("UPDATE expenses SET date = '2024-01-05', category = 'Food', description = 'Lunch', "
+                 "amount = 250.0 WHERE description = 'Taxi'")
+    conn.commit()
+    conn.close()
+
+    tracker = main.ExpenseTracker(db_path)
+    assert tracker.layout == 'fingerprint'
+    assert stored_rows(tracker) == sorted([ROWS[0], ROWS[2]])
+    assert tracker.db.query('SELECT category, transaction_count FROM category_rollup ORDER BY category') == [
+        ('Bills', 1), ('Food', 1)]